@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+from json import dumps, loads
+from pathlib import Path
+from typing import Iterator, List, Set, Tuple
+from uuid import uuid4
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import or_
+
+from src.config import (
+    DATA_ROOT,
+    EMBEDDING_CACHE_ENABLED,
+    INGESTION_EMBED_CONCURRENCY,
+    INGESTION_JOB_LEASE,
+    PARSER_WORKERS,
+    SPLITTER_WORKERS,
+    SUPPORT_UPLOAD_FILE,
+    SUPPORT_URL_TYPE,
+)
+from src.langchain_aris.bm25 import get_complete_bm25_index, save_bm25_index
+from src.langchain_aris.embedding import init_embedding
+from src.langchain_aris.embedding_cache import CachedEmbeddings
+from src.langchain_aris.file_loader import load_upload_files
+from src.langchain_aris.ingestion import aingest_documents, iter_prefetched
+from src.langchain_aris.manifest import ManifestDiff, apply_manifest_patch
+from src.langchain_aris.retriever import bump_vector_db_version
+from src.langchain_aris.text_splitter import iter_split_documents
+from src.langchain_aris.url_loader import iter_upload_urls
+from src.langchain_aris.vector_store import Neo4jBulkWriter, delete_chunks, init_vector_store
+from src.logger import logger
+from src.middleware.mysql import session
+from src.middleware.mysql.models import EmbeddingSchema, VectorDbSchema
+from src.middleware.redis import r
+from src.worker.queue import lock_key
+
+
+class Checkpoint:
+    """Append-only log of the inputs whose chunks are written and whose manifest is applied."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.done: Set[str] = set()
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                self.done = {loads(line)["key"] for line in f if line.strip()}
+
+    def add(self, keys: List[str]) -> None:
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.writelines(dumps({"key": key}, ensure_ascii=False) + "\n" for key in keys)
+        self.done.update(keys)
+
+
+def _file_key(path: Path) -> str:
+    # a file edited after it was ingested is picked up again on resume
+    stat = path.stat()
+    return f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _init_embedding(vector_db_id: int, chunk_size: int) -> Tuple[Embeddings, int]:
+    with session() as conn:
+        query = (
+            conn.query(
+                EmbeddingSchema.embedding_id,
+                EmbeddingSchema.embedding_type,
+                EmbeddingSchema.embedding_name,
+                EmbeddingSchema.base_url,
+                EmbeddingSchema.api_key,
+                EmbeddingSchema.chunk_size,
+            )
+            .join(VectorDbSchema, VectorDbSchema.embedding_id == EmbeddingSchema.embedding_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+            .filter(or_(EmbeddingSchema.delete_at.is_(None), datetime.now() < EmbeddingSchema.delete_at))
+        )
+        result = query.first()
+    if not result:
+        sys.exit(f"Vector DB id `{vector_db_id}` or its embedding does not exist")
+
+    embedding_id, embedding_type, embedding_name, base_url, api_key, _chunk_size = result
+    embedding = init_embedding(embedding_type, embedding_name, api_key, base_url, _chunk_size)
+    if EMBEDDING_CACHE_ENABLED:
+        embedding = CachedEmbeddings(embedding, embedding_id)
+    return embedding, min(chunk_size, _chunk_size)
+
+
+def _iter_file_groups(root: Path, checkpoint: Checkpoint, group_size: int) -> Iterator[Tuple[List[str], List[Path]]]:
+    paths = sorted(path for path in root.rglob("*") if path.is_file() and path.suffix[1:] in SUPPORT_UPLOAD_FILE)
+    pending = [(key, path) for path in paths if (key := _file_key(path)) not in checkpoint.done]
+    logger.info(f"Ingest {len(pending)} files under {root}, {len(paths) - len(pending)} done by an earlier run")
+    for i in range(0, len(pending), group_size):
+        group = pending[i : i + group_size]
+        yield [key for key, _ in group], [path for _, path in group]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest a directory tree or a url list into a vector DB without going through the API.")
+    parser.add_argument("vector_db_id", type=int)
+    parser.add_argument("inputs", nargs="+", help="directories of files, or urls with --url-type")
+    parser.add_argument("--url-type", choices=SUPPORT_URL_TYPE, help="treat the inputs as urls of this type")
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=64)
+    parser.add_argument("--group-size", type=int, default=64, help="files or urls per checkpoint")
+    parser.add_argument("--parser-workers", type=int, default=PARSER_WORKERS)
+    parser.add_argument("--splitter-workers", type=int, default=SPLITTER_WORKERS)
+    parser.add_argument("--embed-concurrency", type=int, default=INGESTION_EMBED_CONCURRENCY)
+    parser.add_argument("--checkpoint", type=Path, help="resume log, defaults to a file per vector DB under DATA_ROOT")
+    args = parser.parse_args()
+
+    vector_db_id = args.vector_db_id
+    embedding, chunk_size = _init_embedding(vector_db_id, args.chunk_size)
+    checkpoint = Checkpoint(args.checkpoint or Path(DATA_ROOT) / "ingest" / f"{vector_db_id}.jsonl")
+
+    if args.url_type:
+        urls = [url for url in dict.fromkeys(args.inputs) if url not in checkpoint.done]
+        groups = ((urls[i : i + args.group_size], urls[i : i + args.group_size]) for i in range(0, len(urls), args.group_size))
+    else:
+        groups = (group for root in args.inputs for group in _iter_file_groups(Path(root), checkpoint, args.group_size))
+
+    lock_value = f"ingest:{uuid4().hex}"
+    if not r.set(lock_key(vector_db_id), lock_value, nx=True, ex=INGESTION_JOB_LEASE):
+        sys.exit(f"Vector DB id `{vector_db_id}` is being written by an ingestion job")
+
+    total_written, total_deleted = 0, 0
+
+    def _iter_loaded() -> Iterator[Tuple[List[str], Iterator[Document]]]:
+        # the next group is parsed while the current one is embedded and written, url loaders fetch concurrently on their own
+        for keys, items in groups:
+            if args.url_type:
+                yield keys, iter_upload_urls(items, args.url_type, diff)
+                continue
+            documents, failed = load_upload_files(items, workers=args.parser_workers)
+            for path in failed:
+                logger.error(f"Skip file: {path} which failed to parse")
+            # failed files are not checkpointed, so they are tried again by the next run
+            keys = [key for key, path in zip(keys, items) if path not in failed]
+            for doc in documents:
+                doc.metadata["source"] = str(Path(doc.metadata["source"]).resolve())
+            yield keys, diff.filter(documents)
+
+    def _on_written(written: int) -> None:
+        r.expire(lock_key(vector_db_id), INGESTION_JOB_LEASE)
+
+    try:
+        vector_db = init_vector_store(vector_db_id, embedding)
+        keyword_index = get_complete_bm25_index(vector_db_id, vector_db)
+        diff = ManifestDiff(vector_db_id)
+
+        for keys, documents in iter_prefetched(_iter_loaded(), maxsize=1):
+            chunks = diff.assign_chunk_ids(iter_split_documents(documents, chunk_size, args.chunk_overlap, args.splitter_workers))
+            written = asyncio.run(
+                aingest_documents(
+                    vector_db,
+                    keyword_index,
+                    chunks,
+                    concurrency=args.embed_concurrency,
+                    on_written=_on_written,
+                    bulk_writer=Neo4jBulkWriter(vector_db),
+                )
+            )
+
+            # a group is committed once its chunks are written, the chunks it replaced deleted and its manifest applied
+            patch = diff.checkpoint()
+            if patch["stale_chunk_ids"]:
+                delete_chunks(vector_db, patch["stale_chunk_ids"])
+                keyword_index.delete_documents(set(patch["stale_chunk_ids"]))
+            apply_manifest_patch(vector_db_id, patch)
+            save_bm25_index(vector_db_id)
+
+            # chunks of a group interrupted before its checkpoint are written again and merged by id, so db_size
+            # follows the manifest, which is applied once per group
+            created = sum(len(patch["entries"][source]["chunk_ids"]) for source in patch["changed"])
+            with session() as conn:
+                query = conn.query(VectorDbSchema).filter(VectorDbSchema.vector_db_id == vector_db_id)
+                query.update({VectorDbSchema.db_size: VectorDbSchema.db_size + created - len(patch["stale_chunk_ids"])})
+                conn.commit()
+
+            checkpoint.add(keys)
+            total_written += written
+            total_deleted += len(patch["stale_chunk_ids"])
+            print(f"vector_db_id={vector_db_id} inputs={len(checkpoint.done)} written={total_written} deleted={total_deleted}")
+    finally:
+        bump_vector_db_version(vector_db_id)
+        if r.get(lock_key(vector_db_id)) == lock_value:
+            r.delete(lock_key(vector_db_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import argparse
+
+from src.langchain_aris.retriever import bump_vector_db_version
+from src.langchain_aris.vector_store import list_stored_vector_db_ids, migrate_to_shared_layout
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move knowledge bases from one neo4j label each into the shared layout (VECTOR_STORE_LAYOUT=shared).")
+    parser.add_argument("vector_db_ids", nargs="*", type=int, help="knowledge bases to migrate, all labeled knowledge bases if omitted")
+    parser.add_argument("--batch-size", type=int, default=5000, help="nodes relabeled per transaction")
+    parser.add_argument("--keep-indexes", action="store_true", help="keep the indexes of the old labels")
+    args = parser.parse_args()
+
+    for vector_db_id in args.vector_db_ids or sorted(list_stored_vector_db_ids()):
+        moved = migrate_to_shared_layout(vector_db_id, batch_size=args.batch_size, drop_indexes=not args.keep_indexes)
+        bump_vector_db_version(vector_db_id)
+        print(f"vector_db_id={vector_db_id} migrated={moved}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Tuple
+from uuid import uuid4
+
+from sqlalchemy import or_
+
+from src.config import INGESTION_JOB_LEASE
+from src.langchain_aris.bm25 import get_complete_bm25_index, save_bm25_index
+from src.langchain_aris.manifest import apply_manifest_patch
+from src.langchain_aris.retriever import bump_vector_db_version
+from src.langchain_aris.snapshot import export_snapshot, import_snapshot, read_snapshot_info, read_snapshot_manifest
+from src.langchain_aris.vector_store import init_vector_store
+from src.middleware.mysql import session
+from src.middleware.mysql.models import EmbeddingSchema, VectorDbSchema
+from src.middleware.redis import r
+from src.worker.queue import lock_key
+
+
+def _get_vector_db(vector_db_id: int) -> Tuple[str, int, int]:
+    with session() as conn:
+        query = (
+            conn.query(EmbeddingSchema.embedding_name, EmbeddingSchema.embed_dim, VectorDbSchema.db_size)
+            .join(VectorDbSchema, VectorDbSchema.embedding_id == EmbeddingSchema.embedding_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+        )
+        result = query.first()
+    if not result:
+        sys.exit(f"Vector DB id `{vector_db_id}` does not exist")
+    return result
+
+
+def export_command(args: argparse.Namespace) -> None:
+    embedding_name, _, _ = _get_vector_db(args.vector_db_id)
+    count = export_snapshot(args.vector_db_id, embedding_name, args.path)
+    print(f"vector_db_id={args.vector_db_id} exported={count} path={args.path}")
+
+
+def import_command(args: argparse.Namespace) -> None:
+    embedding_name, embed_dim, db_size = _get_vector_db(args.vector_db_id)
+    snapshot = read_snapshot_info(args.path)
+    if snapshot["embedding_name"] != embedding_name:
+        sys.exit(f"Snapshot is embedded by `{snapshot['embedding_name']}`, but vector DB id `{args.vector_db_id}` uses `{embedding_name}`")
+    if snapshot["count"] and snapshot["dim"] != embed_dim:
+        sys.exit(f"Snapshot has {snapshot['dim']}d vectors, but the embedding of vector DB id `{args.vector_db_id}` has {embed_dim}d")
+    if db_size and not args.start:
+        sys.exit(f"Vector DB id `{args.vector_db_id}` is not empty, import the snapshot into a new vector DB")
+    lock_value = f"snapshot:{uuid4().hex}"
+    if not r.set(lock_key(args.vector_db_id), lock_value, nx=True, ex=INGESTION_JOB_LEASE):
+        sys.exit(f"Vector DB id `{args.vector_db_id}` is being written by an ingestion job")
+
+    written = args.start
+    try:
+        vector_db = init_vector_store(args.vector_db_id, None)
+        keyword_index = get_complete_bm25_index(args.vector_db_id, vector_db)
+
+        def _on_written(n: int) -> None:
+            nonlocal written
+            written = args.start + n
+            r.expire(lock_key(args.vector_db_id), INGESTION_JOB_LEASE)
+
+        import_snapshot(vector_db, keyword_index, args.path, start=args.start, on_written=_on_written)
+        apply_manifest_patch(args.vector_db_id, read_snapshot_manifest(args.path))
+    finally:
+        save_bm25_index(args.vector_db_id)
+        bump_vector_db_version(args.vector_db_id)
+        if r.get(lock_key(args.vector_db_id)) == lock_value:
+            r.delete(lock_key(args.vector_db_id))
+        print(f"vector_db_id={args.vector_db_id} imported={written}/{snapshot['count']}")
+
+    with session() as conn:
+        query = conn.query(VectorDbSchema).filter(VectorDbSchema.vector_db_id == args.vector_db_id)
+        query.update({VectorDbSchema.db_size: snapshot["count"]})
+        conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export a knowledge base into a snapshot bundle, or import a bundle without embedding again.")
+    subparsers = parser.add_subparsers(required=True)
+
+    export_parser = subparsers.add_parser("export", help="write the chunks, vectors and manifest of a knowledge base into a bundle")
+    export_parser.add_argument("vector_db_id", type=int)
+    export_parser.add_argument("path", type=Path)
+    export_parser.set_defaults(func=export_command)
+
+    import_parser = subparsers.add_parser("import", help="write a bundle into an empty knowledge base with the same embedding")
+    import_parser.add_argument("vector_db_id", type=int)
+    import_parser.add_argument("path", type=Path)
+    import_parser.add_argument("--start", type=int, default=0, help="resume an interrupted import after this many chunks")
+    import_parser.set_defaults(func=import_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
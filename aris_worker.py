@@ -0,0 +1,10 @@
+from src.config import INGESTION_WORKERS
+from src.worker import run_workers
+
+
+def main() -> None:
+    run_workers(INGESTION_WORKERS)
+
+
+if __name__ == "__main__":
+    main()
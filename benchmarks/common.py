@@ -0,0 +1,98 @@
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.langchain_aris.bm25 import tokenize
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic offline embedding, tokens are hashed into a signed bag of words."""
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            h = zlib.crc32(token.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class InMemoryVectorStore(VectorStore):
+    """Local stand-in for Neo4jVector, exact cosine search over a numpy matrix."""
+
+    def __init__(self, embedding: Embeddings) -> None:
+        self.embedding = embedding
+        self._blocks: List[np.ndarray] = []
+        self._matrix: np.ndarray | None = None
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._positions: Dict[str, int] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas)
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        start = len(self._texts)
+        self._blocks.append(np.asarray(embeddings, dtype=np.float32))
+        self._matrix = None
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas or [{} for _ in texts])
+        ids = ids or [str(i) for i in range(start, len(self._texts))]
+        self._positions.update((id, i) for i, id in enumerate(ids, start))
+        return ids
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        return [Document(page_content=self._texts[i], metadata={**self._metadatas[i], "chunk_id": id}) for id in ids if (i := self._positions.get(id)) is not None]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        if not self._texts:
+            return []
+        if self._matrix is None:
+            self._matrix = np.concatenate(self._blocks)
+            self._blocks = [self._matrix]
+
+        scores = self._matrix @ np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(Document(page_content=self._texts[i], metadata={**self._metadatas[i]}), float(scores[i])) for i in top]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any) -> "InMemoryVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas)
+        return store
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
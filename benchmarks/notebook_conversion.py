@@ -0,0 +1,91 @@
+"""Notebook conversion benchmark.
+
+Converts a fixture corpus with nbconvert's `MarkdownExporter` and with `Jupyter2MarkdownTransformer`, reporting
+wall time, notebook throughput and output tokens. Without `--fixture` synthetic notebooks with code, text outputs
+and base64 figures are generated.
+
+    python -m benchmarks.notebook_conversion --notebooks 50 --cells 40
+    python -m benchmarks.notebook_conversion --fixture ./path/to/notebooks
+"""
+
+import argparse
+import base64
+import json
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from src.langchain_aris.context import get_token_counter
+from src.langchain_aris.transformers import Jupyter2MarkdownTransformer
+
+
+def synthetic_notebooks(n_notebooks: int, n_cells: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(500)]
+    notebooks = []
+    for _ in range(n_notebooks):
+        cells = []
+        for i in range(n_cells):
+            if i % 2 == 0:
+                cells.append({"cell_type": "markdown", "metadata": {}, "source": ["## " + " ".join(rng.choices(words, k=6)) + "\n", " ".join(rng.choices(words, k=40))]})
+                continue
+            outputs = [{"output_type": "stream", "name": "stdout", "text": [" ".join(rng.choices(words, k=10)) + "\n" for _ in range(rng.randint(1, 200))]}]
+            if rng.random() < 0.3:
+                figure = base64.b64encode(rng.randbytes(30_000)).decode("ascii")
+                outputs.append({"output_type": "display_data", "metadata": {}, "data": {"image/png": figure, "text/plain": ["<Figure size 640x480 with 1 Axes>"]}})
+            source = [f"{rng.choice(words)} = {rng.choice(words)}({rng.choice(words)})\n" for _ in range(rng.randint(2, 12))]
+            cells.append({"cell_type": "code", "execution_count": i, "metadata": {}, "outputs": outputs, "source": source})
+        notebook = {"cells": cells, "metadata": {"language_info": {"name": "python"}}, "nbformat": 4, "nbformat_minor": 5}
+        notebooks.append(json.dumps(notebook))
+    return notebooks
+
+
+def nbconvert_markdown(content: str) -> str:
+    import nbformat
+    from nbconvert import MarkdownExporter
+
+    markdown, _ = MarkdownExporter().from_notebook_node(nbformat.reads(content, as_version=4))
+    return markdown
+
+
+def evaluate(convert: Callable[[str], str], notebooks: List[str]) -> Dict[str, float]:
+    count_tokens = get_token_counter()
+    start = time.perf_counter()
+    outputs = [convert(notebook) for notebook in notebooks]
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "notebooks_per_second": len(notebooks) / seconds if seconds else 0.0,
+        "tokens": sum(count_tokens(output) for output in outputs),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", type=Path, help="directory of ipynb files to convert instead of the synthetic corpus")
+    parser.add_argument("--notebooks", type=int, default=20)
+    parser.add_argument("--cells", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-output-chars", type=int, default=2000)
+    parser.add_argument("--output", type=Path, help="write the report as json")
+    args = parser.parse_args()
+
+    if args.fixture:
+        notebooks = [path.read_text(encoding="utf-8") for path in sorted(args.fixture.rglob("*.ipynb"))]
+    else:
+        notebooks = synthetic_notebooks(args.notebooks, args.cells, args.seed)
+
+    converters = {"nbconvert": nbconvert_markdown, "cells": Jupyter2MarkdownTransformer(args.max_output_chars).convert}
+    report = {"notebooks": len(notebooks), "converters": {name: {k: round(v, 4) for k, v in evaluate(convert, notebooks).items()} for name, convert in converters.items()}}
+
+    print(f"notebooks={report['notebooks']}")
+    for name, metrics in report["converters"].items():
+        print(f"{name:>9}: " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""PDF parsing backend benchmark.
+
+Parses a fixture corpus with every backend of `PDF_BACKEND_MAP` and reports wall time, page throughput and
+extracted characters. Without `--fixture` a synthetic corpus of text-only PDFs is generated with PyMuPDF.
+
+    python -m benchmarks.pdf_parsing --pdfs 20 --pages 50
+    python -m benchmarks.pdf_parsing --fixture ./path/to/pdfs --backends pymupdf
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from src.langchain_aris.file_loader import PDF_BACKEND_MAP, load_pdf_file
+
+
+def synthetic_pdfs(root: Path, n_pdfs: int, n_pages: int, seed: int) -> List[Path]:
+    import fitz
+
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(2000)]
+    paths = []
+    for i in range(n_pdfs):
+        pdf = fitz.open()
+        for _ in range(n_pages):
+            page = pdf.new_page()
+            lines = [" ".join(rng.choices(words, k=12)) for _ in range(45)]
+            page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), "\n".join(lines), fontsize=9)
+        path = root / f"synthetic_{i}.pdf"
+        pdf.save(path)
+        pdf.close()
+        paths.append(path)
+    return paths
+
+
+def evaluate(backend: str, paths: List[Path]) -> Dict[str, float]:
+    pages, chars = 0, 0
+    start = time.perf_counter()
+    for path in paths:
+        for doc in load_pdf_file(path, backend):
+            pages += 1
+            chars += len(doc.page_content)
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "pages": pages, "pages_per_second": pages / seconds if seconds else 0.0, "chars": chars}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", type=Path, help="directory of pdf files to parse instead of the synthetic corpus")
+    parser.add_argument("--pdfs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backends", nargs="+", choices=list(PDF_BACKEND_MAP), default=list(PDF_BACKEND_MAP))
+    parser.add_argument("--output", type=Path, help="write the report as json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = sorted(args.fixture.rglob("*.pdf")) if args.fixture else synthetic_pdfs(Path(tmp_dir), args.pdfs, args.pages, args.seed)
+        report = {"files": len(paths), "backends": {name: {k: round(v, 4) for k, v in evaluate(name, paths).items()} for name in args.backends}}
+
+    print(f"files={report['files']}")
+    for name, metrics in report["backends"].items():
+        print(f"{name:>8}: " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
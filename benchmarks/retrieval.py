@@ -0,0 +1,145 @@
+"""Retrieval quality and latency benchmark.
+
+Builds a knowledge base offline through `split_documents` and `ingest_documents`, backed by a deterministic
+hashing embedding and an in-memory vector store, then reports recall@k, MRR, latency and memory per backend.
+
+    python -m benchmarks.retrieval --docs 500 --queries 200
+    python -m benchmarks.retrieval --fixture ./path/to/files --backends hybrid keyword
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import SUPPORT_UPLOAD_FILE
+from src.langchain_aris.bm25 import BM25Index
+from src.langchain_aris.file_loader import load_upload_files
+from src.langchain_aris.ingestion import ingest_documents
+from src.langchain_aris.retriever import KnowledgeBaseRetriever
+from src.langchain_aris.text_splitter import split_documents
+
+from .common import HashingEmbeddings, InMemoryVectorStore, percentile
+
+BackendFactory = Callable[[InMemoryVectorStore, BM25Index, int], KnowledgeBaseRetriever]
+
+BACKENDS: Dict[str, BackendFactory] = {
+    "vector": lambda store, index, k: KnowledgeBaseRetriever(vector_store=store, k=k),
+    "hybrid": lambda store, index, k: KnowledgeBaseRetriever(vector_store=store, keyword_index=index, k=k),
+    "keyword": lambda store, index, k: KnowledgeBaseRetriever(vector_store=store, keyword_index=index, vector_weight=0.0, k=k),
+}
+
+
+def synthetic_documents(n_docs: int, seed: int, vocab_size: int = 5000, words_per_doc: int = 400) -> List[Document]:
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(vocab_size)]
+    # zipf-like weights so that term frequencies look like natural text
+    weights = [1 / (rank + 1) for rank in range(vocab_size)]
+
+    documents = []
+    for i in range(n_docs):
+        words = rng.choices(vocab, weights=weights, k=words_per_doc)
+        sentences = [" ".join(words[j : j + 12]) + "." for j in range(0, len(words), 12)]
+        documents.append(Document(page_content="\n".join(sentences), metadata={"source": f"synthetic/{i}.txt"}))
+    return documents
+
+
+def fixture_documents(root: Path) -> List[Document]:
+    paths = [p for p in sorted(root.rglob("*")) if p.is_file() and p.suffix[1:] in SUPPORT_UPLOAD_FILE]
+    documents, _ = load_upload_files(paths)
+    return documents
+
+
+def make_queries(chunks: List[Document], n_queries: int, seed: int, span: int = 8) -> List[Tuple[str, str]]:
+    """Sample a span of words from a chunk as the needle, the query is the needle with some noise."""
+    rng = random.Random(seed)
+    queries = []
+    candidates = [c for c in chunks if len(c.page_content.split()) >= span]
+    for chunk in rng.sample(candidates, min(n_queries, len(candidates))):
+        words = chunk.page_content.split()
+        start = rng.randint(0, len(words) - span)
+        needle = words[start : start + span]
+        noisy = needle[:]
+        rng.shuffle(noisy)
+        noisy[rng.randrange(span)] = rng.choice(words)
+        queries.append((" ".join(noisy), " ".join(needle)))
+    return queries
+
+
+def evaluate(retriever: KnowledgeBaseRetriever, queries: List[Tuple[str, str]]) -> Dict[str, float]:
+    latencies, hits, reciprocal_ranks = [], 0, []
+    for query, needle in queries:
+        start = time.perf_counter()
+        results = retriever.search_with_scores(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        rank = next((i + 1 for i, (doc, _) in enumerate(results) if needle in " ".join(doc.page_content.split())), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    return {
+        f"recall@{retriever.k}": hits / len(queries),
+        "mrr": sum(reciprocal_ranks) / len(queries),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", type=Path, help="directory of files to ingest instead of the synthetic corpus")
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=64)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--output", type=Path, help="write the report as json")
+    args = parser.parse_args()
+
+    documents = fixture_documents(args.fixture) if args.fixture else synthetic_documents(args.docs, args.seed)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = split_documents(documents, args.chunk_size, args.chunk_overlap)
+    store, index = InMemoryVectorStore(HashingEmbeddings(args.dim)), BM25Index()
+    ingest_documents(store, index, chunks)
+    ingest_seconds = time.perf_counter() - start
+    _, ingest_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    queries = make_queries(chunks, args.queries, args.seed)
+    report = {
+        "documents": len(documents),
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "ingest_seconds": round(ingest_seconds, 3),
+        "ingest_peak_mb": round(ingest_peak / 2**20, 2),
+        "backends": {},
+    }
+    for name in args.backends:
+        tracemalloc.start()
+        metrics = evaluate(BACKENDS[name](store, index, args.k), queries)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics["query_peak_mb"] = peak / 2**20
+        report["backends"][name] = {k: round(v, 4) for k, v in metrics.items()}
+
+    print(f"documents={report['documents']} chunks={report['chunks']} queries={report['queries']}")
+    print(f"ingest {report['ingest_seconds']}s, peak {report['ingest_peak_mb']}MB")
+    for name, metrics in report["backends"].items():
+        print(f"{name:>8}: " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Text splitter micro-benchmark.
+
+Compares the legacy character splitter, a new `RecursiveCharacterTextSplitter` per document measured in
+characters, with the token splitter of `split_documents`, serial and with a process pool. Reports throughput
+and the token size of the produced chunks.
+
+    python -m benchmarks.text_splitter --docs 2000 --chunk-size 256
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from langchain_core.documents import Document
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from src.langchain_aris.context import get_token_counter
+from src.langchain_aris.text_splitter import SUFFIX_LANGUAGE_MAP, split_documents
+
+from .common import percentile
+from .retrieval import synthetic_documents
+
+
+def legacy_split_documents(documents: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """The splitter before the token splitter, kept as the baseline."""
+    chunks = []
+    for doc in documents:
+        params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "add_start_index": True}
+        suffix = doc.metadata.get("source", ".").split(".")[-1]
+        if suffix in SUFFIX_LANGUAGE_MAP:
+            params["separators"] = RecursiveCharacterTextSplitter.get_separators_for_language(SUFFIX_LANGUAGE_MAP[suffix])
+        chunks.extend(RecursiveCharacterTextSplitter(**params).split_documents([doc]))
+    return chunks
+
+
+def evaluate(split: Callable[[List[Document]], List[Document]], documents: List[Document]) -> Dict[str, float]:
+    count_tokens = get_token_counter()
+    start = time.perf_counter()
+    chunks = split(documents)
+    seconds = time.perf_counter() - start
+    tokens = [count_tokens(chunk.page_content) for chunk in chunks]
+    return {
+        "seconds": seconds,
+        "docs_per_second": len(documents) / seconds if seconds else 0.0,
+        "chunks": len(chunks),
+        "p50_tokens": percentile(tokens, 50),
+        "max_tokens": max(tokens, default=0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=256, help="tokens for the token splitter, 4x characters for the legacy one")
+    parser.add_argument("--chunk-overlap", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="write the report as json")
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.docs, args.seed)
+    splitters = {
+        "legacy": lambda docs: legacy_split_documents(docs, args.chunk_size * 4, args.chunk_overlap * 4),
+        "token": lambda docs: split_documents(docs, args.chunk_size, args.chunk_overlap, workers=0),
+        "token_parallel": lambda docs: split_documents(docs, args.chunk_size, args.chunk_overlap, workers=args.workers),
+    }
+    report = {"documents": len(documents), "splitters": {name: {k: round(v, 4) for k, v in evaluate(split, documents).items()} for name, split in splitters.items()}}
+
+    print(f"documents={report['documents']} chunk_size={args.chunk_size}")
+    for name, metrics in report["splitters"].items():
+        print(f"{name:>14}: " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
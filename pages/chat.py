@@ -55,7 +55,7 @@ def init_webui():
         "session_list": [],
         "history": [],
         "bind_llm": None,
-        "vector_db_id": 0,
+        "vector_db_id": [],
     }
 
     for var, def_val in vars.items():
@@ -96,8 +96,8 @@ def sidebar():
     st.sidebar.header("VectorStore")
     vector_stores = get_vector_dbs(cache.api_key)
 
-    vector_db_name = st.sidebar.selectbox("Select vector store", options=list(vector_stores.keys()), index=None, placeholder="Without vector store")
-    cache.vector_db_id = vector_stores.get(vector_db_name)
+    vector_db_names = st.sidebar.multiselect("Select vector stores", options=list(vector_stores.keys()), placeholder="Without vector store")
+    cache.vector_db_id = [vector_stores[name] for name in vector_db_names]
 
     st.sidebar.header("Temperature")
     cache.temperature = st.sidebar.slider("Temperature", min_value=0.0, max_value=1.0, value=0.7, step=0.05)
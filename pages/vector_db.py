@@ -116,8 +116,8 @@ def body():
             info = get_embedding_info(cache.api_key, embedding_id)
 
             chunk_size, chunk_overlap = st.columns(2)
-            chunk_size = chunk_size.number_input("Chunk Size", min_value=64, max_value=info.get("chunk_size") * 2, step=64)
-            chunk_overlap = chunk_overlap.number_input("Chunk Overlap", min_value=0, max_value=info.get("chunk_size"), step=16)
+            chunk_size = chunk_size.number_input("Chunk Size (tokens)", min_value=64, max_value=info.get("chunk_size") * 2, step=64)
+            chunk_overlap = chunk_overlap.number_input("Chunk Overlap (tokens)", min_value=0, max_value=info.get("chunk_size"), step=16)
 
             upload_func = upload_files
             upload_args = dict(
@@ -137,8 +137,8 @@ def body():
             info = get_embedding_info(cache.api_key, embedding_id)
 
             chunk_size, chunk_overlap, url_type = st.columns(3)
-            chunk_size = chunk_size.number_input("Chunk Size", min_value=64, max_value=info.get("chunk_size") * 2, step=64)
-            chunk_overlap = chunk_overlap.number_input("Chunk Overlap", min_value=0, max_value=info.get("chunk_size"), step=16)
+            chunk_size = chunk_size.number_input("Chunk Size (tokens)", min_value=64, max_value=info.get("chunk_size") * 2, step=64)
+            chunk_overlap = chunk_overlap.number_input("Chunk Overlap (tokens)", min_value=0, max_value=info.get("chunk_size"), step=16)
             url_type = url_type.selectbox("Url Type", options=SUPPORT_URL_TYPE)
 
             upload_func = upload_urls
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 
-from src.config import DEBUG_MODE
+from src.config import DEBUG_MODE, SNAPSHOT_MAX_SIZE, UPLOAD_MAX_TOTAL_SIZE
+from src.langchain_aris.browser_pool import close_browser_pool
 from src.logger import logger
+from src.middleware.body_limit import MULTIPART_OVERHEAD, BodyLimitMiddleware
 from src.middleware.logger import LoggerMiddleWare
 
 from .router import root_router, v1_router
@@ -23,6 +25,17 @@ def create_app() -> FastAPI:
 
     # add middlewares
     app.add_middleware(LoggerMiddleWare)
+    # multipart bodies are spooled by the framework before an endpoint runs, so their size is bounded here
+    app.add_middleware(
+        BodyLimitMiddleware,
+        limits=[
+            ("POST", r"^/v1/vector-db/\d+/files$", UPLOAD_MAX_TOTAL_SIZE + MULTIPART_OVERHEAD),
+            ("POST", r"^/v1/vector-db/\d+/snapshot$", SNAPSHOT_MAX_SIZE + MULTIPART_OVERHEAD),
+        ],
+    )
+
+    # the shared browser of the playwright loader is only launched on first use
+    app.add_event_handler("shutdown", close_browser_pool)
 
     logger.info("Init app successfully")
     return app
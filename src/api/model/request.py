@@ -46,11 +46,17 @@ class UploadUrlsRequest(BaseModel):
     urls: List[str]
     chunk_size: int
     chunk_overlap: int
-    url_type: Literal["arxiv", "git", "playwright", "recursive"]
+    url_type: Literal["arxiv", "git", "playwright", "recursive", "crawl"]
+
+
+class UpdateSearchConfigRequest(BaseModel):
+    vector_weight: float | None = None
+    keyword_weight: float | None = None
+    metadata_allowlist: List[str] | None = None
 
 
 class ChatRequest(BaseModel):
     llm_name: str
     temperature: float
     message: str
-    vector_db_id: int | None = None
+    vector_db_id: int | List[int] | None = None
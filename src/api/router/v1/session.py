@@ -275,33 +275,45 @@ async def chat(session_id: int, request: ChatRequest, info: Tuple[int, int] = De
         "temperature": request.temperature,
         "session_id": session_id,
     }
-    if request.vector_db_id:
+    vector_db_ids = [request.vector_db_id] if isinstance(request.vector_db_id, int) else list(dict.fromkeys(request.vector_db_id or []))
+    if vector_db_ids:
+        vector_db_embedding_schemas: Dict[int, EmbeddingSchema] = {}
         with session() as conn:
-            query = (
-                conn.query(VectorDbSchema.embedding_id, VectorDbSchema.db_size)
-                .filter(VectorDbSchema.vector_db_id == request.vector_db_id)
-                .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
-            )
-            result = query.first()
-            if not result:
-                return StandardResponse(code=1, status="error", message="Vector DB not exist")
-
-            (embedding_id, db_size) = result
-
-            if db_size == 0:
-                return StandardResponse(code=1, status="error", message="Vector DB is empty, please upload data first")
-
-            query = (
-                conn.query(EmbeddingSchema)
-                .filter(EmbeddingSchema.embedding_id == embedding_id)
-                .filter(or_(EmbeddingSchema.delete_at.is_(None), datetime.now() < EmbeddingSchema.delete_at))
-            )
-            _embedding: EmbeddingSchema | None = query.first()
-            if not _embedding:
-                return StandardResponse(code=1, status="error", message="Embedding not exist")
+            for vector_db_id in vector_db_ids:
+                query = (
+                    conn.query(VectorDbSchema.embedding_id, VectorDbSchema.db_size)
+                    .filter(VectorDbSchema.vector_db_id == vector_db_id)
+                    .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+                )
+                result = query.first()
+                if not result:
+                    r.delete(redis_lock)
+                    return StandardResponse(code=1, status="error", message=f"Vector DB `{vector_db_id}` not exist")
+
+                (embedding_id, db_size) = result
+
+                if db_size == 0:
+                    logger.debug(f"Skip empty vector_db_id: {vector_db_id}")
+                    continue
+
+                query = (
+                    conn.query(EmbeddingSchema)
+                    .filter(EmbeddingSchema.embedding_id == embedding_id)
+                    .filter(or_(EmbeddingSchema.delete_at.is_(None), datetime.now() < EmbeddingSchema.delete_at))
+                )
+                _embedding: EmbeddingSchema | None = query.first()
+                if not _embedding:
+                    r.delete(redis_lock)
+                    return StandardResponse(code=1, status="error", message=f"Embedding of vector DB `{vector_db_id}` not exist")
+
+                vector_db_embedding_schemas[vector_db_id] = _embedding
+
+        if not vector_db_embedding_schemas:
+            r.delete(redis_lock)
+            return StandardResponse(code=1, status="error", message="Vector DB is empty, please upload data first")
 
         chain_func = init_retriever_qa_chain
-        chain_kwargs.update({"embedding_schema": _embedding, "vector_db_id": request.vector_db_id})
+        chain_kwargs.update({"vector_db_embedding_schemas": vector_db_embedding_schemas})
     else:
         chain_func = init_chat_chain
     try:
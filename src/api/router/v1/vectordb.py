@@ -1,52 +1,102 @@
+import asyncio
+import math
 from datetime import datetime
+from json import loads
 from pathlib import Path
-from typing import List, Tuple
+from tempfile import TemporaryDirectory
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from uuid import uuid4
 
-import tqdm
-from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile
-from langchain_community.vectorstores.neo4j_vector import Neo4jVector, SearchType
+from fastapi import APIRouter, Depends, Request, UploadFile
+from fastapi.responses import StreamingResponse
 from langchain_core.documents import Document
-from langchain_openai.embeddings import OpenAIEmbeddings
 from sqlalchemy import or_
 
-from src.config import NEO4J_HOST, NEO4J_PASSWORD, NEO4J_PORT, SUPPORT_UPLOAD_FILE, TMP_ROOT
-from src.langchain_aris.embedding import init_embedding
+from src.config import INGESTION_BATCH_SIZE, INGESTION_JOB_LEASE, SNAPSHOT_MAX_SIZE, SUPPORT_UPLOAD_FILE, TMP_ROOT, UPLOAD_MAX_FILE_SIZE, UPLOAD_MAX_TOTAL_SIZE
+from src.langchain_aris.bm25 import get_complete_bm25_index, save_bm25_index
 from src.langchain_aris.file_loader import load_upload_files
-from src.langchain_aris.text_splitter import split_documents
-from src.langchain_aris.url_loader import load_upload_urls
-from src.logger import logger
+from src.langchain_aris.ingestion import iter_prefetched
+from src.langchain_aris.manifest import ManifestDiff, drop_manifest
+from src.langchain_aris.retriever import bump_vector_db_version, drop_search_config, get_search_config, update_search_config
+from src.langchain_aris.snapshot import read_snapshot_info, stream_snapshot
+from src.langchain_aris.text_splitter import iter_split_documents
+from src.langchain_aris.url_loader import iter_upload_urls
+from src.langchain_aris.vector_store import Neo4jBulkWriter, init_vector_store
 from src.middleware.mysql import session
 from src.middleware.mysql.models import EmbeddingSchema, VectorDbSchema
+from src.middleware.redis import r
+from src.worker import enqueue_ingestion_job, enqueue_purge, enqueue_snapshot_job, get_ingestion_job, lock_key, snapshot_path
 
 from ...auth import sk_auth
-from ...model.request import CreateVectorDbRequest, UploadUrlsRequest
+from ...model.request import CreateVectorDbRequest, UpdateSearchConfigRequest, UploadUrlsRequest
 from ...model.response import StandardResponse
 
 vector_db_router = APIRouter(prefix="/vector-db", tags=["vector-db"])
 
-
-def _embedding_task(vector_db_id: int, documents: List[Document], embedding: OpenAIEmbeddings) -> None:
-    logger.debug(f"Start async task: embedding {len(documents)} docs for vector_db_id: {vector_db_id}")
-    try:
-        node_label = f"knowledge_base:{vector_db_id}"
-        vector_db = Neo4jVector(
-            username="neo4j",
-            url=f"bolt://{NEO4J_HOST}:{NEO4J_PORT}",
-            password=NEO4J_PASSWORD,
-            node_label=node_label,
-            search_type=SearchType.HYBRID,
-            embedding=embedding,
-        )
-        batch = max(0, len(documents) // 100) + 1
-        for i in tqdm.tqdm(range(0, len(documents), batch), desc="Embedding", unit="batch"):
-            docs = documents[i : i + batch]
-            vector_db.add_documents(docs)
-
-        vector_db.add_documents(documents[i + batch :])
-    except Exception as e:
-        logger.error(f"Error when embedding {len(documents)} docs for vector_db_id: {vector_db_id}, error: {e}")
-    else:
-        logger.debug(f"Finish async task: embedding {len(documents)} docs for vector_db_id: {vector_db_id}")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# loaded documents buffered ahead of splitting, the rest of the pipeline holds one redis push batch
+PREFETCH_DOCUMENTS = 32
+# invalid ndjson lines reported back, the rest are only counted
+MAX_REPORTED_LINES = 100
+# node properties of a chunk, they can not be set through metadata
+RESERVED_METADATA_KEYS = {"id", "text", "embedding", "vector_db_id"}
+
+
+def _save_upload_file(file: UploadFile, path: Path, max_size: int) -> int:
+    """Stream an upload to `path` chunk by chunk, return the written size or -1 once it exceeds `max_size`."""
+    size = 0
+    with path.open("wb") as f:
+        while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                return -1
+            f.write(chunk)
+    return size
+
+
+async def _iter_ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a streamed body into numbered lines, only the last partial line is held between chunks."""
+    tail, lineno = b"", 0
+    async for chunk in request.stream():
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            lineno += 1
+            yield lineno, line
+    if tail:
+        yield lineno + 1, tail
+
+
+def _is_primitive(value: Any) -> bool:
+    return isinstance(value, (str, int, float)) and not (isinstance(value, float) and not math.isfinite(value))
+
+
+def _parse_vector_record(line: bytes, embed_dim: int) -> Tuple[Document, List[float]]:
+    record = loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Line must be a json object")
+    text, embedding, metadata = record.get("text"), record.get("embedding"), record.get("metadata") or {}
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("`text` must be a non-empty string")
+    if not isinstance(embedding, list) or len(embedding) != embed_dim:
+        raise ValueError(f"`embedding` must be a list of {embed_dim} numbers")
+    if not all(isinstance(x, (int, float)) and not isinstance(x, bool) and math.isfinite(x) for x in embedding):
+        raise ValueError("`embedding` must only hold finite numbers")
+    if not isinstance(metadata, dict):
+        raise ValueError("`metadata` must be an object")
+    # metadata becomes node properties, which hold primitives or lists of one primitive type
+    for key, value in metadata.items():
+        if key in RESERVED_METADATA_KEYS:
+            raise ValueError(f"`metadata.{key}` is reserved")
+        if isinstance(value, list):
+            if not all(_is_primitive(x) for x in value) or len({type(x) for x in value}) > 1:
+                raise ValueError(f"`metadata.{key}` must be a list of strings, numbers or booleans of one type")
+        elif not _is_primitive(value):
+            raise ValueError(f"`metadata.{key}` must be a string, a finite number, a boolean or a list of them")
+    # a given id is also the node id, so sending a chunk again updates it
+    if record.get("id") is not None:
+        metadata = {**metadata, "chunk_id": str(record["id"])}
+    return Document(page_content=text, metadata=metadata), embedding
 
 
 @vector_db_router.post("", response_model=StandardResponse, dependencies=[Depends(sk_auth)])
@@ -173,18 +223,49 @@ def get_vector_db(vector_db_id: int, info: Tuple[str, str] = Depends(sk_auth)):
         "vector_db_description": vector_db_description,
         "db_size": db_size,
         "embedding_name": embedding_name,
+        "search_config": get_search_config(vector_db_id),
     }
 
     return StandardResponse(code=0, status="success", data=data)
 
 
+@vector_db_router.put("/{vector_db_id}/search-config", response_model=StandardResponse, dependencies=[Depends(sk_auth)])
+def update_vector_db_search_config(vector_db_id: int, request: UpdateSearchConfigRequest, info: Tuple[str, str] = Depends(sk_auth)):
+    uid, _ = info
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = (
+            conn.query(VectorDbSchema.vector_db_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(VectorDbSchema.uid == uid)
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+        )
+        result = query.first()
+
+    if not result:
+        return StandardResponse(code=1, status="error", message=f"Vector DB id `{vector_db_id}` does not exist")
+
+    config = request.model_dump(exclude_none=True)
+    if any(config.get(name, 0) < 0 for name in ["vector_weight", "keyword_weight"]):
+        return StandardResponse(code=1, status="error", message="Search weights must not be negative")
+
+    update_search_config(vector_db_id, config)
+    bump_vector_db_version(vector_db_id)
+
+    return StandardResponse(code=0, status="success", message="Update search config successfully", data=get_search_config(vector_db_id))
+
+
 @vector_db_router.post("/{vector_db_id}/files", response_model=StandardResponse, dependencies=[Depends(sk_auth)])
 def upload_files_to_vector_db(
     vector_db_id: int,
     files: List[UploadFile],
     chunk_size: int,
     chunk_overlap: int,
-    background_tasks: BackgroundTasks,
     info: Tuple[str, str] = Depends(sk_auth),
 ):
     uid, _ = info
@@ -216,13 +297,7 @@ def upload_files_to_vector_db(
             conn.commit()
 
         query = (
-            conn.query(
-                EmbeddingSchema.embedding_type,
-                EmbeddingSchema.embedding_name,
-                EmbeddingSchema.base_url,
-                EmbeddingSchema.api_key,
-                EmbeddingSchema.chunk_size,
-            )
+            conn.query(EmbeddingSchema.embedding_name, EmbeddingSchema.chunk_size)
             .filter(EmbeddingSchema.embedding_id == embedding_id)
             .filter(or_(EmbeddingSchema.delete_at.is_(None), datetime.now() < EmbeddingSchema.delete_at))
         )
@@ -231,62 +306,54 @@ def upload_files_to_vector_db(
     if not result:
         return StandardResponse(code=1, status="error", message=f"Bind embedding id `{embedding_id}` does not exist")
 
-    embedding_type, embedding_name, base_url, api_key, _chunk_size = result
-    embedding = init_embedding(embedding_type, embedding_name, api_key, base_url, _chunk_size)
+    embedding_name, _chunk_size = result
 
     chunk_size = min(chunk_size, _chunk_size)
 
     invalid = []
 
-    paths: List[Path] = []
-
+    # every request gets its own directory, so uploads with the same file name do not collide
     tmp_root = Path(TMP_ROOT)
     tmp_root.mkdir(exist_ok=True, parents=True)
 
-    for file in files:
-        path = tmp_root / file.filename
-        if path.suffix[1:] not in SUPPORT_UPLOAD_FILE:
-            invalid.append(file.filename)
-            continue
-
-        with path.open("wb") as f:
-            f.write(file.file.read())
-
-        paths.append(path)
-
-    if not paths:
-        return StandardResponse(code=1, status="error", message="No file is uploaded")
-
-    documents = load_upload_files(paths)
-    if not documents:
+    with TemporaryDirectory(dir=tmp_root, prefix="upload-") as tmp_dir:
+        paths: List[Path] = []
+        total_size = 0
+        for file in files:
+            path = Path(tmp_dir) / Path(file.filename).name
+            if path.suffix[1:] not in SUPPORT_UPLOAD_FILE or path in paths:
+                invalid.append(file.filename)
+                continue
+
+            size = _save_upload_file(file, path, min(UPLOAD_MAX_FILE_SIZE, UPLOAD_MAX_TOTAL_SIZE - total_size))
+            if size < 0:
+                message = f"File `{file.filename}` exceeds {UPLOAD_MAX_FILE_SIZE} bytes or the upload exceeds {UPLOAD_MAX_TOTAL_SIZE} bytes"
+                return StandardResponse(code=1, status="error", message=message)
+            total_size += size
+
+            paths.append(path)
+
+        if not paths:
+            return StandardResponse(code=1, status="error", message="No file is uploaded")
+
+        documents, failed = load_upload_files(paths)
+        invalid.extend(path.name for path in failed)
+
+    # the temp directory differs per request, so sources are the file names, uploads are always added and not
+    # diffed against the manifest since different files may share a name
+    for doc in documents:
+        doc.metadata["source"] = Path(doc.metadata["source"]).name
+
+    chunks = iter_split_documents(documents, chunk_size, chunk_overlap)
+    job_id, upload_size = enqueue_ingestion_job(vector_db_id, embedding_id, chunks)
+    if not upload_size:
         return StandardResponse(code=1, status="error", message="No document is loaded")
 
-    for path in paths:
-        path.unlink()
-
-    documents = split_documents(documents, chunk_size, chunk_overlap)
-
-    background_tasks.add_task(_embedding_task, vector_db_id, documents, embedding)
-
-    with session() as conn:
-        if not conn.is_active:
-            conn.rollback()
-            conn.close()
-        else:
-            conn.commit()
-
-        query = (
-            conn.query(VectorDbSchema)
-            .filter(VectorDbSchema.vector_db_id == vector_db_id)
-            .filter(VectorDbSchema.uid == uid)
-            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
-        )
-        query.update({VectorDbSchema.db_size: VectorDbSchema.db_size + len(documents)})
-        conn.commit()
-
+    # db_size is updated by the worker as chunks are written
     data = {
         "embedding_name": embedding_name,
-        "upload_size": len(documents),
+        "upload_size": upload_size,
+        "job_id": job_id,
         "invalid_files": invalid,
     }
 
@@ -297,7 +364,6 @@ def upload_files_to_vector_db(
 def upload_urls_to_vector_db(
     vector_db_id: int,
     request: UploadUrlsRequest,
-    background_tasks: BackgroundTasks,
     info: Tuple[str, str] = Depends(sk_auth),
 ):
     uid, _ = info
@@ -329,13 +395,7 @@ def upload_urls_to_vector_db(
             conn.commit()
 
         query = (
-            conn.query(
-                EmbeddingSchema.embedding_type,
-                EmbeddingSchema.embedding_name,
-                EmbeddingSchema.base_url,
-                EmbeddingSchema.api_key,
-                EmbeddingSchema.chunk_size,
-            )
+            conn.query(EmbeddingSchema.embedding_name, EmbeddingSchema.chunk_size)
             .filter(EmbeddingSchema.embedding_id == embedding_id)
             .filter(or_(EmbeddingSchema.delete_at.is_(None), datetime.now() < EmbeddingSchema.delete_at))
         )
@@ -344,20 +404,53 @@ def upload_urls_to_vector_db(
     if not result:
         return StandardResponse(code=1, status="error", message=f"Bind embedding id `{embedding_id}` does not exist")
 
-    embedding_type, embedding_name, base_url, api_key, _chunk_size = result
-    embedding = init_embedding(embedding_type, embedding_name, api_key, base_url, _chunk_size)
+    embedding_name, _chunk_size = result
 
     chunk_size = min(request.chunk_size, _chunk_size)
 
     urls = set(request.urls)
 
-    documents = load_upload_urls(list(urls), request.url_type)
-    if not documents:
+    # re-ingesting urls only writes new or changed sources and deletes the chunks they replace
+    diff = ManifestDiff(vector_db_id)
+    documents = iter_prefetched(iter_upload_urls(list(urls), request.url_type, diff), PREFETCH_DOCUMENTS)
+    chunks = diff.assign_chunk_ids(iter_split_documents(documents, chunk_size, request.chunk_overlap))
+    job_id, upload_size = enqueue_ingestion_job(vector_db_id, embedding_id, chunks, diff)
+    if not diff.seen:
         return StandardResponse(code=1, status="error", message="No document is loaded")
 
-    documents = split_documents(documents, chunk_size, request.chunk_overlap)
+    # stale chunks are deleted and db_size is updated by the worker, the job reports the number deleted
+    data = {
+        "embedding_name": embedding_name,
+        "upload_size": upload_size,
+        "job_id": job_id,
+    }
+
+    return StandardResponse(code=0, status="success", data=data)
+
+
+def _get_vector_db_embedding(vector_db_id: int, uid: str) -> Tuple[str, int] | None:
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = (
+            conn.query(EmbeddingSchema.embedding_name, EmbeddingSchema.embed_dim)
+            .join(VectorDbSchema, VectorDbSchema.embedding_id == EmbeddingSchema.embedding_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(VectorDbSchema.uid == uid)
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+            .filter(or_(EmbeddingSchema.delete_at.is_(None), datetime.now() < EmbeddingSchema.delete_at))
+        )
+        return query.first()
+
 
-    background_tasks.add_task(_embedding_task, vector_db_id, documents, embedding)
+def _finish_vectors_upload(vector_db_id: int, uid: str, lock_id: str, upload_size: int) -> None:
+    save_bm25_index(vector_db_id)
+    if r.get(lock_key(vector_db_id)) == lock_id:
+        r.delete(lock_key(vector_db_id))
 
     with session() as conn:
         if not conn.is_active:
@@ -372,17 +465,194 @@ def upload_urls_to_vector_db(
             .filter(VectorDbSchema.uid == uid)
             .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
         )
-        query.update({VectorDbSchema.db_size: VectorDbSchema.db_size + len(documents)})
+        query.update({VectorDbSchema.db_size: VectorDbSchema.db_size + upload_size})
         conn.commit()
 
+    bump_vector_db_version(vector_db_id)
+
+
+@vector_db_router.post("/{vector_db_id}/vectors", response_model=StandardResponse, dependencies=[Depends(sk_auth)])
+async def upload_vectors_to_vector_db(vector_db_id: int, request: Request, info: Tuple[str, str] = Depends(sk_auth)):
+    # ndjson of pre-chunked documents with their vectors, `{"id", "text", "metadata", "embedding"}` per line, streamed
+    # into the bulk writer without loading, splitting or embedding, invalid lines are skipped and reported
+    # mysql, redis and neo4j calls are blocking, they run in worker threads to keep the event loop free
+    uid, _ = info
+    result = await asyncio.to_thread(_get_vector_db_embedding, vector_db_id, uid)
+    if not result:
+        return StandardResponse(code=1, status="error", message=f"Vector DB id `{vector_db_id}` does not exist")
+
+    embedding_name, embed_dim = result
+
+    # writes of a knowledge base are serialized with the ingestion jobs, the keyword index takes a single writer
+    lock_id = uuid4().hex
+    if not await asyncio.to_thread(r.set, lock_key(vector_db_id), lock_id, nx=True, ex=INGESTION_JOB_LEASE):
+        return StandardResponse(code=1, status="error", message=f"Vector DB id `{vector_db_id}` is being written by an ingestion job, retry later")
+
+    upload_size, n_invalid = 0, 0
+    invalid_lines: List[Dict[str, Any]] = []
+    try:
+        vector_db = await asyncio.to_thread(init_vector_store, vector_db_id, None)
+        keyword_index = await asyncio.to_thread(get_complete_bm25_index, vector_db_id, vector_db)
+        writer = Neo4jBulkWriter(vector_db)
+
+        def _add(documents: List[Document], vectors: List[List[float]]) -> int:
+            written = writer.add(documents, vectors) if documents else writer.flush()
+            keyword_index.add_documents(written)
+            r.expire(lock_key(vector_db_id), INGESTION_JOB_LEASE)
+            return len(written)
+
+        documents: List[Document] = []
+        vectors: List[List[float]] = []
+        async for lineno, line in _iter_ndjson_lines(request):
+            if not line.strip():
+                continue
+            try:
+                doc, embedding = _parse_vector_record(line, embed_dim)
+            except ValueError as e:
+                n_invalid += 1
+                if len(invalid_lines) < MAX_REPORTED_LINES:
+                    invalid_lines.append({"line": lineno, "error": str(e)})
+                continue
+            documents.append(doc)
+            vectors.append(embedding)
+            if len(documents) >= INGESTION_BATCH_SIZE:
+                upload_size += await asyncio.to_thread(_add, documents, vectors)
+                documents, vectors = [], []
+        if documents:
+            upload_size += await asyncio.to_thread(_add, documents, vectors)
+        upload_size += await asyncio.to_thread(_add, [], [])
+    finally:
+        # documents written before a failure are kept and counted
+        await asyncio.to_thread(_finish_vectors_upload, vector_db_id, uid, lock_id, upload_size)
+
+    data = {
+        "embedding_name": embedding_name,
+        "upload_size": upload_size,
+        "invalid_size": n_invalid,
+        "invalid_lines": invalid_lines,
+    }
+
+    return StandardResponse(code=0, status="success", data=data)
+
+
+@vector_db_router.get("/{vector_db_id}/snapshot", dependencies=[Depends(sk_auth)])
+def export_vector_db(vector_db_id: int, info: Tuple[str, str] = Depends(sk_auth)):
+    uid, _ = info
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = (
+            conn.query(EmbeddingSchema.embedding_name)
+            .join(VectorDbSchema, VectorDbSchema.embedding_id == EmbeddingSchema.embedding_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(VectorDbSchema.uid == uid)
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+        )
+        result = query.first()
+
+    if not result:
+        return StandardResponse(code=1, status="error", message=f"Vector DB id `{vector_db_id}` does not exist")
+
+    (embedding_name,) = result
+
+    # the bundle is sent while it is written, nothing is staged on disk
+    headers = {"Content-Disposition": f'attachment; filename="vector_db_{vector_db_id}.zip"'}
+    return StreamingResponse(stream_snapshot(vector_db_id, embedding_name), media_type="application/zip", headers=headers)
+
+
+@vector_db_router.post("/{vector_db_id}/snapshot", response_model=StandardResponse, dependencies=[Depends(sk_auth)])
+def import_vector_db(vector_db_id: int, file: UploadFile, info: Tuple[str, str] = Depends(sk_auth)):
+    uid, _ = info
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = (
+            conn.query(VectorDbSchema.embedding_id, VectorDbSchema.db_size, EmbeddingSchema.embedding_name, EmbeddingSchema.embed_dim)
+            .join(EmbeddingSchema, VectorDbSchema.embedding_id == EmbeddingSchema.embedding_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(VectorDbSchema.uid == uid)
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+        )
+        result = query.first()
+
+    if not result:
+        return StandardResponse(code=1, status="error", message=f"Vector DB id `{vector_db_id}` does not exist")
+
+    embedding_id, db_size, embedding_name, embed_dim = result
+    if db_size:
+        return StandardResponse(code=1, status="error", message=f"Vector DB id `{vector_db_id}` is not empty, import the snapshot into a new vector DB")
+
+    # the bundle is kept on the data volume until a worker has imported it
+    job_id = uuid4().hex
+    path = snapshot_path(job_id)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    if _save_upload_file(file, path, SNAPSHOT_MAX_SIZE) < 0:
+        path.unlink(missing_ok=True)
+        return StandardResponse(code=1, status="error", message=f"Snapshot `{file.filename}` exceeds {SNAPSHOT_MAX_SIZE} bytes")
+
+    try:
+        snapshot = read_snapshot_info(path)
+    except ValueError as e:
+        path.unlink(missing_ok=True)
+        return StandardResponse(code=1, status="error", message=str(e))
+
+    # vectors are imported as they are, so they must come from the embedding of this vector DB
+    if snapshot["embedding_name"] != embedding_name:
+        path.unlink(missing_ok=True)
+        message = f"Snapshot is embedded by `{snapshot['embedding_name']}`, but vector DB id `{vector_db_id}` uses `{embedding_name}`"
+        return StandardResponse(code=1, status="error", message=message)
+    if snapshot["count"] and snapshot["dim"] != embed_dim:
+        path.unlink(missing_ok=True)
+        message = f"Snapshot has {snapshot['dim']}d vectors, but the embedding of vector DB id `{vector_db_id}` has {embed_dim}d"
+        return StandardResponse(code=1, status="error", message=message)
+
+    # db_size is updated by the worker, which also refuses the import if the vector DB got chunks in the meantime
+    enqueue_snapshot_job(vector_db_id, embedding_id, job_id, snapshot["count"])
+
     data = {
         "embedding_name": embedding_name,
-        "upload_size": len(documents),
+        "upload_size": snapshot["count"],
+        "job_id": job_id,
     }
 
     return StandardResponse(code=0, status="success", data=data)
 
 
+@vector_db_router.get("/{vector_db_id}/jobs/{job_id}", response_model=StandardResponse, dependencies=[Depends(sk_auth)])
+def get_vector_db_job(vector_db_id: int, job_id: str, info: Tuple[str, str] = Depends(sk_auth)):
+    uid, _ = info
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = (
+            conn.query(VectorDbSchema.vector_db_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(VectorDbSchema.uid == uid)
+        )
+        result = query.first()
+
+    if not result:
+        return StandardResponse(code=1, status="error", message=f"Vector DB id `{vector_db_id}` does not exist")
+
+    data = get_ingestion_job(job_id)
+    if not data or data["vector_db_id"] != vector_db_id:
+        return StandardResponse(code=1, status="error", message=f"Job id `{job_id}` does not exist")
+
+    return StandardResponse(code=0, status="success", data=data)
+
+
 @vector_db_router.delete("/{vector_db_id}", response_model=StandardResponse, dependencies=[Depends(sk_auth)])
 def delete_vector_db(vector_db_id: int, info: Tuple[str, str] = Depends(sk_auth)):
     uid, _ = info
@@ -420,4 +690,10 @@ def delete_vector_db(vector_db_id: int, info: Tuple[str, str] = Depends(sk_auth)
         query.update({VectorDbSchema.delete_at: datetime.now()})
         conn.commit()
 
+    drop_manifest(vector_db_id)
+    drop_search_config(vector_db_id)
+    bump_vector_db_version(vector_db_id)
+    # chunks, indexes and the keyword index are removed by the purge worker
+    enqueue_purge(vector_db_id)
+
     return StandardResponse(code=0, status="success", message="Delete vector_db successfully")
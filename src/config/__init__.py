@@ -2,7 +2,29 @@ from .env import (
     API_HOST,
     API_KEY_EXPIRE_TIME,
     API_PORT,
+    ARXIV_CONCURRENCY,
+    ARXIV_TIMEOUT,
+    BROWSER_BLOCKED_RESOURCES,
+    BROWSER_PAGE_TIMEOUT,
+    BROWSER_POOL_SIZE,
+    CONTEXT_TOKEN_BUDGET,
+    CRAWLER_CONCURRENCY,
+    CRAWLER_DELAY,
+    CRAWLER_HOST_CONCURRENCY,
+    CRAWLER_MAX_DEPTH,
+    CRAWLER_MAX_PAGES,
+    CRAWLER_TIMEOUT,
+    DATA_ROOT,
     DEBUG_MODE,
+    EMBEDDING_CACHE_ENABLED,
+    GIT_CACHE_BUDGET,
+    INGESTION_BATCH_SIZE,
+    INGESTION_BATCH_TOKENS,
+    INGESTION_EMBED_CONCURRENCY,
+    INGESTION_JOB_LEASE,
+    INGESTION_MAX_RETRIES,
+    INGESTION_RETRY_BACKOFF,
+    INGESTION_WORKERS,
     JWT_TOKEN_ALGORITHM,
     JWT_TOKEN_EXPIRE_TIME,
     JWT_TOKEN_SECRET,
@@ -13,17 +35,33 @@ from .env import (
     MYSQL_PASSWORD,
     MYSQL_PORT,
     MYSQL_USER,
+    NEO4J_BULK_BATCH_BYTES,
     NEO4J_HOST,
     NEO4J_PASSWORD,
     NEO4J_PORT,
+    NOTEBOOK_MAX_OUTPUT_CHARS,
     OAUTH2_GITHUB_CLIENT_ID,
     OAUTH2_GITHUB_CLIENT_SECRET,
+    PARSER_TIMEOUT,
+    PARSER_WORKERS,
+    PDF_BACKEND,
+    PURGE_BATCH_SIZE,
+    PURGE_GC_INTERVAL,
     REDIS_HOST,
     REDIS_PASSWORD,
     REDIS_PORT,
+    RETRIEVER_CACHE_TTL,
+    RETRIEVER_TIMEOUT,
+    RETRIEVER_WORKERS,
+    SNAPSHOT_MAX_SIZE,
+    SPLITTER_WORKERS,
     TMP_ROOT,
+    UPLOAD_MAX_FILE_SIZE,
+    UPLOAD_MAX_TOTAL_SIZE,
+    VECTOR_STORE_LAYOUT,
 )
 from .gbl import (
+    CONTEXT_METADATA_ALLOWLIST,
     OAUTH2_GITHUB_AUTH_URL,
     OAUTH2_GITHUB_REDIRECT_URL,
     OAUTH2_GITHUB_TOKEN_URL,
@@ -34,6 +72,19 @@ from .gbl import (
 
 __all__ = [
     "DEBUG_MODE",
+    "EMBEDDING_CACHE_ENABLED",
+    "GIT_CACHE_BUDGET",
+    "CRAWLER_CONCURRENCY",
+    "CRAWLER_DELAY",
+    "CRAWLER_HOST_CONCURRENCY",
+    "CRAWLER_MAX_DEPTH",
+    "CRAWLER_MAX_PAGES",
+    "CRAWLER_TIMEOUT",
+    "BROWSER_BLOCKED_RESOURCES",
+    "BROWSER_PAGE_TIMEOUT",
+    "BROWSER_POOL_SIZE",
+    "ARXIV_CONCURRENCY",
+    "ARXIV_TIMEOUT",
     "LOGGER_LEVEL",
     "LOGGER_ROOT",
     "API_HOST",
@@ -49,16 +100,41 @@ __all__ = [
     "NEO4J_HOST",
     "NEO4J_PASSWORD",
     "NEO4J_PORT",
+    "NEO4J_BULK_BATCH_BYTES",
+    "VECTOR_STORE_LAYOUT",
+    "RETRIEVER_TIMEOUT",
+    "RETRIEVER_WORKERS",
+    "SNAPSHOT_MAX_SIZE",
+    "SPLITTER_WORKERS",
+    "RETRIEVER_CACHE_TTL",
+    "CONTEXT_TOKEN_BUDGET",
+    "CONTEXT_METADATA_ALLOWLIST",
+    "INGESTION_WORKERS",
+    "INGESTION_BATCH_SIZE",
+    "INGESTION_BATCH_TOKENS",
+    "INGESTION_EMBED_CONCURRENCY",
+    "INGESTION_MAX_RETRIES",
+    "INGESTION_RETRY_BACKOFF",
+    "INGESTION_JOB_LEASE",
+    "PURGE_BATCH_SIZE",
+    "PURGE_GC_INTERVAL",
     "JWT_TOKEN_SECRET",
     "JWT_TOKEN_EXPIRE_TIME",
     "JWT_TOKEN_ALGORITHM",
     "API_KEY_EXPIRE_TIME",
     "TMP_ROOT",
+    "UPLOAD_MAX_FILE_SIZE",
+    "UPLOAD_MAX_TOTAL_SIZE",
+    "DATA_ROOT",
     "FAISS_ROOT",
     "SUPPORT_UPLOAD_FILE",
     "SUPPORT_URL_TYPE",
     "OAUTH2_GITHUB_CLIENT_ID",
     "OAUTH2_GITHUB_CLIENT_SECRET",
+    "PARSER_TIMEOUT",
+    "PARSER_WORKERS",
+    "PDF_BACKEND",
+    "NOTEBOOK_MAX_OUTPUT_CHARS",
     "OAUTH2_GITHUB_AUTH_URL",
     "OAUTH2_GITHUB_REDIRECT_URL",
     "OAUTH2_GITHUB_TOKEN_URL",
@@ -3,6 +3,7 @@ import os
 DEBUG_MODE = os.environ.get("DEBUG_MODE", "0") == "1"
 
 TMP_ROOT = os.environ.get("TMP_ROOT", "./tmp")
+DATA_ROOT = os.environ.get("DATA_ROOT", "./data")
 
 LOGGER_LEVEL = os.environ.get("LOGGER_LEVEL", "INFO")
 LOGGER_ROOT = os.environ.get("LOGGER_ROOT", "./log")
@@ -26,6 +27,45 @@ REDIS_PASSWORD = os.environ.get("REDIS_PASSWORD")
 NEO4J_HOST = os.environ.get("NEO4J_HOST")
 NEO4J_PORT = int(os.environ.get("NEO4J_PORT", "7687"))
 NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD")
+VECTOR_STORE_LAYOUT = os.environ.get("VECTOR_STORE_LAYOUT", "label")
+NEO4J_BULK_BATCH_BYTES = eval(os.environ.get("NEO4J_BULK_BATCH_BYTES", "1024 * 1024 * 8"))
+
+RETRIEVER_TIMEOUT = float(os.environ.get("RETRIEVER_TIMEOUT", "10"))
+RETRIEVER_WORKERS = int(os.environ.get("RETRIEVER_WORKERS", "16"))
+RETRIEVER_CACHE_TTL = int(os.environ.get("RETRIEVER_CACHE_TTL", "3600"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", "2"))
+INGESTION_BATCH_SIZE = int(os.environ.get("INGESTION_BATCH_SIZE", "64"))
+INGESTION_BATCH_TOKENS = int(os.environ.get("INGESTION_BATCH_TOKENS", "8192"))
+INGESTION_EMBED_CONCURRENCY = int(os.environ.get("INGESTION_EMBED_CONCURRENCY", "4"))
+INGESTION_MAX_RETRIES = int(os.environ.get("INGESTION_MAX_RETRIES", "3"))
+INGESTION_RETRY_BACKOFF = float(os.environ.get("INGESTION_RETRY_BACKOFF", "5"))
+INGESTION_JOB_LEASE = int(os.environ.get("INGESTION_JOB_LEASE", "600"))
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "1") == "1"
+
+UPLOAD_MAX_FILE_SIZE = eval(os.environ.get("UPLOAD_MAX_FILE_SIZE", "1024 * 1024 * 200"))
+UPLOAD_MAX_TOTAL_SIZE = eval(os.environ.get("UPLOAD_MAX_TOTAL_SIZE", "1024 * 1024 * 1024"))
+PARSER_WORKERS = int(os.environ.get("PARSER_WORKERS", "4"))
+PARSER_TIMEOUT = float(os.environ.get("PARSER_TIMEOUT", "120"))
+PDF_BACKEND = os.environ.get("PDF_BACKEND", "pymupdf")
+NOTEBOOK_MAX_OUTPUT_CHARS = int(os.environ.get("NOTEBOOK_MAX_OUTPUT_CHARS", "2000"))
+SPLITTER_WORKERS = int(os.environ.get("SPLITTER_WORKERS", "4"))
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "1000"))
+PURGE_GC_INTERVAL = int(os.environ.get("PURGE_GC_INTERVAL", "3600"))
+GIT_CACHE_BUDGET = eval(os.environ.get("GIT_CACHE_BUDGET", "1024 * 1024 * 1024 * 5"))
+CRAWLER_MAX_DEPTH = int(os.environ.get("CRAWLER_MAX_DEPTH", "3"))
+CRAWLER_MAX_PAGES = int(os.environ.get("CRAWLER_MAX_PAGES", "1000"))
+CRAWLER_CONCURRENCY = int(os.environ.get("CRAWLER_CONCURRENCY", "16"))
+CRAWLER_HOST_CONCURRENCY = int(os.environ.get("CRAWLER_HOST_CONCURRENCY", "4"))
+CRAWLER_DELAY = float(os.environ.get("CRAWLER_DELAY", "0.2"))
+CRAWLER_TIMEOUT = float(os.environ.get("CRAWLER_TIMEOUT", "20"))
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", "4"))
+BROWSER_PAGE_TIMEOUT = float(os.environ.get("BROWSER_PAGE_TIMEOUT", "30"))
+BROWSER_BLOCKED_RESOURCES = [t for t in os.environ.get("BROWSER_BLOCKED_RESOURCES", "image,font,media").split(",") if t]
+ARXIV_CONCURRENCY = int(os.environ.get("ARXIV_CONCURRENCY", "4"))
+ARXIV_TIMEOUT = float(os.environ.get("ARXIV_TIMEOUT", "60"))
+SNAPSHOT_MAX_SIZE = eval(os.environ.get("SNAPSHOT_MAX_SIZE", "1024 * 1024 * 1024 * 20"))
 
 JWT_TOKEN_SECRET = os.environ.get("JWT_TOKEN_SECRET")
 JWT_TOKEN_EXPIRE_TIME = eval(os.environ.get("JWT_TOKEN_EXPIRE_TIME", "3600"))
@@ -1,6 +1,6 @@
 from .env import API_HOST, API_PORT
 
-SUPPORT_URL_TYPE = ["arxiv", "git", "render", "recursive"]
+SUPPORT_URL_TYPE = ["arxiv", "git", "playwright", "recursive", "crawl"]
 
 SUPPORT_UPLOAD_FILE = [
     "txt",
@@ -32,6 +32,9 @@ SUPPORT_UPLOAD_FILE = [
     "cob",
 ]
 
+# metadata keys written into the rag prompt, e.g. arxiv summaries are left out
+CONTEXT_METADATA_ALLOWLIST = ["source", "title", "Title", "page"]
+
 OAUTH2_GITHUB_AUTH_URL = "https://github.com/login/oauth/authorize"
 OAUTH2_GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
 OAUTH2_GITHUB_USER_API = "https://api.github.com/user"
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps, loads
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import arxiv
+import requests
+from langchain_core.documents import Document
+
+from src.config import ARXIV_CONCURRENCY, ARXIV_TIMEOUT, DATA_ROOT
+from src.logger import logger
+
+from .file_loader import load_pdf_file
+
+ARXIV_CACHE_ROOT = Path(DATA_ROOT) / "arxiv"
+
+ARXIV_ID_PATTERN = re.compile(r"^(\d{4}\.\d{4,5})(v\d+)?$")
+
+
+def _object_path(digest: str, suffix: str) -> Path:
+    return ARXIV_CACHE_ROOT / "objects" / digest[:2] / f"{digest}{suffix}"
+
+
+def _paper_path(versioned_id: str) -> Path:
+    return ARXIV_CACHE_ROOT / "papers" / f"{versioned_id}.json"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _put_object(data: bytes, suffix: str) -> str:
+    """Store a blob by its sha256, a blob shared by several papers or versions is stored once."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _object_path(digest, suffix)
+    if not path.exists():
+        _write_atomic(path, data)
+    return digest
+
+
+def _lookup(arxiv_ids: List[str]) -> Dict[str, arxiv.Result]:
+    """Fetch the metadata of all ids in one api call, results are keyed by the id as requested."""
+    results = arxiv.Client().results(arxiv.Search(id_list=arxiv_ids, max_results=len(arxiv_ids)))
+    found = {}
+    for result in results:
+        versioned_id = result.get_short_id()
+        found[versioned_id] = result
+        found.setdefault(ARXIV_ID_PATTERN.match(versioned_id).group(1), result)
+    return found
+
+
+def _download(result: arxiv.Result) -> Dict[str, Any]:
+    response = requests.get(result.pdf_url, timeout=ARXIV_TIMEOUT)
+    response.raise_for_status()
+    pdf_digest = _put_object(response.content, ".pdf")
+    text = "".join(page.page_content for page in load_pdf_file(_object_path(pdf_digest, ".pdf")))
+
+    paper = {
+        "id": result.get_short_id(),
+        "pdf": pdf_digest,
+        "text": _put_object(text.encode("utf-8"), ".txt"),
+        "metadata": {
+            "Published": str(result.updated.date()),
+            "Title": result.title,
+            "Authors": ", ".join(a.name for a in result.authors),
+            "Summary": result.summary,
+        },
+    }
+    _write_atomic(_paper_path(paper["id"]), dumps(paper, ensure_ascii=False).encode("utf-8"))
+    return paper
+
+
+def _load_paper(arxiv_id: str, results: Dict[str, arxiv.Result]) -> Document | None:
+    try:
+        # an id without version resolves to the latest version through the api lookup
+        versioned_id = arxiv_id if ARXIV_ID_PATTERN.match(arxiv_id).group(2) else results[arxiv_id].get_short_id()
+        path = _paper_path(versioned_id)
+        if path.exists():
+            paper = loads(path.read_text(encoding="utf-8"))
+            logger.debug(f"Arxiv cache hit: {versioned_id}")
+        else:
+            paper = _download(results[arxiv_id])
+        text = _object_path(paper["text"], ".txt").read_text(encoding="utf-8")
+    except Exception as e:
+        logger.warning(f"Load arxiv paper {arxiv_id} failed: {e}")
+        return None
+    return Document(page_content=text, metadata=paper["metadata"])
+
+
+def iter_arxiv_papers(arxiv_ids: List[str], workers: int = ARXIV_CONCURRENCY) -> Iterator[Document | None]:
+    """Yield the full text of each paper in input order, None for a paper that cannot be loaded.
+
+    Papers are cached on disk by versioned id, only ids missing from the cache are downloaded, concurrently.
+    """
+    invalid = [arxiv_id for arxiv_id in arxiv_ids if not ARXIV_ID_PATTERN.match(arxiv_id)]
+    if invalid:
+        raise ValueError(f"Invalid arxiv id: {invalid}")
+
+    missing = [i for i in dict.fromkeys(arxiv_ids) if not (ARXIV_ID_PATTERN.match(i).group(2) and _paper_path(i).exists())]
+    results = {}
+    if missing:
+        try:
+            results = _lookup(missing)
+        except (arxiv.ArxivError, requests.RequestException) as e:
+            logger.warning(f"Lookup arxiv papers {missing} failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        yield from executor.map(lambda arxiv_id: _load_paper(arxiv_id, results), arxiv_ids)
@@ -0,0 +1,412 @@
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from heapq import nlargest
+from json import dumps, loads
+from pathlib import Path
+from typing import Any, Collection, Dict, List, Sequence, Tuple
+from uuid import uuid4
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import DATA_ROOT
+from src.logger import logger
+
+from .vector_store import Neo4jVector, iter_chunk_records
+
+BM25_ROOT = Path(DATA_ROOT) / "bm25"
+BM25_FORMAT = 2
+META_NAME = "index.json"
+# deleted docs stay in the postings as tombstones until they are this share of the index, which is then rewritten
+COMPACT_RATIO = 0.5
+
+# ascii words are kept whole, cjk characters are indexed one by one
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Append-only BM25 inverted index over chunk ids, postings are kept in typed arrays.
+
+    Only the `chunk_id` of a doc is kept next to the postings, a search returns chunk ids and the texts are read
+    from the store. Deleted docs are tombstoned until the index is compacted.
+
+    An index is saved as a directory of segments, a save writes the docs and deletes since the previous save
+    into a new segment and merges the trailing segments of similar size, so a save costs about the size of the
+    change and readers load only the new segments.
+
+    An index is `complete` once it holds every chunk of its knowledge base, until then searches keep using the
+    neo4j fulltext index. `job_offsets` records how many chunks of each unfinished ingestion job the index holds,
+    it is saved with the index so a resumed job knows which written chunks the saved index misses.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._vocab: Dict[str, int] = {}
+        self._posting_docs: List[array] = []
+        self._posting_freqs: List[array] = []
+        self._doc_lens = array("I")
+        self._live = bytearray()
+        self._n_live = 0
+        self._total_len = 0
+        self._chunk_ids: List[str] = []
+        self._docs_by_chunk_id: Dict[str, int] = {}
+        self.complete = False
+        self.job_offsets: Dict[str, int] = {}
+        self._segments: List[Dict[str, Any]] = []
+        self._saved_docs = 0
+        self._unsaved_deletes: List[int] = []
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._n_live
+
+    @property
+    def dirty(self) -> bool:
+        return len(self._doc_lens) > self._saved_docs or bool(self._unsaved_deletes)
+
+    def _append(self, chunk_id: str, doc_len: int) -> int:
+        doc_id = len(self._doc_lens)
+        self._doc_lens.append(doc_len)
+        self._live.append(1)
+        self._n_live += 1
+        self._total_len += doc_len
+        self._chunk_ids.append(chunk_id)
+        self._docs_by_chunk_id[chunk_id] = doc_id
+        return doc_id
+
+    def _tombstone(self, doc_id: int) -> bool:
+        if not self._live[doc_id]:
+            return False
+        self._live[doc_id] = 0
+        self._n_live -= 1
+        self._total_len -= self._doc_lens[doc_id]
+        if self._docs_by_chunk_id.get(self._chunk_ids[doc_id]) == doc_id:
+            del self._docs_by_chunk_id[self._chunk_ids[doc_id]]
+        return True
+
+    def add_documents(self, documents: Sequence[Document]) -> None:
+        """Index documents by their `chunk_id` metadata, a chunk added again replaces its earlier doc like the store does."""
+        with self._lock:
+            for doc in documents:
+                chunk_id = str(doc.metadata["chunk_id"])
+                if (old := self._docs_by_chunk_id.get(chunk_id)) is not None and self._tombstone(old):
+                    self._unsaved_deletes.append(old)
+
+                tokens = tokenize(doc.page_content)
+                doc_id = self._append(chunk_id, len(tokens))
+                for token, freq in Counter(tokens).items():
+                    term_id = self._vocab.get(token)
+                    if term_id is None:
+                        term_id = self._vocab[token] = len(self._posting_docs)
+                        self._posting_docs.append(array("I"))
+                        self._posting_freqs.append(array("H"))
+                    self._posting_docs[term_id].append(doc_id)
+                    self._posting_freqs[term_id].append(min(freq, 0xFFFF))
+
+    def delete_documents(self, chunk_ids: Collection[str]) -> int:
+        """Remove documents by their `chunk_id` metadata, return the number removed."""
+        with self._lock:
+            removed = 0
+            for chunk_id in chunk_ids:
+                doc_id = self._docs_by_chunk_id.get(chunk_id)
+                if doc_id is not None and self._tombstone(doc_id):
+                    self._unsaved_deletes.append(doc_id)
+                    removed += 1
+            return removed
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """Return the chunk ids of the top `k` docs with their scores."""
+        with self._lock:
+            if not self._n_live:
+                return []
+
+            avg_len = self._total_len / self._n_live
+            live, doc_lens = self._live, self._doc_lens
+            scores: Dict[int, float] = {}
+            for token in set(tokenize(query)):
+                term_id = self._vocab.get(token)
+                if term_id is None:
+                    continue
+                postings = [(doc_id, freq) for doc_id, freq in zip(self._posting_docs[term_id], self._posting_freqs[term_id]) if live[doc_id]]
+                idf = math.log(1 + (self._n_live - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, freq in postings:
+                    norm = self.k1 * (1 - self.b + self.b * doc_lens[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+
+            top = nlargest(k, scores.items(), key=lambda x: x[1])
+            return [(self._chunk_ids[i], score) for i, score in top]
+
+    def _compact(self) -> None:
+        """Drop the tombstoned docs and renumber the rest, the saved segments no longer match afterwards."""
+        keep = [i for i, alive in enumerate(self._live) if alive]
+        remap = {old: new for new, old in enumerate(keep)}
+        for term_id, (doc_ids, freqs) in enumerate(zip(self._posting_docs, self._posting_freqs)):
+            pairs = [(remap[doc_id], freq) for doc_id, freq in zip(doc_ids, freqs) if doc_id in remap]
+            self._posting_docs[term_id] = array("I", (doc_id for doc_id, _ in pairs))
+            self._posting_freqs[term_id] = array("H", (freq for _, freq in pairs))
+
+        self._doc_lens = array("I", (self._doc_lens[i] for i in keep))
+        self._live = bytearray(b"\x01" * len(keep))
+        self._chunk_ids = [self._chunk_ids[i] for i in keep]
+        self._docs_by_chunk_id = {chunk_id: doc_id for doc_id, chunk_id in enumerate(self._chunk_ids)}
+        self._segments, self._saved_docs, self._unsaved_deletes = [], 0, []
+
+    def _write_segment(self, directory: Path, start: int, deletes: Sequence[int]) -> Dict[str, Any]:
+        """Write the docs from `start` on with the given deletes, postings are sorted by doc id so a term is cut by bisection."""
+        terms: List[str] = []
+        offsets, doc_ids, freqs = [0], [], []
+        for term, term_id in self._vocab.items():
+            postings = self._posting_docs[term_id]
+            i = bisect_left(postings, start)
+            if i < len(postings):
+                terms.append(term)
+                doc_ids.append(np.frombuffer(postings[i:], dtype=np.uint32))
+                freqs.append(np.frombuffer(self._posting_freqs[term_id][i:], dtype=np.uint16))
+                offsets.append(offsets[-1] + len(postings) - i)
+
+        name = f"{uuid4().hex}.npz"
+        tmp_path = directory / f"{name}.tmp"
+        with tmp_path.open("wb") as f:
+            np.savez(
+                f,
+                chunk_ids=np.array(self._chunk_ids[start:], dtype=str),
+                doc_lens=np.frombuffer(self._doc_lens[start:], dtype=np.uint32),
+                terms=np.array(terms, dtype=str),
+                term_offsets=np.array(offsets, dtype=np.int64),
+                posting_docs=np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.uint32),
+                posting_freqs=np.concatenate(freqs) if freqs else np.empty(0, dtype=np.uint16),
+                deletes=np.array(deletes, dtype=np.uint32),
+            )
+        tmp_path.replace(directory / name)
+        return {"name": name, "start": start, "docs": len(self._doc_lens) - start}
+
+    def _load_segment(self, directory: Path, segment: Dict[str, Any]) -> None:
+        if segment["start"] != len(self._doc_lens):
+            raise ValueError(f"Segment {segment['name']} starts at doc {segment['start']}, the index has {len(self._doc_lens)}")
+
+        with np.load(directory / segment["name"], allow_pickle=False) as data:
+            for chunk_id, doc_len in zip(data["chunk_ids"].tolist(), data["doc_lens"].tolist()):
+                self._append(chunk_id, doc_len)
+            offsets, doc_ids, freqs = data["term_offsets"], data["posting_docs"], data["posting_freqs"]
+            for i, term in enumerate(data["terms"].tolist()):
+                term_id = self._vocab.get(term)
+                if term_id is None:
+                    term_id = self._vocab[term] = len(self._posting_docs)
+                    self._posting_docs.append(array("I"))
+                    self._posting_freqs.append(array("H"))
+                self._posting_docs[term_id].frombytes(doc_ids[offsets[i] : offsets[i + 1]].astype(np.uint32).tobytes())
+                self._posting_freqs[term_id].frombytes(freqs[offsets[i] : offsets[i + 1]].astype(np.uint16).tobytes())
+            # a merged segment repeats deletes of earlier docs, a tombstone is only counted once
+            for doc_id in data["deletes"].tolist():
+                self._tombstone(doc_id)
+
+        self._segments.append(segment)
+        self._saved_docs = len(self._doc_lens)
+
+    def _truncate(self, n_docs: int) -> None:
+        """Drop the docs from `n_docs` on, tombstones of the docs before stay as the index only ever gains them."""
+        for term_id, doc_ids in enumerate(self._posting_docs):
+            i = bisect_left(doc_ids, n_docs)
+            del doc_ids[i:]
+            del self._posting_freqs[term_id][i:]
+        for doc_id in range(n_docs, len(self._doc_lens)):
+            self._tombstone(doc_id)
+        del self._doc_lens[n_docs:]
+        del self._live[n_docs:]
+        del self._chunk_ids[n_docs:]
+        self._saved_docs = n_docs
+
+    def _write_meta(self, directory: Path) -> None:
+        meta = {
+            "format": BM25_FORMAT,
+            "k1": self.k1,
+            "b": self.b,
+            "complete": self.complete,
+            "job_offsets": self.job_offsets,
+            "segments": self._segments,
+        }
+        tmp_path = directory / f"{META_NAME}.tmp"
+        tmp_path.write_text(dumps(meta))
+        tmp_path.replace(directory / META_NAME)
+
+    def save(self, directory: Path) -> None:
+        with self._lock:
+            directory.mkdir(parents=True, exist_ok=True)
+            n_docs = len(self._doc_lens)
+            if n_docs - self._n_live > COMPACT_RATIO * n_docs:
+                self._compact()
+
+            if not self._segments and self._doc_lens:
+                self._segments = [self._write_segment(directory, 0, [])]
+            elif self.dirty:
+                self._segments.append(self._write_segment(directory, self._saved_docs, self._unsaved_deletes))
+                # merging a segment into an earlier one of no more docs keeps about log(n) segments,
+                # a merged segment holds every tombstone so none of the replaced ones is lost
+                while len(self._segments) > 1 and self._segments[-2]["docs"] <= self._segments[-1]["docs"]:
+                    merged = self._write_segment(directory, self._segments[-2]["start"], [i for i, alive in enumerate(self._live) if not alive])
+                    self._segments[-2:] = [merged]
+            self._saved_docs, self._unsaved_deletes = len(self._doc_lens), []
+            self._write_meta(directory)
+
+            # readers that still load a replaced segment retry with the new meta
+            names = {segment["name"] for segment in self._segments}
+            for path in directory.glob("*.npz"):
+                if path.name not in names:
+                    path.unlink(missing_ok=True)
+
+    @staticmethod
+    def read_meta(directory: Path) -> Dict[str, Any] | None:
+        path = directory / META_NAME
+        if not path.exists():
+            return None
+        meta = loads(path.read_text())
+        if meta.get("format") != BM25_FORMAT:
+            raise ValueError(f"Unsupported bm25 index format: {meta.get('format')}")
+        return meta
+
+    def refresh(self, directory: Path, meta: Dict[str, Any]) -> None:
+        """Catch up with the saved index, segments already loaded are kept and only the new ones are read."""
+        with self._lock:
+            loaded = [segment["name"] for segment in self._segments]
+            saved = [segment["name"] for segment in meta["segments"]]
+            common = 0
+            while common < min(len(loaded), len(saved)) and loaded[common] == saved[common]:
+                common += 1
+            if common < len(loaded):
+                self._truncate(self._segments[common]["start"])
+                del self._segments[common:]
+
+            for segment in meta["segments"][common:]:
+                self._load_segment(directory, segment)
+            self.complete = meta["complete"]
+            self.job_offsets = meta["job_offsets"]
+
+    @classmethod
+    def load(cls, directory: Path, meta: Dict[str, Any]) -> "BM25Index":
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.refresh(directory, meta)
+        return index
+
+
+_indexes: Dict[int, Tuple[BM25Index, float]] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_dir(vector_db_id: int) -> Path:
+    return BM25_ROOT / str(vector_db_id)
+
+
+def _legacy_index_path(vector_db_id: int) -> Path:
+    # indexes of the first format pickled every text and metadata, they are not read and get backfilled
+    return BM25_ROOT / f"{vector_db_id}.pkl"
+
+
+def get_bm25_index(vector_db_id: int, retries: int = 3) -> BM25Index:
+    """Get the keyword index of a knowledge base, catch up with the segments another process saved since."""
+    directory = _index_dir(vector_db_id)
+    for attempt in range(retries):
+        meta_path = directory / META_NAME
+        mtime = meta_path.stat().st_mtime if meta_path.exists() else 0.0
+
+        with _indexes_lock:
+            cached = _indexes.get(vector_db_id)
+            if cached and cached[1] >= mtime:
+                return cached[0]
+
+            try:
+                meta = BM25Index.read_meta(directory)
+                if meta is None:
+                    index = BM25Index()
+                elif cached and not cached[0].dirty:
+                    index = cached[0]
+                    index.refresh(directory, meta)
+                else:
+                    index = BM25Index.load(directory, meta)
+            except FileNotFoundError:
+                # a concurrent save replaced a segment between reading the meta and the segment
+                _indexes.pop(vector_db_id, None)
+                if attempt + 1 == retries:
+                    raise
+                continue
+            _indexes[vector_db_id] = (index, mtime)
+
+        logger.debug(f"Load bm25 index for vector_db_id: {vector_db_id}, docs: {len(index)}")
+        return index
+
+
+def get_complete_bm25_index(vector_db_id: int, vector_db: Neo4jVector, batch_size: int = 1000) -> BM25Index:
+    """Get the keyword index of a knowledge base for writing, rebuilt from the store first if it misses chunks.
+
+    Callers hold the ingestion lock of the knowledge base, the rebuilt index is saved right away.
+    """
+    index = get_bm25_index(vector_db_id)
+    if index.complete:
+        return index
+
+    index = BM25Index()
+    batch: List[Document] = []
+    for chunk_id, text, _, _ in iter_chunk_records(vector_db):
+        batch.append(Document(page_content=text, metadata={"chunk_id": chunk_id}))
+        if len(batch) >= batch_size:
+            index.add_documents(batch)
+            batch = []
+    index.add_documents(batch)
+    index.complete = True
+
+    with _indexes_lock:
+        _indexes[vector_db_id] = (index, 0.0)
+    save_bm25_index(vector_db_id)
+    _legacy_index_path(vector_db_id).unlink(missing_ok=True)
+    logger.info(f"Backfill bm25 index of vector_db_id: {vector_db_id} with {len(index)} docs from the store")
+    return index
+
+
+def save_bm25_index(vector_db_id: int) -> None:
+    directory = _index_dir(vector_db_id)
+    with _indexes_lock:
+        cached = _indexes.get(vector_db_id)
+        if not cached:
+            return
+        index = cached[0]
+        index.save(directory)
+        _indexes[vector_db_id] = (index, (directory / META_NAME).stat().st_mtime)
+
+
+def drop_bm25_index(vector_db_id: int) -> None:
+    with _indexes_lock:
+        _indexes.pop(vector_db_id, None)
+        directory = _index_dir(vector_db_id)
+        if directory.exists():
+            for path in directory.iterdir():
+                path.unlink(missing_ok=True)
+            directory.rmdir()
+        _legacy_index_path(vector_db_id).unlink(missing_ok=True)
+
+
+def list_bm25_vector_db_ids() -> List[int]:
+    return sorted({int(path.stem) for path in BM25_ROOT.iterdir() if path.stem.isdigit()}) if BM25_ROOT.exists() else []
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Tuple[Document, float]]],
+    weights: Sequence[float],
+    k: int = 60,
+) -> List[Tuple[Document, float]]:
+    """Fuse ranked lists by weighted reciprocal rank, documents are matched on source and content."""
+    fused: Dict[Tuple[str, str], Tuple[Document, float]] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, (doc, _) in enumerate(ranking):
+            key = (str(doc.metadata.get("source", "")), doc.page_content)
+            prev_doc, prev_score = fused.get(key, (doc, 0.0))
+            fused[key] = (prev_doc, prev_score + weight / (k + rank + 1))
+
+    return sorted(fused.values(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Iterable, Iterator, Set, Tuple
+
+from src.config import BROWSER_BLOCKED_RESOURCES, BROWSER_PAGE_TIMEOUT, BROWSER_POOL_SIZE
+from src.logger import logger
+
+# a context is replaced after rendering this many pages, so leaked page state does not pile up
+CONTEXT_MAX_PAGES = 50
+
+
+class _Context:
+    def __init__(self, context: Any) -> None:
+        self.context = context
+        self.pages = 0
+
+
+class BrowserPool:
+    """A long lived headless chromium with a pool of browser contexts, shared by all uploads of the process.
+
+    Playwright runs on a private event loop in a daemon thread, `render` can be called from any thread. A context
+    renders one page at a time, a `render` call keeps at most two pages per context queued.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, timeout: float = BROWSER_PAGE_TIMEOUT, blocked_resources: Iterable[str] = BROWSER_BLOCKED_RESOURCES) -> None:
+        self.size = size
+        self.timeout = timeout
+        self.blocked_resources = set(blocked_resources)
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._playwright = None
+        self._browser = None
+        self._contexts: asyncio.Queue[_Context] | None = None
+        self._browser_lock: asyncio.Lock | None = None
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True).start()
+                try:
+                    asyncio.run_coroutine_threadsafe(self._launch(), loop).result()
+                except Exception:
+                    loop.call_soon_threadsafe(loop.stop)
+                    raise
+                self._loop = loop
+            return self._loop
+
+    async def _launch(self) -> None:
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        self._browser_lock = asyncio.Lock()
+        self._contexts = asyncio.Queue()
+        for _ in range(self.size):
+            self._contexts.put_nowait(await self._new_context())
+        logger.info(f"Launch browser pool with {self.size} contexts")
+
+    async def _route(self, route: Any) -> None:
+        if route.request.resource_type in self.blocked_resources:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _new_context(self) -> _Context:
+        async with self._browser_lock:
+            if not self._browser.is_connected():
+                logger.warning("Browser of the pool is disconnected, launch it again")
+                self._browser = await self._playwright.chromium.launch(headless=True)
+        context = await self._browser.new_context()
+        await context.route("**/*", self._route)
+        return _Context(context)
+
+    async def _recycle(self, ctx: _Context) -> _Context:
+        """Replace a worn out context or one of a disconnected browser, keep the old one if that fails."""
+        if ctx.pages < CONTEXT_MAX_PAGES and self._browser.is_connected():
+            return ctx
+        try:
+            await ctx.context.close()
+        except Exception as e:
+            logger.warning(f"Close browser context failed: {e}")
+        try:
+            return await self._new_context()
+        except Exception as e:
+            # the old context still needs replacing, so it is tried again on its next use
+            logger.warning(f"Replace browser context failed: {e}")
+            return ctx
+
+    async def _render(self, url: str) -> Tuple[str, str | None]:
+        ctx = await self._contexts.get()
+        try:
+            ctx = await self._recycle(ctx)
+            page = await ctx.context.new_page()
+            try:
+                response = await page.goto(url, timeout=self.timeout * 1000)
+                if response is None or not response.ok:
+                    logger.warning(f"Render {url} failed: status {response.status if response else None}")
+                    return url, None
+                return url, await page.content()
+            finally:
+                ctx.pages += 1
+                await page.close()
+        except Exception as e:
+            logger.warning(f"Render {url} failed: {e}")
+            return url, None
+        finally:
+            # a context always goes back to the pool, even if the render is cancelled while it is replaced
+            try:
+                ctx = await self._recycle(ctx)
+            finally:
+                self._contexts.put_nowait(ctx)
+
+    def render(self, urls: Iterable[str]) -> Iterator[Tuple[str, str | None]]:
+        """Render urls concurrently and yield (url, html) in completion order, html is None if a page failed."""
+        loop = self._start()
+        pending: Set[Future] = set()
+        try:
+            for url in urls:
+                pending.add(asyncio.run_coroutine_threadsafe(self._render(url), loop))
+                if len(pending) >= self.size * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from (future.result() for future in done)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def _shutdown(self) -> None:
+        await self._browser.close()
+        await self._playwright.stop()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._loop is not None:
+                asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+
+_browser_pool: BrowserPool | None = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool()
+        return _browser_pool
+
+
+def close_browser_pool() -> None:
+    if _browser_pool is not None:
+        _browser_pool.close()
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List
 
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.documents.base import Document
@@ -7,27 +7,18 @@ from langchain_core.output_parsers.string import StrOutputParser
 from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
 from langchain_core.runnables.base import Runnable
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_openai import ChatOpenAI
 
+from src.config import CONTEXT_TOKEN_BUDGET
 from src.langchain_aris.callback import DOCUMENT_STUFFER__NAME, OUTPUT_PARSER_NAME
+from src.langchain_aris.context import build_context
 from src.langchain_aris.embedding import init_embedding
 from src.langchain_aris.llm import init_llm
 from src.langchain_aris.memory import init_history
-from src.langchain_aris.retriever import init_retriever
+from src.langchain_aris.retriever import MultiKnowledgeBaseRetriever, get_search_config, init_multi_retriever
 from src.middleware.mysql.models import EmbeddingSchema, LLMSchema
 
 
-def _stuff_documents(documents: List[Document]) -> str:
-    doc_strs = "\n---\n".join(
-        [
-            f"document {i}:\n" + "\n".join(f"{k}: {v}" for k, v in doc.metadata.items()) + f"\ncontent: {doc.page_content}"
-            for i, doc in enumerate(documents)
-        ]
-    )
-    return doc_strs
-
-
 def init_chat_chain(llm_schema: LLMSchema, temperature: float, session_id: int) -> Runnable:
     llm: ChatOpenAI = init_llm(
         llm_type=llm_schema.llm_type,
@@ -54,10 +45,10 @@ def init_chat_chain(llm_schema: LLMSchema, temperature: float, session_id: int)
 
 def init_retriever_qa_chain(
     llm_schema: LLMSchema,
-    embedding_schema: EmbeddingSchema,
+    vector_db_embedding_schemas: Dict[int, EmbeddingSchema],
     temperature: float,
     session_id: int,
-    vector_db_id,
+    context_token_budget: int = CONTEXT_TOKEN_BUDGET,
 ) -> Runnable:
     llm = init_llm(
         llm_type=llm_schema.llm_type,
@@ -68,17 +59,25 @@ def init_retriever_qa_chain(
         max_tokens=llm_schema.max_tokens,
     )
 
-    embeddings = init_embedding(
-        embedding_type=embedding_schema.embedding_type,
-        embedding_name=embedding_schema.embedding_name,
-        api_key=embedding_schema.api_key,
-        base_url=embedding_schema.base_url,
-        chunk_size=embedding_schema.chunk_size,
-    )
-
-    retriever: VectorStoreRetriever = init_retriever(
-        vector_db_id=vector_db_id,
-        embeddings=embeddings,
+    # knowledge bases bound to the same embedding model share one client
+    embeddings = {
+        embedding_schema.embedding_id: init_embedding(
+            embedding_type=embedding_schema.embedding_type,
+            embedding_name=embedding_schema.embedding_name,
+            api_key=embedding_schema.api_key,
+            base_url=embedding_schema.base_url,
+            chunk_size=embedding_schema.chunk_size,
+        )
+        for embedding_schema in vector_db_embedding_schemas.values()
+    }
+
+    search_configs = {vector_db_id: get_search_config(vector_db_id) for vector_db_id in vector_db_embedding_schemas}
+    metadata_allowlists = {vector_db_id: config["metadata_allowlist"] for vector_db_id, config in search_configs.items() if "metadata_allowlist" in config}
+    retriever: MultiKnowledgeBaseRetriever = init_multi_retriever(
+        vector_db_embeddings={
+            vector_db_id: embeddings[embedding_schema.embedding_id] for vector_db_id, embedding_schema in vector_db_embedding_schemas.items()
+        },
+        search_configs=search_configs,
     )
 
     template = "\nUse the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.\ncontext:\n{context}\n\n\nquestion:\n{user_prompt}"
@@ -91,6 +90,10 @@ def init_retriever_qa_chain(
         input_messages_key="user_prompt",
         history_messages_key="history",
     ).with_config({"configurable": {"session_id": session_id}})
+
+    def _stuff_documents(documents: List[Document]) -> str:
+        return build_context(documents, token_budget=context_token_budget, metadata_allowlists=metadata_allowlists)
+
     chain = RunnableParallel(
         {"context": retriever | RunnableLambda(_stuff_documents, name=DOCUMENT_STUFFER__NAME), "user_prompt": RunnablePassthrough()}
     ).assign(answer=chain)
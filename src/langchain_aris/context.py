@@ -0,0 +1,124 @@
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence, Set, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import CONTEXT_METADATA_ALLOWLIST, CONTEXT_TOKEN_BUDGET
+from src.logger import logger
+
+MIN_TEXT_OVERLAP = 16
+DUPLICATE_THRESHOLD = 0.85
+
+
+@lru_cache(maxsize=1)
+def get_token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"Load tiktoken encoding failed, fall back to estimated token count: {e}")
+        return lambda text: len(text) // 4 + 1
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = text.split()
+    return {tuple(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _jaccard(a: Set[Tuple[str, ...]], b: Set[Tuple[str, ...]]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _merge_text(head: str, tail: str) -> str | None:
+    """Join two chunks when the end of `head` overlaps the start of `tail`, return None if they do not overlap."""
+    if tail in head:
+        return head
+    probe = tail[:MIN_TEXT_OVERLAP]
+    if len(probe) < MIN_TEXT_OVERLAP:
+        return None
+    pos = head.find(probe)
+    while pos != -1:
+        if tail.startswith(head[pos:]):
+            return head + tail[len(head) - pos :]
+        pos = head.find(probe, pos + 1)
+    return None
+
+
+def _merge_chunks(ranked: List[Tuple[int, Document]]) -> List[Tuple[int, Document]]:
+    """Merge overlapping or adjacent chunks of one source, keeping the best rank of the merged chunks."""
+    if all("start_index" in doc.metadata for _, doc in ranked):
+        ranked = sorted(ranked, key=lambda x: x[1].metadata["start_index"])
+
+    merged: List[Tuple[int, Document]] = []
+    for rank, doc in ranked:
+        if merged:
+            prev_rank, prev_doc = merged[-1]
+            text = None
+            prev_start, start = prev_doc.metadata.get("start_index"), doc.metadata.get("start_index")
+            if prev_start is not None and start is not None:
+                prev_end = prev_start + len(prev_doc.page_content)
+                if start <= prev_end:
+                    text = prev_doc.page_content + doc.page_content[prev_end - start :]
+            else:
+                text = _merge_text(prev_doc.page_content, doc.page_content)
+
+            if text is not None:
+                merged[-1] = (min(prev_rank, rank), Document(page_content=text, metadata=prev_doc.metadata))
+                continue
+        merged.append((rank, doc))
+
+    return merged
+
+
+def _format_document(i: int, doc: Document) -> str:
+    return f"document {i}:\n" + "".join(f"{k}: {v}\n" for k, v in doc.metadata.items()) + f"content: {doc.page_content}"
+
+
+def build_context(
+    documents: Sequence[Document],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    metadata_allowlists: Dict[int, List[str]] | None = None,
+) -> str:
+    """Stuff retrieved documents into a prompt context that fits into `token_budget`.
+
+    Documents are expected in descending score order. Chunks of the same source are merged when they
+    overlap, near duplicates are dropped and metadata is projected to the allowlist of its knowledge base.
+    """
+    count_tokens = get_token_counter()
+    metadata_allowlists = metadata_allowlists or {}
+
+    groups: Dict[str, List[Tuple[int, Document]]] = {}
+    for rank, doc in enumerate(documents):
+        # start_index is relative to the page for per-page documents such as pdf
+        key = f"{doc.metadata.get('vector_db_id')}:{doc.metadata.get('source', rank)}:{doc.metadata.get('page')}"
+        groups.setdefault(key, []).append((rank, doc))
+
+    chunks = sorted((chunk for group in groups.values() for chunk in _merge_chunks(group)), key=lambda x: x[0])
+
+    kept: List[Document] = []
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    used = 0
+    for _, doc in chunks:
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, other) >= DUPLICATE_THRESHOLD for other in kept_shingles):
+            continue
+
+        allowlist = metadata_allowlists.get(doc.metadata.get("vector_db_id"), CONTEXT_METADATA_ALLOWLIST)
+        metadata = {k: doc.metadata[k] for k in allowlist if k in doc.metadata}
+        doc = Document(page_content=doc.page_content, metadata=metadata)
+
+        cost = count_tokens(_format_document(len(kept), doc))
+        if used + cost > token_budget:
+            continue
+
+        kept.append(doc)
+        kept_shingles.append(shingles)
+        used += cost
+
+    logger.debug(f"Build context with {len(kept)}/{len(documents)} documents, {used}/{token_budget} tokens")
+    return "\n---\n".join(_format_document(i, doc) for i, doc in enumerate(kept))
+
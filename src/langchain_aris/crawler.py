@@ -0,0 +1,234 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import AsyncIterator, Dict, Iterable, List, Set, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from src.config import (
+    CRAWLER_CONCURRENCY,
+    CRAWLER_DELAY,
+    CRAWLER_HOST_CONCURRENCY,
+    CRAWLER_MAX_DEPTH,
+    CRAWLER_MAX_PAGES,
+    CRAWLER_TIMEOUT,
+)
+from src.logger import logger
+
+USER_AGENT = "aris-ai-crawler"
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str, base: str | None = None) -> str | None:
+    """Resolve, drop the fragment and canonicalize scheme, host and port, return None for non http urls."""
+    url, _ = urldefrag(urljoin(base, url) if base else url)
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        netloc += f":{parts.port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+class _PageParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.links: List[str] = []
+        self.title = ""
+        self._in_title = False
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, str | None]]) -> None:
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+        elif tag == "title":
+            self._in_title = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self.title += data
+
+
+@dataclass
+class CrawledPage:
+    url: str
+    root: str
+    not_modified: bool = False
+    html: str = ""
+    title: str = ""
+    links: List[str] = field(default_factory=list)
+    validators: Dict[str, str] = field(default_factory=dict)
+
+
+class Crawler:
+    """Breadth first crawler below a root url, with a shared connection pool and per host politeness.
+
+    `cache` maps a url to its last `etag`, `last_modified` and `links`, pages are requested conditionally
+    and a 304 response is followed through the cached links.
+    """
+
+    def __init__(
+        self,
+        max_depth: int = CRAWLER_MAX_DEPTH,
+        max_pages: int = CRAWLER_MAX_PAGES,
+        concurrency: int = CRAWLER_CONCURRENCY,
+        host_concurrency: int = CRAWLER_HOST_CONCURRENCY,
+        delay: float = CRAWLER_DELAY,
+        timeout: float = CRAWLER_TIMEOUT,
+        cache: Dict[str, Dict] | None = None,
+    ) -> None:
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.delay = delay
+        self.timeout = timeout
+        self.cache = cache or {}
+        self._robots: Dict[str, RobotFileParser | None] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_next: Dict[str, float] = {}
+
+    async def _robots_for(self, client: httpx.AsyncClient, url: str) -> RobotFileParser | None:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        # tasks of the same origin wait for the first fetch instead of crawling before the rules are known
+        async with self._robots_locks.setdefault(origin, asyncio.Lock()):
+            if origin not in self._robots:
+                robots = None
+                try:
+                    response = await client.get(f"{origin}/robots.txt")
+                    if response.status_code == 200:
+                        robots = RobotFileParser()
+                        robots.parse(response.text.splitlines())
+                except httpx.HTTPError as e:
+                    logger.warning(f"Fetch robots.txt of {origin} failed: {e}")
+                self._robots[origin] = robots
+        return self._robots[origin]
+
+    async def _wait_politely(self, host: str, robots: RobotFileParser | None) -> None:
+        delay = max(self.delay, float((robots.crawl_delay(USER_AGENT) if robots else None) or 0))
+        async with self._host_locks.setdefault(host, asyncio.Lock()):
+            wait = self._host_next.get(host, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._host_next[host] = time.monotonic() + delay
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, root: str) -> CrawledPage | None:
+        robots = await self._robots_for(client, url)
+        if robots and not robots.can_fetch(USER_AGENT, url):
+            logger.debug(f"Skip {url} disallowed by robots.txt")
+            return None
+
+        host = urlsplit(url).netloc
+        cached = self.cache.get(url, {})
+        headers = {}
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with self._host_semaphores.setdefault(host, asyncio.Semaphore(self.host_concurrency)):
+            await self._wait_politely(host, robots)
+            response = await client.get(url, headers=headers)
+
+        if response.status_code == 304:
+            return CrawledPage(url=url, root=root, not_modified=True, links=cached.get("links", []), validators=cached)
+        if response.status_code != 200 or "html" not in response.headers.get("content-type", ""):
+            return None
+
+        parser = _PageParser()
+        parser.feed(response.text)
+        base = str(response.url)
+        links = [link for link in (normalize_url(href, base) for href in parser.links) if link]
+        validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        return CrawledPage(
+            url=url,
+            root=root,
+            html=response.text,
+            title=parser.title.strip(),
+            links=list(dict.fromkeys(links)),
+            validators={k: v for k, v in validators.items() if v},
+        )
+
+    async def crawl(self, roots: Iterable[str]) -> AsyncIterator[CrawledPage]:
+        """Yield pages as they are fetched, links are followed only below their root url."""
+        frontier: asyncio.Queue[Tuple[str, str, int]] = asyncio.Queue()
+        results: asyncio.Queue[CrawledPage | None] = asyncio.Queue(maxsize=self.concurrency)
+        seen: Set[str] = set()
+
+        for root in roots:
+            url = normalize_url(root)
+            if url and url not in seen:
+                seen.add(url)
+                frontier.put_nowait((url, url, 0))
+
+        async def _worker(client: httpx.AsyncClient) -> None:
+            while True:
+                url, root, depth = await frontier.get()
+                try:
+                    page = await self._fetch(client, url, root)
+                    if page is None:
+                        continue
+                    if depth < self.max_depth:
+                        prefix = root.rsplit("/", 1)[0] + "/"
+                        for link in page.links:
+                            if link.startswith(prefix) and link not in seen and len(seen) < self.max_pages:
+                                seen.add(link)
+                                frontier.put_nowait((link, root, depth + 1))
+                    await results.put(page)
+                except Exception as e:
+                    logger.warning(f"Crawl {url} failed: {e}")
+                finally:
+                    frontier.task_done()
+
+        async def _supervise(workers: List[asyncio.Task]) -> None:
+            await frontier.join()
+            for worker in workers:
+                worker.cancel()
+            await results.put(None)
+
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT}, timeout=self.timeout, limits=limits, follow_redirects=True
+        ) as client:
+            workers = [asyncio.create_task(_worker(client)) for _ in range(self.concurrency)]
+            supervisor = asyncio.create_task(_supervise(workers))
+            try:
+                while (page := await results.get()) is not None:
+                    yield page
+            finally:
+                supervisor.cancel()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(supervisor, *workers, return_exceptions=True)
+
+        logger.debug(f"Crawl {len(seen)} urls from {len(self._robots)} hosts")
+
+
+def iter_crawl(crawler: Crawler, roots: Iterable[str]) -> Iterable[CrawledPage]:
+    """Drive `Crawler.crawl` from synchronous code, crawling pauses while the consumer is busy."""
+    loop = asyncio.new_event_loop()
+    pages = crawler.crawl(roots)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(pages.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(pages.aclose())
+        loop.close()
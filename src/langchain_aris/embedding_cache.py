@@ -0,0 +1,113 @@
+import asyncio
+import sqlite3
+import threading
+from array import array
+from hashlib import sha256
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import DATA_ROOT
+from src.logger import logger
+
+EMBEDDING_CACHE_PATH = Path(DATA_ROOT) / "embedding_cache.sqlite3"
+
+# sqlite caps the number of bound parameters of a statement
+LOOKUP_BATCH = 500
+
+
+def _digest(text: str) -> bytes:
+    return sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Content-addressed vectors keyed by (embedding_id, sha256 of the text), stored as float32 blobs in sqlite."""
+
+    def __init__(self, path: Path = EMBEDDING_CACHE_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "embedding_id INTEGER NOT NULL, digest BLOB NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (embedding_id, digest)) WITHOUT ROWID"
+        )
+        self._lock = threading.Lock()
+
+    def get_many(self, embedding_id: int, digests: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        found: Dict[bytes, List[float]] = {}
+        unique = list(dict.fromkeys(digests))
+        with self._lock:
+            for i in range(0, len(unique), LOOKUP_BATCH):
+                batch = unique[i : i + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT digest, vector FROM embedding_cache WHERE embedding_id = ? AND digest IN ({','.join('?' * len(batch))})",
+                    (embedding_id, *batch),
+                )
+                for digest, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[digest] = vector.tolist()
+        return found
+
+    def put_many(self, embedding_id: int, items: Dict[bytes, List[float]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (embedding_id, digest, vector) VALUES (?, ?, ?)",
+                [(embedding_id, digest, array("f", vector).tobytes()) for digest, vector in items.items()],
+            )
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+class CachedEmbeddings(Embeddings):
+    """Embed only the texts that are not in the cache yet, identical texts in a batch are embedded once."""
+
+    def __init__(self, embedding: Embeddings, embedding_id: int, cache: EmbeddingCache | None = None) -> None:
+        self.embedding = embedding
+        self.embedding_id = embedding_id
+        self.cache = cache or get_embedding_cache()
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[bytes], Dict[bytes, List[float]], List[Tuple[bytes, str]]]:
+        digests = [_digest(text) for text in texts]
+        found = self.cache.get_many(self.embedding_id, digests)
+        missing = list({digest: text for digest, text in zip(digests, texts) if digest not in found}.items())
+        logger.debug(f"Embedding cache hit {len(texts) - len(missing)}/{len(texts)} texts of embedding_id: {self.embedding_id}")
+        return digests, found, missing
+
+    def _store(self, found: Dict[bytes, List[float]], missing: List[Tuple[bytes, str]], vectors: List[List[float]]) -> None:
+        fresh = {digest: vector for (digest, _), vector in zip(missing, vectors)}
+        if fresh:
+            self.cache.put_many(self.embedding_id, fresh)
+        found.update(fresh)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests, found, missing = self._lookup(texts)
+        if missing:
+            self._store(found, missing, self.embedding.embed_documents([text for _, text in missing]))
+        return [found[digest] for digest in digests]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.embedding.aembed_documents([text for _, text in missing])
+            await asyncio.to_thread(self._store, found, missing, vectors)
+        return [found[digest] for digest in digests]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embedding.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embedding.aembed_query(text)
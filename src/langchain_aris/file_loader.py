@@ -1,41 +1,168 @@
+import io
+import multiprocessing
+import time
+from multiprocessing.connection import Connection, wait
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, Iterator, List, Tuple
 
-from langchain_community.document_loaders import PDFMinerLoader, TextLoader
+from langchain_community.document_loaders import TextLoader
 from langchain_community.document_transformers import Html2TextTransformer
 from langchain_core.documents import Document
 
+from src.config import PARSER_TIMEOUT, PARSER_WORKERS, PDF_BACKEND
+from src.logger import logger
+
 from .transformers import Jupyter2MarkdownTransformer
 
 
-def load_upload_files(paths: List[Path]) -> List[Document]:
-    documents = []
-    for path in paths:
-        match path.suffix:
-            case ".pdf":
-                loader_cls = PDFMinerLoader
-                transformer_cls = None
-            case ".txt" | ".md":
-                loader_cls = TextLoader
-                transformer_cls = None
-            case ".html" | ".htm":
-                loader_cls = TextLoader
-                transformer_cls = Html2TextTransformer
-                trans_params = {"ignore_links": False, "ignore_images": False}
-
-            case ".ipynb":
-                loader_cls = TextLoader
-                transformer_cls = Jupyter2MarkdownTransformer
-                trans_params = {}
-            case _:
-                raise ValueError(f"Unsupported file type: {path.suffix}")
-        loader = loader_cls(file_path=str(path))
-        docs = loader.load()
-
-        if transformer_cls:
-            transformer = transformer_cls(**trans_params)
-            docs = transformer.transform_documents(docs)
-
-        documents.extend(docs)
-
-    return documents
+def _iter_pymupdf_pages(path: Path) -> Iterator[Document]:
+    import fitz
+
+    with fitz.open(path) as pdf:
+        for page in pdf:
+            yield Document(page_content=page.get_text(), metadata={"source": str(path), "page": page.number, "total_pages": pdf.page_count})
+
+
+def _iter_pdfminer_pages(path: Path) -> Iterator[Document]:
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+
+    # the document is parsed once and its pages interpreted in turn, the page tree is cheap to walk for the count
+    with path.open("rb") as f:
+        document = PDFDocument(PDFParser(f))
+        pages = list(PDFPage.create_pages(document))
+        resources = PDFResourceManager()
+        output = io.StringIO()
+        with TextConverter(resources, output, laparams=LAParams()) as device:
+            interpreter = PDFPageInterpreter(resources, device)
+            for number, page in enumerate(pages):
+                interpreter.process_page(page)
+                text = output.getvalue().rstrip("\f")
+                output.seek(0)
+                output.truncate()
+                yield Document(page_content=text, metadata={"source": str(path), "page": number, "total_pages": len(pages)})
+
+
+# pdf backends yield one document per page with a 0-based int `page` and `total_pages` in metadata
+PDF_BACKEND_MAP: Dict[str, Callable[[Path], Iterator[Document]]] = {
+    "pymupdf": _iter_pymupdf_pages,
+    "pdfminer": _iter_pdfminer_pages,
+}
+
+
+def load_pdf_file(path: Path, backend: str = PDF_BACKEND) -> Iterator[Document]:
+    iter_pages = PDF_BACKEND_MAP.get(backend)
+    if not iter_pages:
+        raise ValueError(f"Invalid PDF backend: {backend}")
+
+    for doc in iter_pages(path):
+        if doc.page_content.strip():
+            yield doc
+
+
+def load_upload_file(path: Path) -> List[Document]:
+    match path.suffix:
+        case ".pdf":
+            return list(load_pdf_file(path))
+        case ".txt" | ".md":
+            loader_cls = TextLoader
+            transformer_cls = None
+        case ".html" | ".htm":
+            loader_cls = TextLoader
+            transformer_cls = Html2TextTransformer
+            trans_params = {"ignore_links": False, "ignore_images": False}
+
+        case ".ipynb":
+            loader_cls = TextLoader
+            transformer_cls = Jupyter2MarkdownTransformer
+            trans_params = {}
+        case _:
+            raise ValueError(f"Unsupported file type: {path.suffix}")
+    loader = loader_cls(file_path=str(path))
+    docs = loader.load()
+
+    if transformer_cls:
+        transformer = transformer_cls(**trans_params)
+        docs = transformer.transform_documents(docs)
+
+    return docs
+
+
+# children are forked from a single-threaded server instead of the threaded api process, the server imports the
+# parsers once so starting a child per file stays cheap
+_mp_context = multiprocessing.get_context("forkserver")
+_mp_context.set_forkserver_preload([__name__])
+
+
+def _parse_in_child(path: Path, conn: Connection) -> None:
+    try:
+        conn.send((load_upload_file(path), None))
+    except Exception as e:
+        conn.send(([], f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def load_upload_files(paths: List[Path], workers: int = PARSER_WORKERS, timeout: float = PARSER_TIMEOUT) -> Tuple[List[Document], List[Path]]:
+    """Parse files in up to `workers` child processes, a file is killed after `timeout` seconds.
+
+    Returns the documents in the order of `paths` and the files that failed or timed out.
+    With `workers` set to 0 files are parsed in the current process without a timeout.
+    """
+    results: Dict[Path, List[Document]] = {}
+    failed: List[Path] = []
+
+    if workers <= 0:
+        for path in paths:
+            try:
+                results[path] = load_upload_file(path)
+            except Exception as e:
+                logger.error(f"Parse file: {path.name} failed: {e}")
+                failed.append(path)
+        return [doc for path in paths for doc in results.get(path, [])], failed
+
+    # a child is started per file so that a stuck one can be killed
+    ctx = _mp_context
+    pending = list(reversed(paths))
+    running: Dict[Connection, Tuple[Path, multiprocessing.Process, float]] = {}
+
+    while pending or running:
+        while pending and len(running) < workers:
+            path = pending.pop()
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=_parse_in_child, args=(path, send_conn), daemon=True)
+            process.start()
+            send_conn.close()
+            running[recv_conn] = (path, process, time.monotonic() + timeout)
+
+        next_deadline = min(deadline for _, _, deadline in running.values())
+        for conn in wait(list(running), timeout=max(0.0, next_deadline - time.monotonic())):
+            path, process, _ = running.pop(conn)
+            try:
+                docs, error = conn.recv()
+            except EOFError:
+                docs, error = [], "parser exited unexpectedly"
+            conn.close()
+            process.join()
+            if error:
+                logger.error(f"Parse file: {path.name} failed: {error}")
+                failed.append(path)
+            else:
+                results[path] = docs
+
+        now = time.monotonic()
+        for conn, (path, process, deadline) in list(running.items()):
+            if now >= deadline:
+                process.kill()
+                process.join()
+                conn.close()
+                del running[conn]
+                logger.error(f"Parse file: {path.name} timed out after {timeout}s")
+                failed.append(path)
+
+    logger.debug(f"Parse {len(paths) - len(failed)}/{len(paths)} files with {workers} workers")
+    return [doc for path in paths for doc in results.get(path, [])], failed
@@ -0,0 +1,140 @@
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+from git import GitCommandError, Repo
+from langchain_core.documents import Document
+
+from src.config import DATA_ROOT, GIT_CACHE_BUDGET
+from src.logger import logger
+
+GIT_CACHE_ROOT = Path(DATA_ROOT) / "git"
+
+CLONE_DEPTH = 1
+READ_WORKERS = 8
+
+
+def _cache_path(url: str) -> Path:
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", url.split("://")[-1]).strip("_")
+    return GIT_CACHE_ROOT / f"{name[:64]}-{hashlib.sha256(url.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _lock_path(path: Path) -> Path:
+    return path.parent / f"{path.name}.lock"
+
+
+def _sparse_patterns(suffixes: Sequence[str]) -> List[str]:
+    return [f"*.{suffix}" for suffix in suffixes]
+
+
+def _sync(url: str, path: Path, suffixes: Sequence[str]) -> Repo:
+    """Clone a blobless shallow mirror on first use, afterwards fetch the default branch into it."""
+    if (path / ".git").is_dir():
+        repo = Repo(path)
+        repo.git.sparse_checkout("set", "--no-cone", *_sparse_patterns(suffixes))
+        repo.git.fetch("--depth", str(CLONE_DEPTH), "--filter=blob:none", "origin", "HEAD")
+        repo.git.reset("--hard", "FETCH_HEAD")
+        return repo
+
+    shutil.rmtree(path, ignore_errors=True)
+    repo = Repo.clone_from(url, path, depth=CLONE_DEPTH, filter="blob:none", no_checkout=True)
+    # only files the splitter understands are checked out, their blobs are fetched on checkout
+    repo.git.sparse_checkout("set", "--no-cone", *_sparse_patterns(suffixes))
+    repo.git.checkout(repo.active_branch.name)
+    return repo
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file() and not f.is_symlink())
+
+
+def evict_git_cache(budget: int = GIT_CACHE_BUDGET, keep: Path | None = None) -> None:
+    """Remove the least recently used mirrors until the cache fits into `budget` bytes, mirrors in use are skipped."""
+    if not GIT_CACHE_ROOT.exists():
+        return
+
+    entries: List[Tuple[float, int, Path]] = []
+    for path in GIT_CACHE_ROOT.iterdir():
+        if path.is_dir():
+            lock_path = _lock_path(path)
+            last_used = lock_path.stat().st_mtime if lock_path.exists() else 0.0
+            entries.append((last_used, _dir_size(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        if path == keep:
+            continue
+        with _lock_path(path).open("a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logger.info(f"Evict git mirror: {path.name}, {size} bytes")
+
+
+@contextmanager
+def checkout_repo(url: str, suffixes: Sequence[str]) -> Iterator[Repo]:
+    """Yield an up to date checkout of `url` from the cache, the mirror is locked until the context exits."""
+    path = _cache_path(url)
+    GIT_CACHE_ROOT.mkdir(parents=True, exist_ok=True)
+    lock_path = _lock_path(path)
+
+    with lock_path.open("a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        os.utime(lock_path)
+        start = time.perf_counter()
+        try:
+            repo = _sync(url, path, suffixes)
+        except GitCommandError:
+            # a broken mirror, e.g. after an interrupted fetch, is cloned again
+            logger.warning(f"Sync git mirror of {url} failed, clone it again")
+            shutil.rmtree(path, ignore_errors=True)
+            repo = _sync(url, path, suffixes)
+        logger.debug(f"Sync git mirror of {url} at {repo.head.commit.hexsha} in {time.perf_counter() - start:.2f}s")
+        try:
+            yield repo
+        finally:
+            repo.close()
+
+    evict_git_cache(keep=path)
+
+
+def has_commit(repo: Repo, commit: str) -> bool:
+    try:
+        repo.git.cat_file("-e", f"{commit}^{{commit}}")
+        return True
+    except GitCommandError:
+        return False
+
+
+def _read_file(root: Path, rel_path: str) -> Document | None:
+    try:
+        text = (root / rel_path).read_bytes().decode("utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+    name = os.path.basename(rel_path)
+    return Document(page_content=text, metadata={"source": rel_path, "file_path": rel_path, "file_name": name, "file_type": os.path.splitext(name)[1]})
+
+
+def iter_repo_files(repo: Repo, file_filter: Callable[[str], bool]) -> Iterator[Document]:
+    """Read the checked out files matching `file_filter` with a thread pool, in `git ls-files` order."""
+    root = Path(repo.working_tree_dir)
+    paths = [p for p in repo.git.ls_files().splitlines() if file_filter(p) and (root / p).is_file()]
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        # files are read a window at a time, so a large repo is never held in memory
+        window = READ_WORKERS * 4
+        for i in range(0, len(paths), window):
+            for doc in executor.map(lambda p: _read_file(root, p), paths[i : i + window]):
+                if doc is not None:
+                    yield doc
@@ -0,0 +1,153 @@
+import asyncio
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, TypeVar
+
+from langchain_core.documents import Document
+
+from src.config import INGESTION_BATCH_SIZE, INGESTION_BATCH_TOKENS, INGESTION_EMBED_CONCURRENCY
+from src.logger import logger
+
+from .bm25 import BM25Index
+from .context import get_token_counter
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+def iter_prefetched(items: Iterable[T], maxsize: int) -> Iterator[T]:
+    """Produce `items` in a background thread into a bounded queue, so loading overlaps the consumer.
+
+    At most `maxsize` items are buffered, errors of the producer are raised in the consumer.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def _put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            for item in items:
+                if not _put(item):
+                    return
+        except Exception as e:
+            _put(e)
+        else:
+            _put(_DONE)
+
+    thread = threading.Thread(target=_produce, daemon=True)
+    thread.start()
+    try:
+        while (item := buffer.get()) is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # the producer may be blocked in a slow loader, it exits on its own at the next item
+        stopped.set()
+
+
+def iter_token_batches(documents: Iterable[Document], max_tokens: int, max_docs: int) -> Iterator[List[Document]]:
+    """Group documents into batches bounded by token count, so every embedding request has a similar cost."""
+    count_tokens = get_token_counter()
+    batch: List[Document] = []
+    tokens = 0
+    for doc in documents:
+        n_tokens = count_tokens(doc.page_content)
+        if batch and (tokens + n_tokens > max_tokens or len(batch) >= max_docs):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(doc)
+        tokens += n_tokens
+
+    if batch:
+        yield batch
+
+
+async def aingest_documents(
+    vector_store: Any,
+    keyword_index: BM25Index | None,
+    documents: Iterable[Document],
+    max_tokens: int = INGESTION_BATCH_TOKENS,
+    max_docs: int = INGESTION_BATCH_SIZE,
+    concurrency: int = INGESTION_EMBED_CONCURRENCY,
+    on_written: Callable[[int], None] | None = None,
+    bulk_writer: Any | None = None,
+) -> int:
+    """Embed batches with bounded concurrency while earlier batches are written to the store.
+
+    `vector_store` must provide `embeddings` and `add_embeddings`, e.g. Neo4jVector. Batches are written
+    in input order by a single writer, `on_written` receives the number of documents written so far.
+    With a `bulk_writer`, e.g. Neo4jBulkWriter, batches are buffered into larger writes instead.
+    """
+    embedding = vector_store.embeddings
+    semaphore = asyncio.Semaphore(concurrency)
+    pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+
+    async def _embed(batch: List[Document]) -> List[List[float]]:
+        async with semaphore:
+            return await embedding.aembed_documents([doc.page_content for doc in batch])
+
+    async def _produce() -> None:
+        # `documents` may block on redis or a loader and batching counts tokens, both run off the event loop
+        batches = iter_token_batches(documents, max_tokens, max_docs)
+        try:
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                await pending.put((batch, asyncio.create_task(_embed(batch))))
+        except Exception as e:
+            await pending.put(e)
+        else:
+            await pending.put(None)
+
+    def _write(batch: List[Document], vectors: List[List[float]] | None) -> int:
+        if bulk_writer is not None:
+            # only documents that reached the store count as written, the rest is still buffered
+            batch = bulk_writer.add(batch, vectors) if vectors is not None else bulk_writer.flush()
+        else:
+            # chunks with a manifest `chunk_id` are merged by id, so a retried batch does not duplicate them
+            ids = [doc.metadata["chunk_id"] for doc in batch] if all("chunk_id" in doc.metadata for doc in batch) else None
+            ids = vector_store.add_embeddings(texts=[doc.page_content for doc in batch], embeddings=vectors, metadatas=[doc.metadata for doc in batch], ids=ids)
+            for doc, chunk_id in zip(batch, ids):
+                doc.metadata["chunk_id"] = chunk_id
+        if keyword_index is not None:
+            keyword_index.add_documents(batch)
+        return len(batch)
+
+    producer = asyncio.create_task(_produce())
+    written = 0
+    try:
+        while (item := await pending.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            batch, task = item
+            if n_written := await asyncio.to_thread(_write, batch, await task):
+                written += n_written
+                if on_written:
+                    on_written(written)
+        # the last write flushes what the bulk writer still buffers
+        if bulk_writer is not None and (n_written := await asyncio.to_thread(_write, [], None)):
+            written += n_written
+            if on_written:
+                on_written(written)
+    finally:
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, tuple):
+                item[1].cancel()
+
+    logger.debug(f"Ingest {written} docs with {concurrency} concurrent embedding batches")
+    return written
+
+
+def ingest_documents(vector_store: Any, keyword_index: BM25Index | None, documents: Iterable[Document], **kwargs: Any) -> int:
+    """Blocking entry of `aingest_documents`."""
+    return asyncio.run(aingest_documents(vector_store, keyword_index, documents, **kwargs))
@@ -0,0 +1,177 @@
+import hashlib
+from itertools import groupby
+from json import dumps, loads
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+from langchain_core.documents import Document
+
+from src.logger import logger
+from src.middleware.redis import r
+
+
+def manifest_key(vector_db_id: int) -> str:
+    return f"vector_db:{vector_db_id}:manifest"
+
+
+def origins_key(vector_db_id: int) -> str:
+    return f"vector_db:{vector_db_id}:origins"
+
+
+def _content_hash(documents: List[Document]) -> str:
+    digest = hashlib.sha256()
+    for doc in documents:
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _chunk_id(source: str, content_hash: str, seq: int) -> str:
+    return hashlib.sha256(f"{source}\0{content_hash}\0{seq}".encode("utf-8")).hexdigest()[:32]
+
+
+class ManifestDiff:
+    """Diff an upload against the manifest of a knowledge base, which maps source -> content hash and chunk ids.
+
+    Sources are grouped by an origin, e.g. a git repo or a crawl root, sources of an origin that are not seen
+    again are removed. Origins keep their own state such as the last ingested git commit.
+    """
+
+    def __init__(self, vector_db_id: int) -> None:
+        self.vector_db_id = vector_db_id
+        self.manifest: Dict[str, Dict[str, Any]] = {k: loads(v) for k, v in r.hgetall(manifest_key(vector_db_id)).items()}
+        self.origins: Dict[str, Dict[str, Any]] = {k: loads(v) for k, v in r.hgetall(origins_key(vector_db_id)).items()}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.changed: Set[str] = set()
+        self.removed: Set[str] = set()
+        self.origin_updates: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, source: str) -> Dict[str, Any] | None:
+        return self.manifest.get(source)
+
+    def get_origin(self, origin: str) -> Dict[str, Any]:
+        return self.origins.get(origin, {})
+
+    def set_origin(self, origin: str, **state: Any) -> None:
+        self.origin_updates[origin] = {**self.get_origin(origin), **state}
+
+    def keep(self, source: str, **validators: Any) -> None:
+        """Mark a source as unchanged without loading it, e.g. on http 304 or a file untouched by a commit."""
+        if source in self.manifest and source not in self.entries:
+            self.entries[source] = {**self.manifest[source], **validators}
+
+    def keep_origin(self, origin: str) -> None:
+        for source, entry in self.manifest.items():
+            if entry.get("origin") == origin:
+                self.keep(source)
+
+    def remove(self, source: str) -> None:
+        if source in self.manifest:
+            self.removed.add(source)
+
+    def remove_unseen(self, origin: str) -> None:
+        for source, entry in self.manifest.items():
+            if entry.get("origin") == origin and source not in self.entries:
+                self.removed.add(source)
+
+    def filter(
+        self,
+        documents: Iterable[Document],
+        origin: str | None = None,
+        validators: Dict[str, Dict[str, str]] | None = None,
+    ) -> Iterator[Document]:
+        """Drop the documents of unchanged sources, documents of one source are expected to be consecutive."""
+        validators = validators or {}
+        for source, group in groupby(documents, key=lambda doc: str(doc.metadata.get("source", ""))):
+            docs = list(group)
+            content_hash = _content_hash(docs)
+            old = self.manifest.get(source)
+            if old and old["hash"] == content_hash:
+                self.entries[source] = {**old, **validators.get(source, {}), "origin": origin}
+                continue
+
+            self.entries[source] = {"hash": content_hash, "origin": origin, "chunk_ids": [], **validators.get(source, {})}
+            self.changed.add(source)
+            self.removed.discard(source)
+            yield from docs
+
+    def assign_chunk_ids(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """Give chunks of changed sources a stable `chunk_id`, which is also the node id in the store."""
+        for chunk in chunks:
+            source = str(chunk.metadata.get("source", ""))
+            entry = self.entries[source]
+            chunk.metadata["chunk_id"] = _chunk_id(source, entry["hash"], len(entry["chunk_ids"]))
+            entry["chunk_ids"].append(chunk.metadata["chunk_id"])
+            yield chunk
+
+    @property
+    def seen(self) -> int:
+        return len(self.entries)
+
+    @property
+    def stale_chunk_ids(self) -> List[str]:
+        return [chunk_id for source in self.changed | self.removed if source in self.manifest for chunk_id in self.manifest[source]["chunk_ids"]]
+
+    def patch(self) -> Dict[str, Any]:
+        entries = {source: self.entries[source] for source in self.entries if self.entries[source] != self.manifest.get(source)}
+        logger.debug(f"Manifest diff of vector_db_id: {self.vector_db_id}, changed: {len(self.changed)}, removed: {len(self.removed)}")
+        return {
+            "entries": entries,
+            "changed": sorted(self.changed),
+            "removed": sorted(self.removed),
+            "origins": self.origin_updates,
+            "stale_chunk_ids": self.stale_chunk_ids,
+        }
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """Return the patch so far and continue diffing on top of it, so a long ingestion is applied in steps."""
+        patch = self.patch()
+        self.manifest.update(patch["entries"])
+        for source in patch["removed"]:
+            self.manifest.pop(source, None)
+        self.origins.update(patch["origins"])
+        self.entries, self.changed, self.removed, self.origin_updates = {}, set(), set(), {}
+        return patch
+
+
+def rebase_manifest_patch(vector_db_id: int, patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebase a patch diffed at upload time onto the current manifest, callers hold the ingestion lock.
+
+    Stale chunk ids are taken from the current entries of changed and removed sources, so a source rewritten by
+    another job since the diff does not leave orphan chunks. Validators of an unchanged source are dropped if the
+    source was rewritten or removed since.
+    """
+    sources = [*patch["entries"], *patch["removed"]]
+    current = {source: loads(v) for source, v in zip(sources, r.hmget(manifest_key(vector_db_id), sources) if sources else []) if v}
+    changed = set(patch.get("changed", patch["entries"]))
+
+    entries: Dict[str, Dict[str, Any]] = {}
+    stale_chunk_ids: List[str] = []
+    for source, entry in patch["entries"].items():
+        old = current.get(source)
+        if source in changed:
+            entries[source] = entry
+            if old:
+                new_chunk_ids = set(entry["chunk_ids"])
+                stale_chunk_ids.extend(chunk_id for chunk_id in old["chunk_ids"] if chunk_id not in new_chunk_ids)
+        elif old and old["hash"] == entry["hash"]:
+            entries[source] = entry
+
+    removed = [source for source in patch["removed"] if source in current]
+    for source in removed:
+        stale_chunk_ids.extend(current[source]["chunk_ids"])
+    return {**patch, "entries": entries, "removed": removed, "stale_chunk_ids": stale_chunk_ids}
+
+
+def apply_manifest_patch(vector_db_id: int, patch: Dict[str, Any]) -> None:
+    pipe = r.pipeline()
+    if patch["entries"]:
+        pipe.hset(manifest_key(vector_db_id), mapping={k: dumps(v, ensure_ascii=False) for k, v in patch["entries"].items()})
+    if patch["removed"]:
+        pipe.hdel(manifest_key(vector_db_id), *patch["removed"])
+    if patch["origins"]:
+        pipe.hset(origins_key(vector_db_id), mapping={k: dumps(v, ensure_ascii=False) for k, v in patch["origins"].items()})
+    pipe.execute()
+
+
+def drop_manifest(vector_db_id: int) -> None:
+    r.delete(manifest_key(vector_db_id), origins_key(vector_db_id))
@@ -1,26 +1,235 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps, loads
+from typing import Any, Dict, List, Sequence, Tuple
+
 from langchain_community.vectorstores.neo4j_vector import Neo4jVector, SearchType
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import OpenAIEmbeddings
+from redis import Redis
 
-from src.config import NEO4J_HOST, NEO4J_PASSWORD, NEO4J_PORT
+from src.config import RETRIEVER_CACHE_TTL, RETRIEVER_TIMEOUT, RETRIEVER_WORKERS
 from src.logger import logger
 
+from .bm25 import BM25Index, get_bm25_index, reciprocal_rank_fusion
+from .vector_store import get_chunks, init_vector_store
+
+# searches of every request share one bounded pool, a search that outlives its deadline holds a worker of the pool
+# until it returns instead of a thread of its own
+_search_executor = ThreadPoolExecutor(max_workers=RETRIEVER_WORKERS, thread_name_prefix="retriever")
+
+
+def _redis() -> Redis:
+    # the client pings redis on import, so offline users of the retrievers such as the benchmarks import it on first use
+    from src.middleware.redis import r
+
+    return r
+
+
+def get_vector_db_version(vector_db_id: int) -> int:
+    return int(_redis().get(f"vector_db:{vector_db_id}:version") or 0)
+
+
+def bump_vector_db_version(vector_db_id: int) -> int:
+    """Invalidate every cached retrieval of the knowledge base, old entries expire by ttl."""
+    return _redis().incr(f"vector_db:{vector_db_id}:version")
+
+
+def search_config_key(vector_db_id: int) -> str:
+    return f"vector_db:{vector_db_id}:search"
+
+
+def get_search_config(vector_db_id: int) -> Dict[str, Any]:
+    """Per knowledge base search settings, i.e. the rank fusion weights and the `metadata_allowlist` of the context."""
+    return {k: loads(v) for k, v in _redis().hgetall(search_config_key(vector_db_id)).items()}
+
+
+def update_search_config(vector_db_id: int, config: Dict[str, Any]) -> None:
+    if config:
+        _redis().hset(search_config_key(vector_db_id), mapping={k: dumps(v, ensure_ascii=False) for k, v in config.items()})
+
+
+def drop_search_config(vector_db_id: int) -> None:
+    _redis().delete(search_config_key(vector_db_id))
+
+
+class KnowledgeBaseRetriever(BaseRetriever):
+    """Vector search from the store fused with keyword search from the local bm25 index."""
+
+    vector_store: VectorStore
+    keyword_index: BM25Index | None = None
+    vector_db_id: int | None = None
+    k: int = 4
+    fetch_k: int = 20
+    vector_weight: float = 1.0
+    keyword_weight: float = 1.0
+    rrf_k: int = 60
+    cache_ttl: int = RETRIEVER_CACHE_TTL
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _cache_key(self, query: str, version: int) -> str:
+        params = dumps([query, self.k, self.fetch_k, self.vector_weight, self.keyword_weight, self.rrf_k], ensure_ascii=False)
+        digest = hashlib.sha256(params.encode("utf-8")).hexdigest()
+        return f"retrieval:{self.vector_db_id}:v{version}:{digest}"
+
+    def search_with_scores(self, query: str) -> List[Tuple[Document, float]]:
+        if self.vector_db_id is None or self.cache_ttl <= 0:
+            return self._search_with_scores(query)
+
+        try:
+            redis_key = self._cache_key(query, get_vector_db_version(self.vector_db_id))
+            cached = _redis().get(redis_key)
+        except Exception as e:
+            logger.warning(f"Read retrieval cache failed: {e}")
+            return self._search_with_scores(query)
 
-def init_retriever(vector_db_id: int, embeddings: OpenAIEmbeddings, **search_kwargs) -> VectorStoreRetriever:
+        if cached is not None:
+            logger.debug(f"Hit retrieval cache for vector_db_id: {self.vector_db_id}")
+            return [(Document(page_content=text, metadata=metadata), score) for text, metadata, score in loads(cached)]
+
+        hits = self._search_with_scores(query)
+        try:
+            _redis().set(redis_key, dumps([(doc.page_content, doc.metadata, score) for doc, score in hits], ensure_ascii=False, default=str), ex=self.cache_ttl)
+        except Exception as e:
+            logger.warning(f"Write retrieval cache failed: {e}")
+        return hits
+
+    def _resolve(self, hits: List[Tuple[str, float]]) -> List[Tuple[Document, float]]:
+        """Read the chunks of keyword hits from the store, the keyword index only keeps their ids."""
+        chunk_ids = [chunk_id for chunk_id, _ in hits]
+        if isinstance(self.vector_store, Neo4jVector):
+            documents = get_chunks(self.vector_store, chunk_ids)
+        else:
+            documents = self.vector_store.get_by_ids(chunk_ids)
+        scores = dict(hits)
+        return [(doc, scores[doc.metadata["chunk_id"]]) for doc in documents]
+
+    def _search_with_scores(self, query: str) -> List[Tuple[Document, float]]:
+        if self.keyword_index is None or not len(self.keyword_index):
+            return self.vector_store.similarity_search_with_score(query, k=self.k)
+
+        vector_hits = self.vector_store.similarity_search_with_score(query, k=self.fetch_k)
+        keyword_hits = self._resolve(self.keyword_index.search(query, k=self.fetch_k))
+        fused = reciprocal_rank_fusion([vector_hits, keyword_hits], [self.vector_weight, self.keyword_weight], k=self.rrf_k)
+        return fused[: self.k]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query)]
+
+
+def _normalize_scores(hits: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """Min-max normalize scores so hits from different knowledge bases are comparable."""
+    if not hits:
+        return hits
+    scores = [score for _, score in hits]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [(doc, 1.0) for doc, _ in hits]
+    return [(doc, (score - low) / (high - low)) for doc, score in hits]
+
+
+class MultiKnowledgeBaseRetriever(BaseRetriever):
+    """Query several knowledge bases concurrently and merge their hits by normalized score."""
+
+    retrievers: Dict[int, KnowledgeBaseRetriever]
+    k: int = 4
+    timeout: float = RETRIEVER_TIMEOUT
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _merge(self, results: Dict[int, List[Tuple[Document, float]] | BaseException]) -> List[Document]:
+        merged: List[Tuple[Document, float]] = []
+        for vector_db_id, hits in results.items():
+            if isinstance(hits, BaseException):
+                logger.warning(f"Retrieve from vector_db_id: {vector_db_id} failed: {hits!r}")
+                continue
+            for doc, score in _normalize_scores(hits):
+                doc.metadata["vector_db_id"] = vector_db_id
+                merged.append((doc, score))
+
+        merged.sort(key=lambda x: x[1], reverse=True)
+        return [doc for doc, _ in merged[: self.k]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        results: Dict[int, List[Tuple[Document, float]] | BaseException] = {}
+        futures = {vector_db_id: _search_executor.submit(r.search_with_scores, query) for vector_db_id, r in self.retrievers.items()}
+        # all searches start together, so one deadline bounds every knowledge base by the same timeout
+        deadline = time.monotonic() + self.timeout
+        for vector_db_id, future in futures.items():
+            try:
+                results[vector_db_id] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                results[vector_db_id] = e
+        # searches still queued behind a busy pool are dropped, running ones finish in the background
+        for future in futures.values():
+            future.cancel()
+        return self._merge(results)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        vector_db_ids = list(self.retrievers)
+        loop = asyncio.get_running_loop()
+        hits = await asyncio.gather(
+            *[asyncio.wait_for(loop.run_in_executor(_search_executor, self.retrievers[i].search_with_scores, query), self.timeout) for i in vector_db_ids],
+            return_exceptions=True,
+        )
+        return self._merge(dict(zip(vector_db_ids, hits)))
+
+
+def init_retriever(
+    vector_db_id: int,
+    embeddings: OpenAIEmbeddings,
+    vector_weight: float = 1.0,
+    keyword_weight: float = 1.0,
+    **search_kwargs,
+) -> KnowledgeBaseRetriever:
     try:
-        node_label = f"knowledge_base:{vector_db_id}"
-        vector_db = Neo4jVector(
-            username="neo4j",
-            url=f"bolt://{NEO4J_HOST}:{NEO4J_PORT}",
-            password=NEO4J_PASSWORD,
-            node_label=node_label,
-            search_type=SearchType.HYBRID,
-            embedding=embeddings,
+        keyword_index = get_bm25_index(vector_db_id)
+        # until the local index is backfilled with the chunks ingested before it, the neo4j fulltext index is used
+        search_type = SearchType.VECTOR if keyword_index.complete else SearchType.HYBRID
+
+        vector_db = init_vector_store(vector_db_id, embeddings, search_type)
+        retriever = KnowledgeBaseRetriever(
+            vector_store=vector_db,
+            keyword_index=keyword_index if keyword_index.complete else None,
+            vector_db_id=vector_db_id,
+            vector_weight=vector_weight,
+            keyword_weight=keyword_weight,
+            **search_kwargs,
         )
-        retriever = vector_db.as_retriever(search_kwargs=search_kwargs)
 
     except Exception as e:
         raise ValueError(f"Failed to init retriever: {e}")
 
-    logger.debug(f"Init retriever with search kwargs: {search_kwargs}")
+    logger.debug(f"Init retriever with search kwargs: {search_kwargs}, weights: vector={vector_weight}, keyword={keyword_weight}")
     return retriever
+
+
+def init_multi_retriever(
+    vector_db_embeddings: Dict[int, OpenAIEmbeddings],
+    k: int = 4,
+    timeout: float = RETRIEVER_TIMEOUT,
+    search_configs: Dict[int, Dict[str, Any]] | None = None,
+    **retriever_kwargs,
+) -> MultiKnowledgeBaseRetriever:
+    """Init one retriever per knowledge base, each bound to its own embedding model and fusion weights."""
+    vector_db_ids: Sequence[int] = list(vector_db_embeddings)
+    search_configs = search_configs or {}
+
+    def _init(vector_db_id: int) -> KnowledgeBaseRetriever:
+        weights = {name: search_configs[vector_db_id][name] for name in ["vector_weight", "keyword_weight"] if name in search_configs.get(vector_db_id, {})}
+        return init_retriever(vector_db_id, vector_db_embeddings[vector_db_id], k=k, **{**retriever_kwargs, **weights})
+
+    with ThreadPoolExecutor(max_workers=len(vector_db_ids) or 1) as executor:
+        retrievers = executor.map(_init, vector_db_ids)
+        retrievers = dict(zip(vector_db_ids, retrievers))
+
+    logger.debug(f"Init multi retriever over vector_db_ids: {list(vector_db_ids)}, timeout: {timeout}s")
+    return MultiKnowledgeBaseRetriever(retrievers=retrievers, k=k, timeout=timeout)
@@ -0,0 +1,240 @@
+import gzip
+import io
+import queue
+import threading
+import zipfile
+from json import dumps, loads
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+from langchain_community.vectorstores.neo4j_vector import Neo4jVector, SearchType
+from langchain_core.documents import Document
+
+from src.config import DATA_ROOT
+from src.logger import logger
+
+from .bm25 import BM25Index
+from .manifest import ManifestDiff
+from .vector_store import Neo4jBulkWriter, init_vector_store, iter_chunk_records
+
+SNAPSHOT_ROOT = Path(DATA_ROOT) / "snapshots"
+SNAPSHOT_FORMAT = 1
+# rows per shard, vectors of a shard are filled into one float32 array, about 60MB at 1536d
+SNAPSHOT_SHARD_SIZE = 10000
+# bytes per block of a streamed export, and blocks buffered ahead of a slow download
+STREAM_BLOCK_SIZE = 1024 * 1024
+STREAM_BUFFER_BLOCKS = 16
+
+INFO_NAME = "snapshot.json"
+MANIFEST_NAME = "manifest.json.gz"
+
+
+def _vectors_name(shard: int) -> str:
+    return f"vectors/{shard:05d}.npy"
+
+
+def _chunks_name(shard: int) -> str:
+    return f"chunks/{shard:05d}.jsonl.gz"
+
+
+class _SnapshotWriter:
+    def __init__(self, bundle: zipfile.ZipFile) -> None:
+        self.bundle = bundle
+        self.shards: List[int] = []
+        self.dim = 0
+
+    def write_shard(self, chunks: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+        shard = len(self.shards)
+        self.dim = vectors.shape[1]
+        # vectors are stored raw so they can be read without inflating, text and metadata compress well
+        with self.bundle.open(_vectors_name(shard), "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, vectors, allow_pickle=False)
+        payload = "".join(dumps(chunk, ensure_ascii=False, default=str) + "\n" for chunk in chunks)
+        self.bundle.writestr(_chunks_name(shard), gzip.compress(payload.encode("utf-8"), compresslevel=6))
+        self.shards.append(len(chunks))
+
+
+def export_snapshot(vector_db_id: int, embedding_name: str, path: Path | BinaryIO, shard_size: int = SNAPSHOT_SHARD_SIZE) -> int:
+    """Write the chunks, metadata, vectors and manifest of a knowledge base into a snapshot bundle, return the chunk count.
+
+    The bundle is a zip of float32 `.npy` shards and gzipped jsonl shards of id, text and metadata in the same order.
+    `path` may also be an unseekable file, the bundle is then written front to back.
+    """
+    vector_db = init_vector_store(vector_db_id, None, SearchType.VECTOR)
+    diff = ManifestDiff(vector_db_id)
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as bundle:
+        writer = _SnapshotWriter(bundle)
+        chunks: List[Dict[str, Any]] = []
+        vectors: np.ndarray | None = None
+        for chunk_id, text, metadata, embedding in iter_chunk_records(vector_db):
+            if vectors is None:
+                vectors = np.empty((shard_size, len(embedding)), dtype=np.float32)
+            vectors[len(chunks)] = embedding
+            chunks.append({"id": chunk_id, "text": text, "metadata": metadata})
+            if len(chunks) >= shard_size:
+                writer.write_shard(chunks, vectors)
+                chunks = []
+        if chunks:
+            writer.write_shard(chunks, vectors[: len(chunks)])
+
+        manifest = {"manifest": diff.manifest, "origins": diff.origins}
+        bundle.writestr(MANIFEST_NAME, gzip.compress(dumps(manifest, ensure_ascii=False).encode("utf-8")))
+        info = {
+            "format": SNAPSHOT_FORMAT,
+            "vector_db_id": vector_db_id,
+            "embedding_name": embedding_name,
+            "dim": writer.dim,
+            "count": sum(writer.shards),
+            "shards": writer.shards,
+        }
+        bundle.writestr(INFO_NAME, dumps(info))
+
+    logger.info(f"Export {info['count']} chunks of vector_db_id: {vector_db_id}")
+    return info["count"]
+
+
+class _BlockWriter(io.RawIOBase):
+    """Unseekable file that hands what is written to a bounded queue in blocks of `STREAM_BLOCK_SIZE`."""
+
+    def __init__(self, blocks: queue.Queue, stopped: threading.Event) -> None:
+        super().__init__()
+        self.blocks = blocks
+        self.stopped = stopped
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def put(self, item: Any) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise BrokenPipeError("Snapshot stream is closed by the reader")
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        if len(self.buffer) >= STREAM_BLOCK_SIZE:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def flush_blocks(self) -> None:
+        if self.buffer:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def stream_snapshot(vector_db_id: int, embedding_name: str, shard_size: int = SNAPSHOT_SHARD_SIZE) -> Iterator[bytes]:
+    """Yield the bytes of a snapshot bundle while it is exported in a background thread, so a download starts at once.
+
+    The export is stopped if the reader goes away, errors of the export are raised in the reader.
+    """
+    blocks: queue.Queue = queue.Queue(maxsize=STREAM_BUFFER_BLOCKS)
+    stopped = threading.Event()
+    writer = _BlockWriter(blocks, stopped)
+    done = object()
+
+    def _export() -> None:
+        try:
+            export_snapshot(vector_db_id, embedding_name, writer, shard_size)
+            writer.flush_blocks()
+            writer.put(done)
+        except BrokenPipeError:
+            return
+        except Exception as e:
+            logger.error(f"Export snapshot of vector_db_id: {vector_db_id} failed: {e}")
+            try:
+                writer.put(e)
+            except BrokenPipeError:
+                return
+
+    threading.Thread(target=_export, name=f"snapshot-export-{vector_db_id}", daemon=True).start()
+    try:
+        while (block := blocks.get()) is not done:
+            if isinstance(block, Exception):
+                raise block
+            yield block
+    finally:
+        stopped.set()
+
+
+def read_snapshot_info(path: Path) -> Dict[str, Any]:
+    """Read the header of a snapshot bundle, raise ValueError if it is not one."""
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            info = loads(bundle.read(INFO_NAME))
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise ValueError(f"Not a snapshot bundle: {e}")
+    if info.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {info.get('format')}")
+    return info
+
+
+def read_snapshot_manifest(path: Path) -> Dict[str, Any]:
+    """The manifest of a snapshot as a patch for `apply_manifest_patch`."""
+    with zipfile.ZipFile(path) as bundle:
+        manifest = loads(gzip.decompress(bundle.read(MANIFEST_NAME)))
+    return {"entries": manifest["manifest"], "removed": [], "origins": manifest["origins"]}
+
+
+def iter_snapshot_shards(path: Path, start: int = 0) -> Iterator[Tuple[List[Document], np.ndarray]]:
+    """Yield the documents of each shard with their vectors, skipping the first `start` chunks."""
+    info = read_snapshot_info(path)
+    offset = 0
+    with zipfile.ZipFile(path) as bundle:
+        for shard, count in enumerate(info["shards"]):
+            if offset + count <= start:
+                offset += count
+                continue
+
+            with bundle.open(_vectors_name(shard)) as f:
+                vectors = np.lib.format.read_array(f, allow_pickle=False)
+            with bundle.open(_chunks_name(shard)) as f:
+                lines = io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding="utf-8")
+                chunks = [loads(line) for line in lines]
+            if len(chunks) != count or len(vectors) != count:
+                raise ValueError(f"Snapshot shard {shard} has {len(chunks)} chunks and {len(vectors)} vectors, expected {count}")
+
+            # the chunk id is also the node id, so the manifest of the snapshot stays valid
+            documents = [Document(page_content=chunk["text"], metadata={**chunk["metadata"], "chunk_id": chunk["id"]}) for chunk in chunks]
+            skip = max(0, start - offset)
+            offset += count
+            yield documents[skip:], vectors[skip:]
+
+
+def import_snapshot(
+    vector_db: Neo4jVector,
+    keyword_index: BM25Index | None,
+    path: Path,
+    start: int = 0,
+    on_written: Callable[[int], None] | None = None,
+) -> int:
+    """Write the chunks of a snapshot through the bulk writer, no embedding is computed. Return the number written.
+
+    Chunks are merged by id, so an interrupted import can be resumed at `start` or run again. `on_written` receives
+    the number of chunks written by this call so far.
+    """
+    writer = Neo4jBulkWriter(vector_db)
+    written = 0
+
+    def _written(documents: List[Document]) -> None:
+        nonlocal written
+        if not documents:
+            return
+        if keyword_index is not None:
+            keyword_index.add_documents(documents)
+        written += len(documents)
+        if on_written:
+            on_written(written)
+
+    for documents, vectors in iter_snapshot_shards(path, start):
+        _written(writer.add(documents, vectors))
+    _written(writer.flush())
+
+    logger.info(f"Import {written} chunks from {path} into {vector_db.node_label}")
+    return written
@@ -1,10 +1,37 @@
-from typing import List
+import multiprocessing
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Deque, Dict, Iterable, Iterator, List, Sequence, Tuple
 
 from langchain_core.documents import Document
 
 from langchain.text_splitter import Language, RecursiveCharacterTextSplitter
+from src.config import SPLITTER_WORKERS
 from src.logger import logger
 
+from .context import get_token_counter
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+# langchain writes the heading and rule separators of markdown and rst as regexes, every other separator is literal
+REGEX_SEPARATORS = {
+    "\n#{1,6} ",
+    "\n\\*\\*\\*+\n",
+    "\n---+\n",
+    "\n___+\n",
+    "\n=+\n",
+    "\n-+\n",
+    "\n\\*+\n",
+    "\n\n.. *\n\n",
+}
+
+# documents per task of the process pool, the first batch is always split inline
+SPLIT_BATCH = 64
+
 SUFFIX_LANGUAGE_MAP = {
     "cpp": Language.CPP,
     "h": Language.CPP,
@@ -33,29 +60,161 @@ SUFFIX_LANGUAGE_MAP = {
 }
 
 
-def split_documents(documents: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
-    splitted_documents = []
-
-    for doc in documents:
-        params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+class RecursiveTokenSplitter:
+    """Recursive separator splitter measuring chunks in tokens.
 
-        source: str = doc.metadata.get("source", ".")
+    Pieces are kept as offsets into the text, so a chunk is copied out of the text once when it is emitted.
+    Separators are literal except the patterns in `REGEX_SEPARATORS`, and stay attached to the start of the following piece.
+    """
 
-        if source.split(".")[-1] in SUFFIX_LANGUAGE_MAP:
-            splitter_cls = RecursiveCharacterTextSplitter
-            suffix = source.split(".")[-1]
-            params.update({"separators": splitter_cls.get_separators_for_language(SUFFIX_LANGUAGE_MAP[suffix])})
+    def __init__(self, separators: Sequence[str], chunk_size: int, chunk_overlap: int) -> None:
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._patterns = [re.compile(separator if separator in REGEX_SEPARATORS else re.escape(separator)) for separator in separators if separator]
+        self._count_tokens = get_token_counter()
 
-        elif any([source.startswith(prefix) for prefix in ["https://", "http://", "www."]]):
-            splitter_cls = RecursiveCharacterTextSplitter
-            params.update({"separators": splitter_cls.get_separators_for_language(SUFFIX_LANGUAGE_MAP["md"])})
+    def _hard_split(self, text: str, start: int, end: int, n_tokens: int) -> List[Tuple[int, int, int]]:
+        """Cut a piece without any separator into windows of about `chunk_size` tokens."""
+        width = max(1, (end - start) * self.chunk_size // max(n_tokens, 1))
+        return [(i, min(i + width, end), self._count_tokens(text[i : min(i + width, end)])) for i in range(start, end, width)]
 
+    def _split_spans(self, text: str, start: int, end: int, patterns: Sequence[re.Pattern]) -> List[Tuple[int, int, int]]:
+        for i, pattern in enumerate(patterns):
+            bounds = [m.start() for m in pattern.finditer(text, start, end) if m.start() > start]
+            if bounds:
+                break
         else:
-            splitter_cls = RecursiveCharacterTextSplitter
+            return self._hard_split(text, start, end, self._count_tokens(text[start:end]))
+
+        spans = []
+        for piece_start, piece_end in zip([start, *bounds], [*bounds, end]):
+            n_tokens = self._count_tokens(text[piece_start:piece_end])
+            if n_tokens <= self.chunk_size:
+                spans.append((piece_start, piece_end, n_tokens))
+            elif i + 1 < len(patterns):
+                spans.extend(self._split_spans(text, piece_start, piece_end, patterns[i + 1 :]))
+            else:
+                spans.extend(self._hard_split(text, piece_start, piece_end, n_tokens))
+        return spans
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Return the (start, end) offsets of the chunks, consecutive chunks overlap by up to `chunk_overlap` tokens."""
+        n_tokens = self._count_tokens(text)
+        spans = [(0, len(text), n_tokens)] if n_tokens <= self.chunk_size else self._split_spans(text, 0, len(text), self._patterns)
+
+        chunks = []
+        window: Deque[Tuple[int, int, int]] = deque()
+        total = 0
+        for span in spans:
+            if window and total + span[2] > self.chunk_size:
+                chunks.append((window[0][0], window[-1][1]))
+                while window and (total > self.chunk_overlap or total + span[2] > self.chunk_size):
+                    total -= window.popleft()[2]
+            window.append(span)
+            total += span[2]
+
+        if window:
+            chunks.append((window[0][0], window[-1][1]))
+        return chunks
+
+
+def _chunk_documents(doc: Document, spans: List[Tuple[int, int]]) -> List[Document]:
+    chunks = []
+    for start, end in spans:
+        chunk = doc.page_content[start:end]
+        stripped = chunk.strip()
+        if stripped:
+            chunks.append(Document(page_content=stripped, metadata={**doc.metadata, "start_index": start + len(chunk) - len(chunk.lstrip())}))
+    return chunks
+
+
+def _language_of(source: str) -> Language | None:
+    suffix = source.rsplit(".", 1)[-1]
+    if suffix in SUFFIX_LANGUAGE_MAP and not source.endswith("/"):
+        return SUFFIX_LANGUAGE_MAP[suffix]
+    if any(source.startswith(prefix) for prefix in ["https://", "http://", "www."]):
+        return SUFFIX_LANGUAGE_MAP["md"]
+    return None
+
+
+@lru_cache(maxsize=128)
+def get_splitter(language: Language | None, chunk_size: int, chunk_overlap: int) -> RecursiveTokenSplitter:
+    separators = RecursiveCharacterTextSplitter.get_separators_for_language(language) if language else DEFAULT_SEPARATORS
+    return RecursiveTokenSplitter(separators, chunk_size, chunk_overlap)
+
+
+def _split_batch(documents: List[Tuple[str, str]], chunk_size: int, chunk_overlap: int) -> List[List[Tuple[int, int]]]:
+    """Split (source, text) pairs into chunk offsets, only offsets travel back from the process pool."""
+    return [get_splitter(_language_of(source), chunk_size, chunk_overlap).split_spans(text) for source, text in documents]
+
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """A long-lived pool per size shared by all callers, replaced once a crashed worker broke it.
+
+    Workers come from a forkserver, forking the threaded api process could copy a held lock into them.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None or pool._broken:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+        return pool
+
+
+def iter_split_documents(documents: Iterable[Document], chunk_size: int, chunk_overlap: int, workers: int = SPLITTER_WORKERS) -> Iterator[Document]:
+    """Split documents into chunks of at most `chunk_size` tokens, in input order.
+
+    Large inputs are split by a process pool with a bounded number of batches in flight, so a stream of
+    documents is never materialized.
+    """
+    documents = iter(documents)
+    n_documents, n_chunks = 0, 0
+
+    def _batches() -> Iterator[List[Document]]:
+        while batch := list(islice(documents, SPLIT_BATCH)):
+            yield batch
+
+    def _payload(batch: List[Document]) -> List[Tuple[str, str]]:
+        return [(doc.metadata.get("source", "."), doc.page_content) for doc in batch]
+
+    def _chunks(batch: List[Document], spans: List[List[Tuple[int, int]]]) -> Iterator[Document]:
+        nonlocal n_documents, n_chunks
+        for doc, doc_spans in zip(batch, spans):
+            chunks = _chunk_documents(doc, doc_spans)
+            n_documents += 1
+            n_chunks += len(chunks)
+            yield from chunks
+
+    batches = _batches()
+    first = next(batches, None)
+    if first is None:
+        return
+    yield from _chunks(first, _split_batch(_payload(first), chunk_size, chunk_overlap))
+
+    if workers > 1:
+        executor = _get_pool(workers)
+        pending: Deque[Tuple[List[Document], Future]] = deque()
+        try:
+            for batch in batches:
+                pending.append((batch, executor.submit(_split_batch, _payload(batch), chunk_size, chunk_overlap)))
+                if len(pending) >= workers * 2:
+                    batch, future = pending.popleft()
+                    yield from _chunks(batch, future.result())
+            while pending:
+                batch, future = pending.popleft()
+                yield from _chunks(batch, future.result())
+        finally:
+            for _, future in pending:
+                future.cancel()
+    else:
+        for batch in batches:
+            yield from _chunks(batch, _split_batch(_payload(batch), chunk_size, chunk_overlap))
+
+    logger.debug(f"Split {n_documents} documents into {n_chunks} documents")
 
-        splitter = splitter_cls(**params)
-        splitted_doc = splitter.split_documents([doc])
-        splitted_documents.extend(splitted_doc)
 
-    logger.debug(f"Split {len(documents)} documents into {len(splitted_documents)} documents")
-    return splitted_documents
+def split_documents(documents: Iterable[Document], chunk_size: int, chunk_overlap: int, workers: int = SPLITTER_WORKERS) -> List[Document]:
+    return list(iter_split_documents(documents, chunk_size, chunk_overlap, workers))
@@ -1,26 +1,75 @@
-from typing import Any, Sequence
+import json
+import re
+from typing import Any, Dict, Iterator, List, Sequence
 
 from langchain_core.documents import Document
 from langchain_core.documents.transformers import BaseDocumentTransformer
 
+from src.config import NOTEBOOK_MAX_OUTPUT_CHARS
+
+ANSI_ESCAPE_PATTERN = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+# mime types of rich outputs tried in order, images and widgets are never emitted
+OUTPUT_MIME_TYPES = ["text/markdown", "text/plain"]
+
+
+def _text(source: str | List[str]) -> str:
+    return "".join(source) if isinstance(source, list) else source
+
 
 class Jupyter2MarkdownTransformer(BaseDocumentTransformer):
+    """Convert notebooks to markdown by walking the cells of the notebook json.
+
+    Markdown cells are kept as they are and code cells become fenced blocks followed by their text outputs,
+    base64 images are dropped and each output is cut at `max_output_chars`, 0 drops all outputs.
+    """
+
+    def __init__(self, max_output_chars: int = NOTEBOOK_MAX_OUTPUT_CHARS) -> None:
+        self.max_output_chars = max_output_chars
+
+    def _iter_outputs(self, outputs: List[Dict[str, Any]]) -> Iterator[str]:
+        for output in outputs:
+            match output.get("output_type"):
+                case "stream":
+                    text = _text(output.get("text", ""))
+                case "execute_result" | "display_data" | "pyout":
+                    data = output.get("data", output)
+                    if any(mime.startswith("image/") for mime in data) and "text/markdown" not in data:
+                        # the text/plain of a figure is a repr such as <Figure size 640x480>
+                        continue
+                    text = next((_text(data[mime]) for mime in OUTPUT_MIME_TYPES if mime in data), "")
+                case "error" | "pyerr":
+                    text = ANSI_ESCAPE_PATTERN.sub("", f"{output.get('ename', '')}: {output.get('evalue', '')}")
+                case _:
+                    continue
+
+            text = text.strip("\n")
+            if len(text) > self.max_output_chars:
+                text = f"{text[: self.max_output_chars]}\n... [truncated]"
+            if text:
+                yield "\n".join(f"    {line}" for line in text.splitlines())
+
+    def convert(self, content: str) -> str:
+        notebook = json.loads(content)
+        # nbformat 3 keeps the cells in worksheets
+        cells = notebook.get("cells") or [cell for worksheet in notebook.get("worksheets", []) for cell in worksheet.get("cells", [])]
+        language = notebook.get("metadata", {}).get("language_info", {}).get("name") or notebook.get("metadata", {}).get("kernelspec", {}).get("language", "")
+
+        blocks = []
+        for cell in cells:
+            source = _text(cell.get("source", cell.get("input", ""))).strip("\n")
+            match cell.get("cell_type"):
+                case "markdown":
+                    if source:
+                        blocks.append(source)
+                case "heading":
+                    blocks.append(f"{'#' * cell.get('level', 1)} {source}")
+                case "code":
+                    if source:
+                        blocks.append(f"```{language}\n{source}\n```")
+                    if self.max_output_chars > 0:
+                        blocks.extend(self._iter_outputs(cell.get("outputs", [])))
+        return "\n\n".join(blocks) + "\n"
+
     def transform_documents(self, documents: Sequence[Document], **kwargs: Any) -> Sequence[Document]:
-        try:
-            import nbformat
-            from nbconvert import MarkdownExporter
-        except ImportError:
-            raise ImportError(
-                """nbformat or nbconvert package not found, please
-                install it with `pip install nbformat nbconvert`"""
-            )
-
-        new_documents = []
-        for d in documents:
-            notebook = nbformat.reads(d.page_content, as_version=4)
-            markdown_exporter = MarkdownExporter()
-            markdown, _ = markdown_exporter.from_notebook_node(notebook)
-            new_document = Document(page_content=markdown, metadata={**d.metadata})
-            new_documents.append(new_document)
-
-        return new_documents
+        return [Document(page_content=self.convert(d.page_content), metadata={**d.metadata}) for d in documents]
@@ -1,20 +1,44 @@
 import re
-from datetime import datetime
-from typing import List
+from typing import Dict, Iterator, List, Literal
 
-from altair import Literal
-from langchain_community.document_loaders import ArxivLoader, GitLoader, RecursiveUrlLoader, PlaywrightURLLoader
+import requests
+from langchain_community.document_loaders import RecursiveUrlLoader
 from langchain_community.document_transformers import Html2TextTransformer
 from langchain_core.documents import Document
 
 from src.logger import logger
 
+from .arxiv_cache import iter_arxiv_papers
+from .browser_pool import get_browser_pool
+from .crawler import Crawler, iter_crawl
+from .git_cache import checkout_repo, has_commit, iter_repo_files
+from .manifest import ManifestDiff
 from .text_splitter import SUFFIX_LANGUAGE_MAP
 
+VALIDATOR_TIMEOUT = 10
 
-def _load_from_arxiv(urls: List[str]) -> List[Document]:
+
+def _fetch_validators(url: str) -> Dict[str, str]:
+    """Fetch the http cache validators of a url, empty if the server sends none."""
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=VALIDATOR_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"Fetch validators of {url} failed: {e}")
+        return {}
+    if not response.ok:
+        return {}
+
+    validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    return {k: v for k, v in validators.items() if v}
+
+
+def _filter(docs: Iterator[Document], diff: ManifestDiff | None, **kwargs) -> Iterator[Document]:
+    return diff.filter(docs, **kwargs) if diff is not None else docs
+
+
+def _load_from_arxiv(urls: List[str], diff: ManifestDiff | None = None) -> Iterator[Document]:
     def _match_arxiv_url(url: str) -> str:
-        _match = re.match(r"(https://|http://|)(www\.|)arxiv.org/abs/(\d+\.\d+)", url, re.IGNORECASE)
+        _match = re.match(r"(https://|http://|)(www\.|)arxiv.org/abs/(\d+\.\d+(v\d+)?)", url, re.IGNORECASE)
 
         if not _match:
             raise ValueError(f"Invalid arxiv url: {url}")
@@ -22,17 +46,16 @@ def _load_from_arxiv(urls: List[str]) -> List[Document]:
 
         return url
 
-    documents = []
-
-    for url in urls:
-        url = _match_arxiv_url(url)
-        loader = ArxivLoader(query=url)
-        documents.extend(loader.load())
-
-    return documents
+    arxiv_ids = [_match_arxiv_url(url) for url in urls]
+    docs = (
+        Document(page_content=doc.page_content, metadata={"source": url, **doc.metadata})
+        for url, doc in zip(urls, iter_arxiv_papers(arxiv_ids))
+        if doc is not None
+    )
+    yield from _filter(docs, diff)
 
 
-def _load_from_git(urls: List[str]) -> List[Document]:
+def _load_from_git(urls: List[str], diff: ManifestDiff | None = None) -> Iterator[Document]:
     def _match_git_url(url: str) -> str:
         _match = re.match(r"(https://|http://|)(www\.|)(github|gitee).com/([^/]+/[^/]+)", url, re.IGNORECASE)
 
@@ -41,50 +64,136 @@ def _load_from_git(urls: List[str]) -> List[Document]:
         url = _match.group(4)
         return url
 
-    documents = []
+    def _support_file(path: str) -> bool:
+        return any(path.endswith(suffix) for suffix in SUFFIX_LANGUAGE_MAP)
+
     for url in urls:
         repo_url = _match_git_url(url)
         url = url[: url.rfind(repo_url) + len(repo_url)]
-        temp_repo_path = f"./github_repos/{repo_url}/{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        loader = GitLoader(
-            clone_url=url, repo_path=temp_repo_path, branch="master", file_filter=lambda x: any(x.endswith(suffix) for suffix in SUFFIX_LANGUAGE_MAP)
-        )
-        documents.extend(loader.load())
-
-    return documents
-
-
-def _load_from_playwright(urls: List[str]) -> List[Document]:
-    loader = PlaywrightURLLoader(urls=urls)
-    documents = loader.load()
-
-    return documents
-
-
-def _load_from_recursive(urls: List[str]) -> List[Document]:
-    documents = []
+        with checkout_repo(url, list(SUFFIX_LANGUAGE_MAP)) as repo:
+            head = repo.head.commit.hexsha
+            file_filter = _support_file
+
+            if diff is not None:
+                last_commit = diff.get_origin(url).get("commit")
+                diff.set_origin(url, commit=head)
+                if last_commit == head:
+                    logger.debug(f"Skip unchanged git repo: {url} at {head}")
+                    diff.keep_origin(url)
+                    continue
+
+                if last_commit and has_commit(repo, last_commit):
+                    # only files touched since the last ingested commit are loaded
+                    diff.keep_origin(url)
+                    changed = set()
+                    for line in repo.git.diff("--name-status", "--no-renames", last_commit, head).splitlines():
+                        status, path = line.split("\t", 1)
+                        if status == "D":
+                            diff.remove(f"{repo_url}/{path}")
+                        else:
+                            changed.add(path)
+
+                    def file_filter(path: str, changed=changed) -> bool:
+                        return _support_file(path) and path in changed
+
+            # file paths are prefixed with the repo, so that files of several repos do not collide
+            docs = (
+                Document(page_content=doc.page_content, metadata={**doc.metadata, "source": f"{repo_url}/{doc.metadata['source']}"})
+                for doc in iter_repo_files(repo, file_filter)
+            )
+            yield from _filter(docs, diff, origin=url)
+        if diff is not None:
+            diff.remove_unseen(url)
+
+
+def _load_from_playwright(urls: List[str], diff: ManifestDiff | None = None) -> Iterator[Document]:
+    validators = {}
+    if diff is not None:
+        pending = []
+        for url in urls:
+            validators[url] = _fetch_validators(url)
+            entry = diff.get(url)
+            if validators[url] and entry and all(entry.get(k) == v for k, v in validators[url].items()):
+                diff.keep(url)
+            else:
+                pending.append(url)
+        urls = pending
+
+    if not urls:
+        return
+
+    from unstructured.partition.html import partition_html
+
+    def _docs() -> Iterator[Document]:
+        for url, html in get_browser_pool().render(urls):
+            if html is not None:
+                text = "\n\n".join(str(el) for el in partition_html(text=html))
+                yield Document(page_content=text, metadata={"source": url})
+
+    yield from _filter(_docs(), diff, validators=validators)
+
+
+def _load_from_recursive(urls: List[str], diff: ManifestDiff | None = None) -> Iterator[Document]:
+    transformer = Html2TextTransformer(ignore_links=False, ignore_images=False)
     for url in urls:
         loader = RecursiveUrlLoader(url=url, max_depth=2)
-        documents.extend(loader.load())
-
-    transformer = Html2TextTransformer(ignore_links=False, ignore_images=False)
-    documents = transformer.transform_documents(documents)
-
-    return documents
+        docs = (doc for page in loader.lazy_load() for doc in transformer.transform_documents([page]))
+        yield from _filter(docs, diff, origin=url)
+        if diff is not None:
+            diff.remove_unseen(url)
 
 
-def load_upload_urls(urls: List[str], url_type: Literal["arxiv", "git", "playwright", "recursive"]) -> List[Document]:
+def _load_from_crawl(urls: List[str], diff: ManifestDiff | None = None) -> Iterator[Document]:
+    transformer = Html2TextTransformer(ignore_links=False, ignore_images=False)
+    crawler = Crawler(cache=diff.manifest if diff is not None else None)
+    crawled_roots = set()
+    for page in iter_crawl(crawler, urls):
+        if page.url == page.root:
+            crawled_roots.add(page.root)
+        if page.not_modified:
+            if diff is not None:
+                diff.keep(page.url)
+            continue
+        # the links are cached with the validators, so an unchanged page can still be followed on a re-crawl
+        validators = {page.url: {**page.validators, "links": page.links}}
+        docs = transformer.transform_documents([Document(page_content=page.html, metadata={"source": page.url, "title": page.title})])
+        yield from _filter(docs, diff, origin=page.root, validators=validators)
+
+    if diff is not None:
+        for root in crawled_roots:
+            diff.remove_unseen(root)
+
+
+def iter_upload_urls(
+    urls: List[str],
+    url_type: Literal["arxiv", "git", "playwright", "recursive", "crawl"],
+    diff: ManifestDiff | None = None,
+) -> Iterator[Document]:
+    """Yield documents one by one as they are fetched, nothing is kept once it has been consumed.
+
+    With a `diff`, only documents of new or changed sources are yielded and the diff records the rest.
+    """
     match url_type:
         case "arxiv":
-            docs = _load_from_arxiv(urls)
+            docs = _load_from_arxiv(urls, diff)
         case "git":
-            docs = _load_from_git(urls)
+            docs = _load_from_git(urls, diff)
         case "playwright":
-            docs = _load_from_playwright(urls)
+            docs = _load_from_playwright(urls, diff)
         case "recursive":
-            docs = _load_from_recursive(urls)
+            docs = _load_from_recursive(urls, diff)
+        case "crawl":
+            docs = _load_from_crawl(urls, diff)
         case _:
             raise ValueError(f"Unsupported url type: {url_type}")
 
-    logger.debug(f"Loaded {len(docs)} documents from {url_type} {len(urls)} urls")
-    return docs
+    count = 0
+    for doc in docs:
+        count += 1
+        yield doc
+
+    logger.debug(f"Loaded {count} documents from {url_type} {len(urls)} urls")
+
+
+def load_upload_urls(urls: List[str], url_type: Literal["arxiv", "git", "playwright", "recursive", "crawl"]) -> List[Document]:
+    return list(iter_upload_urls(urls, url_type))
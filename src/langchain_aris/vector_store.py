@@ -0,0 +1,380 @@
+import math
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Literal, Sequence, Set, Tuple
+
+from langchain_community.vectorstores.neo4j_vector import Neo4jVector, SearchType, remove_lucene_chars
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from src.config import NEO4J_BULK_BATCH_BYTES, NEO4J_HOST, NEO4J_PASSWORD, NEO4J_PORT, VECTOR_STORE_LAYOUT
+from src.logger import logger
+
+# a bolt float takes a marker byte and 8 bytes
+FLOAT_BYTES = 9
+ROW_OVERHEAD_BYTES = 64
+# the byte budget of a batch is tuned so a transaction takes about this long
+BULK_TARGET_SECONDS = 1.0
+BULK_MIN_BATCH_BYTES = 256 * 1024
+
+# the shared layout keeps the chunks of every knowledge base under one label, filtered by `vector_db_id`
+SHARED_LABEL = "knowledge_base"
+SHARED_FULLTEXT_INDEX = "knowledge_base_fulltext"
+# knowledge bases up to this many chunks are searched exactly through the `vector_db_id` index
+SHARED_EXACT_SEARCH_MAX = 20000
+SHARED_MAX_FETCH = 10000
+
+
+def knowledge_base_label(vector_db_id: int) -> str:
+    return f"knowledge_base:{vector_db_id}"
+
+
+def shared_vector_label(dim: int) -> str:
+    # a vector index has a fixed dimension, so knowledge bases share one index per embedding dimension
+    return f"knowledge_base_{dim}d"
+
+
+def shared_vector_index(dim: int) -> str:
+    return f"knowledge_base_vector_{dim}d"
+
+
+_schema_lock = threading.Lock()
+_shared_schemas: Set[int] = set()
+
+
+def ensure_shared_schema(vector_db: Neo4jVector, dim: int) -> None:
+    """Create the indexes of the shared layout for an embedding dimension once per process."""
+    with _schema_lock:
+        if dim in _shared_schemas:
+            return
+        emb, text = vector_db.embedding_node_property, vector_db.text_node_property
+        for query in [
+            f"CREATE INDEX knowledge_base_vector_db_id IF NOT EXISTS FOR (c:`{SHARED_LABEL}`) ON (c.vector_db_id)",
+            f"CREATE INDEX knowledge_base_chunk_key IF NOT EXISTS FOR (c:`{SHARED_LABEL}`) ON (c.vector_db_id, c.id)",
+            f"CREATE FULLTEXT INDEX {SHARED_FULLTEXT_INDEX} IF NOT EXISTS FOR (c:`{SHARED_LABEL}`) ON EACH [c.`{text}`]",
+            f"CREATE VECTOR INDEX {shared_vector_index(dim)} IF NOT EXISTS FOR (c:`{shared_vector_label(dim)}`) ON (c.`{emb}`) "
+            f"OPTIONS {{indexConfig: {{`vector.dimensions`: {dim}, `vector.similarity_function`: 'cosine'}}}}",
+        ]:
+            vector_db.query(query)
+        _shared_schemas.add(dim)
+
+
+class SharedNeo4jVector(Neo4jVector):
+    """Neo4jVector over the shared layout, every query is filtered to the chunks of one knowledge base.
+
+    Small knowledge bases are scored exactly, larger ones through the shared vector index, oversampled by the
+    share of the index they hold.
+    """
+
+    def __init__(self, vector_db_id: int, **kwargs: Any) -> None:
+        super().__init__(node_label=SHARED_LABEL, keyword_index_name=SHARED_FULLTEXT_INDEX, **kwargs)
+        self.vector_db_id = vector_db_id
+        self._n_chunks: int | None = None
+
+    def _count(self, pattern: str) -> int:
+        return self.query(f"MATCH (c:{pattern}) RETURN count(c) AS n", params={"vector_db_id": self.vector_db_id})[0]["n"]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        params: Dict[str, Any] = {},
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        dim, emb = len(embedding), self.embedding_node_property
+        if self._n_chunks is None:
+            self._n_chunks = self._count(f"`{SHARED_LABEL}` {{vector_db_id: $vector_db_id}}")
+        if not self._n_chunks:
+            return []
+
+        filtered = "WHERE node.vector_db_id = $vector_db_id WITH node, score ORDER BY score DESC LIMIT $k "
+        if self._n_chunks <= SHARED_EXACT_SEARCH_MAX:
+            fetch_k = k
+            vector_query = (
+                f"MATCH (node:`{SHARED_LABEL}` {{vector_db_id: $vector_db_id}}) WHERE node.`{emb}` IS NOT NULL "
+                f"WITH node, vector.similarity.cosine(node.`{emb}`, $embedding) AS score ORDER BY score DESC LIMIT $k "
+            )
+        else:
+            fetch_k = min(SHARED_MAX_FETCH, max(k, math.ceil(2 * k * self._count(f"`{shared_vector_label(dim)}`") / self._n_chunks)))
+            vector_query = "CALL db.index.vector.queryNodes($index, $fetch_k, $embedding) YIELD node, score " + filtered
+
+        if self.search_type == SearchType.HYBRID:
+            keyword_fetch_k = min(SHARED_MAX_FETCH, max(k, math.ceil(2 * k * self._count(f"`{SHARED_LABEL}`") / self._n_chunks)))
+            read_query = (
+                "CALL { "
+                f"{vector_query}"
+                "WITH collect({node:node, score:score}) AS nodes, max(score) AS max "
+                "UNWIND nodes AS n RETURN n.node AS node, (n.score / max) AS score UNION "
+                "CALL db.index.fulltext.queryNodes($keyword_index, $query, {limit: $keyword_fetch_k}) YIELD node, score "
+                f"{filtered}"
+                "WITH collect({node:node, score:score}) AS nodes, max(score) AS max "
+                "UNWIND nodes AS n RETURN n.node AS node, (n.score / max) AS score "
+                "} "
+                "WITH node, max(score) AS score ORDER BY score DESC LIMIT $k "
+            )
+        else:
+            read_query, keyword_fetch_k = vector_query, 0
+
+        read_query += (
+            f"RETURN node.`{self.text_node_property}` AS text, score, "
+            f"node {{.*, `{self.text_node_property}`: Null, `{emb}`: Null, id: Null}} AS metadata"
+        )
+        parameters = {
+            "vector_db_id": self.vector_db_id,
+            "index": shared_vector_index(dim),
+            "k": k,
+            "fetch_k": fetch_k,
+            "keyword_fetch_k": keyword_fetch_k,
+            "embedding": embedding,
+            "keyword_index": self.keyword_index_name,
+            "query": remove_lucene_chars(kwargs.get("query", "")),
+            **params,
+        }
+        results = self.query(read_query, params=parameters)
+        return [(Document(page_content=row["text"], metadata={k: v for k, v in row["metadata"].items() if v is not None}), row["score"]) for row in results]
+
+    def add_embeddings(
+        self,
+        texts: Sequence[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict] | None = None,
+        ids: List[str] | None = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        ids = ids or [str(uuid.uuid1()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=text, metadata={**metadata, "chunk_id": id}) for text, metadata, id in zip(texts, metadatas, ids)]
+        writer = Neo4jBulkWriter(self)
+        writer.add(documents, embeddings)
+        writer.flush()
+        return ids
+
+
+class _StoreOnlyEmbeddings(Embeddings):
+    """Stand-in for store-only access, e.g. purges or writes of precomputed vectors, Neo4jVector embeds a probe on init."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise RuntimeError("Vector store was initialized without an embedding")
+
+    def embed_query(self, text: str) -> List[float]:
+        return []
+
+
+def init_vector_store(
+    vector_db_id: int,
+    embeddings: OpenAIEmbeddings | None,
+    search_type: SearchType = SearchType.HYBRID,
+    layout: Literal["label", "shared"] = VECTOR_STORE_LAYOUT,
+) -> Neo4jVector:
+    """Init the neo4j store of a knowledge base, with its own label or in the shared layout.
+
+    Without `embeddings` the store can only be written with precomputed vectors, queried by cypher or purged.
+    """
+    params = {"username": "neo4j", "url": f"bolt://{NEO4J_HOST}:{NEO4J_PORT}", "password": NEO4J_PASSWORD, "search_type": search_type}
+    params["embedding"] = embeddings if embeddings is not None else _StoreOnlyEmbeddings()
+    if layout == "shared":
+        return SharedNeo4jVector(vector_db_id, **params)
+    return Neo4jVector(node_label=knowledge_base_label(vector_db_id), **params)
+
+
+def delete_chunks(vector_db: Neo4jVector, chunk_ids: Sequence[str], batch_size: int = 1000) -> int:
+    """Delete chunk nodes of a knowledge base by id, return the number of nodes deleted."""
+    if isinstance(vector_db, SharedNeo4jVector):
+        pattern, params = f"(c:`{SHARED_LABEL}` {{vector_db_id: $vector_db_id, id: id}})", {"vector_db_id": vector_db.vector_db_id}
+    else:
+        pattern, params = f"(c:`{vector_db.node_label}` {{id: id}})", {}
+    deleted = 0
+    for i in range(0, len(chunk_ids), batch_size):
+        query = f"UNWIND $ids AS id MATCH {pattern} DETACH DELETE c RETURN count(*) AS deleted"
+        deleted += vector_db.query(query, params={"ids": list(chunk_ids[i : i + batch_size]), **params})[0]["deleted"]
+    return deleted
+
+
+def get_chunks(vector_db: Neo4jVector, chunk_ids: Sequence[str]) -> List[Document]:
+    """Read chunks of a knowledge base by id in the given order with their `chunk_id` metadata, ids not in the store are skipped."""
+    text, emb = vector_db.text_node_property, vector_db.embedding_node_property
+    if isinstance(vector_db, SharedNeo4jVector):
+        pattern, params = f"(c:`{SHARED_LABEL}` {{vector_db_id: $vector_db_id, id: id}})", {"vector_db_id": vector_db.vector_db_id}
+    else:
+        pattern, params = f"(c:`{vector_db.node_label}` {{id: id}})", {}
+    query = (
+        f"UNWIND $ids AS id MATCH {pattern} "
+        f"RETURN c.id AS id, c.`{text}` AS text, c {{.*, `{text}`: Null, `{emb}`: Null, id: Null}} AS metadata"
+    )
+    rows = {row["id"]: row for row in vector_db.query(query, params={"ids": list(chunk_ids), **params})}
+    return [
+        Document(page_content=rows[chunk_id]["text"], metadata={**{k: v for k, v in rows[chunk_id]["metadata"].items() if v is not None}, "chunk_id": chunk_id})
+        for chunk_id in chunk_ids
+        if chunk_id in rows
+    ]
+
+
+def iter_chunk_records(vector_db: Neo4jVector, fetch_size: int = 1000) -> Iterator[Tuple[str, str, Dict[str, Any], List[float]]]:
+    """Stream (id, text, metadata, embedding) of every chunk of a knowledge base in either layout."""
+    text, emb = vector_db.text_node_property, vector_db.embedding_node_property
+    if isinstance(vector_db, SharedNeo4jVector):
+        pattern, params = f"(c:`{SHARED_LABEL}` {{vector_db_id: $vector_db_id}})", {"vector_db_id": vector_db.vector_db_id}
+    else:
+        pattern, params = f"(c:`{vector_db.node_label}`)", {}
+    query = (
+        f"MATCH {pattern} WHERE c.`{emb}` IS NOT NULL "
+        f"RETURN c.id AS id, c.`{text}` AS text, c.`{emb}` AS embedding, "
+        f"c {{.*, `{text}`: Null, `{emb}`: Null, id: Null, vector_db_id: Null}} AS metadata"
+    )
+    with vector_db._driver.session(database=vector_db._database, fetch_size=fetch_size) as neo4j_session:
+        for record in neo4j_session.run(query, params):
+            yield record["id"], record["text"], {k: v for k, v in record["metadata"].items() if v is not None}, record["embedding"]
+
+
+def drop_label_indexes(vector_db: Neo4jVector, label: str) -> List[str]:
+    """Drop every index on a label, return their names."""
+    names = [row["name"] for row in vector_db.query("SHOW INDEXES YIELD name, labelsOrTypes WHERE $label IN labelsOrTypes RETURN name", params={"label": label})]
+    for name in names:
+        vector_db.query(f"DROP INDEX `{name}` IF EXISTS")
+        logger.info(f"Drop index {name} of label {label}")
+    return names
+
+
+def iter_purge_knowledge_base(vector_db_id: int, batch_size: int = 1000) -> Iterator[int]:
+    """Delete every chunk of a knowledge base in either layout, one transaction per batch, yield the count of each batch.
+
+    The indexes of its own label are dropped once the label is empty.
+    """
+    vector_db = init_vector_store(vector_db_id, None, SearchType.VECTOR, layout="label")
+    label = vector_db.node_label
+    for pattern in [f"(c:`{label}`)", f"(c:`{SHARED_LABEL}` {{vector_db_id: $vector_db_id}})"]:
+        query = f"MATCH {pattern} WITH c LIMIT $batch_size DETACH DELETE c RETURN count(*) AS deleted"
+        with vector_db._driver.session(database=vector_db._database) as neo4j_session:
+            while n := neo4j_session.execute_write(lambda tx: tx.run(query, batch_size=batch_size, vector_db_id=vector_db_id).single()["deleted"]):
+                yield n
+    drop_label_indexes(vector_db, label)
+
+
+def list_stored_vector_db_ids() -> Set[int]:
+    """Ids of the knowledge bases with chunks in neo4j, from their own labels and from the shared layout."""
+    vector_db = init_vector_store(0, None, SearchType.VECTOR, layout="label")
+    labels = [row["label"] for row in vector_db.query("CALL db.labels() YIELD label RETURN label")]
+    vector_db_ids = {int(m.group(1)) for label in labels if (m := re.fullmatch(r"knowledge_base:(\d+)", label))}
+    if SHARED_LABEL in labels:
+        rows = vector_db.query(f"MATCH (c:`{SHARED_LABEL}`) WHERE c.vector_db_id IS NOT NULL RETURN DISTINCT c.vector_db_id AS vector_db_id")
+        vector_db_ids.update(row["vector_db_id"] for row in rows)
+    return vector_db_ids
+
+
+def migrate_to_shared_layout(vector_db_id: int, batch_size: int = 5000, drop_indexes: bool = True) -> int:
+    """Move the chunks of a knowledge base from its own label into the shared layout, return the number moved.
+
+    Nodes are relabeled in place one transaction per batch, so an interrupted migration can be run again.
+    """
+    vector_db = init_vector_store(vector_db_id, None, SearchType.VECTOR, layout="label")
+    label, emb = vector_db.node_label, vector_db.embedding_node_property
+    found = vector_db.query(f"MATCH (c:`{label}`) WHERE c.`{emb}` IS NOT NULL RETURN size(c.`{emb}`) AS dim LIMIT 1")
+    if not found:
+        logger.info(f"No chunk to migrate of vector_db_id: {vector_db_id}")
+        return 0
+
+    dim = found[0]["dim"]
+    ensure_shared_schema(vector_db, dim)
+    query = (
+        f"MATCH (c:`{label}`) WITH c LIMIT $batch_size "
+        f"SET c:`{SHARED_LABEL}`:`{shared_vector_label(dim)}`, c.vector_db_id = $vector_db_id REMOVE c:`{label}` "
+        "RETURN count(c) AS moved"
+    )
+    moved = 0
+    with vector_db._driver.session(database=vector_db._database) as neo4j_session:
+        while n := neo4j_session.execute_write(lambda tx: tx.run(query, batch_size=batch_size, vector_db_id=vector_db_id).single()["moved"]):
+            moved += n
+            logger.debug(f"Migrate {moved} chunks of vector_db_id: {vector_db_id}")
+
+    if drop_indexes:
+        drop_label_indexes(vector_db, label)
+
+    logger.info(f"Migrate {moved} chunks of vector_db_id: {vector_db_id} into the shared layout")
+    return moved
+
+
+class Neo4jBulkWriter:
+    """Write chunks with their embeddings into the store of a knowledge base in large UNWIND batches.
+
+    Rows are buffered until they fill a byte budget and each batch is written in one explicit transaction,
+    the budget follows the measured throughput so a transaction stays around `BULK_TARGET_SECONDS`.
+    Rows with the same id are merged, so a retried batch does not duplicate chunks.
+    """
+
+    def __init__(self, vector_db: Neo4jVector, batch_bytes: int = NEO4J_BULK_BATCH_BYTES) -> None:
+        self.vector_db = vector_db
+        self.max_batch_bytes = batch_bytes
+        self.batch_bytes = batch_bytes
+        self._rows: List[Dict[str, Any]] = []
+        self._documents: List[Document] = []
+        self._bytes = 0
+
+    def _query(self, dim: int) -> Tuple[str, Dict[str, Any]]:
+        vector_db = self.vector_db
+        if isinstance(vector_db, SharedNeo4jVector):
+            ensure_shared_schema(vector_db, dim)
+            merge = f"MERGE (c:`{SHARED_LABEL}` {{vector_db_id: $vector_db_id, id: row.id}}) SET c:`{shared_vector_label(dim)}` "
+            params = {"vector_db_id": vector_db.vector_db_id}
+        else:
+            merge, params = f"MERGE (c:`{vector_db.node_label}` {{id: row.id}}) ", {}
+        query = (
+            "UNWIND $rows AS row "
+            f"{merge}"
+            f"SET c.`{vector_db.text_node_property}` = row.text, c += row.metadata "
+            "WITH c, row "
+            f"CALL db.create.setVectorProperty(c, '{vector_db.embedding_node_property}', row.embedding) "
+            "YIELD node "
+            "RETURN count(node) AS written"
+        )
+        return query, params
+
+    @staticmethod
+    def _row_bytes(row: Dict[str, Any]) -> int:
+        metadata_bytes = sum(len(str(k)) + len(str(v)) for k, v in row["metadata"].items())
+        return len(row["text"].encode("utf-8")) + len(row["embedding"]) * FLOAT_BYTES + metadata_bytes + ROW_OVERHEAD_BYTES
+
+    def _write(self, rows: List[Dict[str, Any]]) -> Tuple[int, float]:
+        query, params = self._query(len(rows[0]["embedding"]))
+        start = time.perf_counter()
+        with self.vector_db._driver.session(database=self.vector_db._database) as neo4j_session:
+            written = neo4j_session.execute_write(lambda tx: tx.run(query, rows=rows, **params).single()["written"])
+        return written, time.perf_counter() - start
+
+    def flush(self) -> List[Document]:
+        """Write the buffered rows, return their documents."""
+        if not self._rows:
+            return []
+
+        rows, documents, n_bytes = self._rows, self._documents, self._bytes
+        self._rows, self._documents, self._bytes = [], [], 0
+        written, seconds = self._write(rows)
+        if written != len(rows):
+            raise ValueError(f"Bulk write of {len(rows)} rows into {self.vector_db.node_label} wrote {written} rows")
+
+        if seconds > 0:
+            self.batch_bytes = int(min(self.max_batch_bytes, max(BULK_MIN_BATCH_BYTES, n_bytes / seconds * BULK_TARGET_SECONDS)))
+        logger.debug(f"Bulk write {len(rows)} rows, {n_bytes} bytes in {seconds:.2f}s, next batch {self.batch_bytes} bytes")
+        return documents
+
+    def add(self, documents: Sequence[Document], embeddings: Sequence[Sequence[float]]) -> List[Document]:
+        """Buffer documents with their embeddings, return the documents written by this call."""
+        written = []
+        for doc, embedding in zip(documents, embeddings):
+            # the keyword index refers to chunks by id, so a chunk without one gets it before it is written
+            doc.metadata["chunk_id"] = doc.metadata.get("chunk_id") or str(uuid.uuid1())
+            row = {
+                "id": doc.metadata["chunk_id"],
+                "text": doc.page_content,
+                "metadata": doc.metadata,
+                # plain python floats are packed as a bolt list of floats, e.g. numpy scalars are not
+                "embedding": embedding.tolist() if hasattr(embedding, "tolist") else [float(x) for x in embedding],
+            }
+            self._rows.append(row)
+            self._documents.append(doc)
+            self._bytes += self._row_bytes(row)
+            if self._bytes >= self.batch_bytes:
+                written.extend(self.flush())
+        return written
@@ -0,0 +1,77 @@
+import re
+from typing import List, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.logger import logger
+
+# boundaries and part headers of a multipart body on top of the file contents
+MULTIPART_OVERHEAD = 1024 * 1024
+
+
+class BodyLimitMiddleware:
+    """Reject request bodies over the limit of their route while they are received, before anything is spooled.
+
+    `limits` are (method, path pattern, max bytes). A declared Content-Length over the limit is rejected right away,
+    otherwise the body is counted as it streams in and the request is answered with 413 once it crosses the limit.
+    """
+
+    def __init__(self, app: ASGIApp, limits: List[Tuple[str, str, int]]) -> None:
+        self.app = app
+        self.limits = [(method, re.compile(pattern), max_size) for method, pattern, max_size in limits]
+
+    def _limit(self, scope: Scope) -> int | None:
+        for method, pattern, max_size in self.limits:
+            if scope["method"] == method and pattern.match(scope["path"]):
+                return max_size
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        max_size = self._limit(scope) if scope["type"] == "http" else None
+        if max_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            {"code": 1, "status": "error", "message": f"Request body exceeds {max_size} bytes", "data": None},
+            status_code=413,
+        )
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_size:
+            await response(scope, receive, send)
+            return
+
+        size = 0
+        exceeded = False
+        started = False
+
+        async def _receive() -> Message:
+            nonlocal size, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                size += len(message.get("body", b""))
+                if size > max_size:
+                    # the app sees a disconnected client and stops reading, its response is replaced below
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def _send(message: Message) -> None:
+            nonlocal started
+            if exceeded:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, _receive, _send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded:
+            logger.warning(f"Reject {scope['method']} {scope['path']}, body exceeds {max_size} bytes")
+            if not started:
+                await response(scope, receive, send)
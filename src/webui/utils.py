@@ -219,7 +219,9 @@ def upload_urls(api_key: str, vector_db_id: int, urls: str, chunk_size: int, chu
     return data
 
 
-def chat(api_key: str, session_id: int, message: str, llm_name: str, temperature: float, vector_db_id: int | None = None) -> Iterator[str]:
+def chat(
+    api_key: str, session_id: int, message: str, llm_name: str, temperature: float, vector_db_id: int | List[int] | None = None
+) -> Iterator[str]:
     url = urljoin(API_URL, f"v1/session/{session_id}/chat")
     headers = {"Authorization": f"Bearer {api_key}"}
     data = {
@@ -0,0 +1,5 @@
+from .ingestion import run_workers
+from .purge import enqueue_purge
+from .queue import enqueue_ingestion_job, enqueue_snapshot_job, get_ingestion_job, lock_key, snapshot_path
+
+__all__ = ["run_workers", "enqueue_ingestion_job", "get_ingestion_job", "enqueue_purge", "enqueue_snapshot_job", "snapshot_path", "lock_key"]
@@ -0,0 +1,318 @@
+import asyncio
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Iterator
+
+from langchain_core.documents import Document
+
+from langchain_openai.embeddings import OpenAIEmbeddings
+from sqlalchemy import or_
+
+from src.config import EMBEDDING_CACHE_ENABLED, INGESTION_BATCH_SIZE, INGESTION_JOB_LEASE
+from src.langchain_aris.bm25 import BM25Index, get_complete_bm25_index, save_bm25_index
+from src.langchain_aris.embedding import init_embedding
+from src.langchain_aris.embedding_cache import CachedEmbeddings
+from src.langchain_aris.ingestion import aingest_documents
+from src.langchain_aris.manifest import apply_manifest_patch, rebase_manifest_patch
+from src.langchain_aris.retriever import bump_vector_db_version
+from src.langchain_aris.snapshot import import_snapshot, iter_snapshot_shards, read_snapshot_manifest
+from src.langchain_aris.vector_store import Neo4jBulkWriter, delete_chunks, init_vector_store
+from src.logger import logger
+from src.middleware.mysql import session
+from src.middleware.mysql.models import EmbeddingSchema, VectorDbSchema
+from src.middleware.redis import r
+
+from .purge import purge_loop
+from .queue import (
+    PROCESSING_KEY,
+    cancel_job,
+    claim_job,
+    complete_job,
+    fail_job,
+    heartbeat,
+    job_key,
+    load_chunks,
+    load_manifest_patch,
+    lock_key,
+    promote_delayed_jobs,
+    refresh_lock,
+    release_job,
+    requeue_stale_jobs,
+    snapshot_path,
+    touch_job,
+)
+
+BUSY_RETRY_DELAY = 5
+
+
+class WorkerStopped(Exception):
+    pass
+
+
+def _init_job_embedding(vector_db_id: int, embedding_id: int) -> OpenAIEmbeddings | None:
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = (
+            conn.query(
+                EmbeddingSchema.embedding_type,
+                EmbeddingSchema.embedding_name,
+                EmbeddingSchema.base_url,
+                EmbeddingSchema.api_key,
+                EmbeddingSchema.chunk_size,
+            )
+            .join(VectorDbSchema, VectorDbSchema.embedding_id == EmbeddingSchema.embedding_id)
+            .filter(VectorDbSchema.vector_db_id == vector_db_id)
+            .filter(EmbeddingSchema.embedding_id == embedding_id)
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+            .filter(or_(EmbeddingSchema.delete_at.is_(None), datetime.now() < EmbeddingSchema.delete_at))
+        )
+        result = query.first()
+
+    if not result:
+        return None
+
+    embedding_type, embedding_name, base_url, api_key, chunk_size = result
+    return init_embedding(embedding_type, embedding_name, api_key, base_url, chunk_size)
+
+
+def _get_db_size(vector_db_id: int) -> int:
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = conn.query(VectorDbSchema.db_size).filter(VectorDbSchema.vector_db_id == vector_db_id)
+        result = query.first()
+    return result[0] if result else 0
+
+
+def _update_db_size(vector_db_id: int, delta: int) -> None:
+    if not delta:
+        return
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = conn.query(VectorDbSchema).filter(VectorDbSchema.vector_db_id == vector_db_id)
+        query.update({VectorDbSchema.db_size: VectorDbSchema.db_size + delta})
+        conn.commit()
+
+
+class _LeaseKeeper:
+    """Heartbeat a job and extend the lock of its knowledge base from a thread for as long as the job runs.
+
+    Steps before the first write, e.g. backfilling the keyword index or deleting stale chunks, may take longer than
+    the lease. `lost` is set if another writer took the lock meanwhile.
+    """
+
+    def __init__(self, job_id: str, vector_db_id: int, interval: float = INGESTION_JOB_LEASE / 3) -> None:
+        self.job_id = job_id
+        self.vector_db_id = vector_db_id
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                touch_job(self.job_id)
+                if not refresh_lock(self.vector_db_id, self.job_id):
+                    logger.error(f"Ingestion job: {self.job_id} lost the lock of vector_db_id: {self.vector_db_id}")
+                    self.lost.set()
+                    return
+            except Exception as e:
+                logger.warning(f"Keep lease of ingestion job: {self.job_id} failed: {e}")
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+def _replay_keyword_index(job_id: str, kind: str | None, keyword_index: BM25Index, start: int, stop: int) -> None:
+    """Add the chunks `[start, stop)` of a job, which are in the store already, to the keyword index."""
+    if start >= stop:
+        return
+
+    if kind == "snapshot":
+        for documents, _ in iter_snapshot_shards(snapshot_path(job_id), start):
+            documents = documents[: stop - start]
+            keyword_index.add_documents(documents)
+            start += len(documents)
+            if start >= stop:
+                break
+    else:
+        while start < stop:
+            documents = load_chunks(job_id, start, min(INGESTION_BATCH_SIZE, stop - start))
+            if not documents:
+                raise ValueError(f"Chunks of ingestion job are missing at {start}/{stop}")
+            keyword_index.add_documents(documents)
+            start += len(documents)
+    keyword_index.job_offsets[job_id] = stop
+    logger.info(f"Replay chunks of ingestion job: {job_id} into the keyword index up to {stop}")
+
+
+def process_job(job_id: str, stop_event: threading.Event) -> None:
+    job = r.hgetall(job_key(job_id))
+    if not job:
+        logger.warning(f"Drop unknown ingestion job: {job_id}")
+        r.lrem(PROCESSING_KEY, 0, job_id)
+        return
+
+    vector_db_id, embedding_id = int(job["vector_db_id"]), int(job["embedding_id"])
+    total, done = int(job["total"]), int(job["done"])
+
+    # one writer per knowledge base, the local keyword index takes a single writer
+    if not r.set(lock_key(vector_db_id), job_id, nx=True, ex=INGESTION_JOB_LEASE):
+        release_job(job_id, delay=BUSY_RETRY_DELAY)
+        return
+
+    logger.info(f"Start ingestion job: {job_id}, vector_db_id: {vector_db_id}, {done}/{total} docs")
+    r.hset(job_key(job_id), mapping={"started_at": time.time(), "session_done": 0})
+    keyword_index = None
+    resume_at, deleted = done, 0
+    lease_keeper = _LeaseKeeper(job_id, vector_db_id)
+    lease_keeper.start()
+
+    def _check_lease() -> None:
+        if lease_keeper.lost.is_set():
+            raise RuntimeError(f"Lost the lock of vector_db_id: {vector_db_id} to another writer")
+
+    try:
+        embedding = _init_job_embedding(vector_db_id, embedding_id)
+        if embedding is None:
+            cancel_job(job_id, f"Vector DB id `{vector_db_id}` or its embedding does not exist")
+            return
+        if EMBEDDING_CACHE_ENABLED:
+            embedding = CachedEmbeddings(embedding, embedding_id)
+
+        vector_db = init_vector_store(vector_db_id, embedding)
+        keyword_index = get_complete_bm25_index(vector_db_id, vector_db)
+        # `done` counts chunks in the store, the saved keyword index may lag behind it if the last attempt died
+        _replay_keyword_index(job_id, job.get("kind"), keyword_index, keyword_index.job_offsets.get(job_id, 0), resume_at)
+
+        def _on_written(written: int) -> None:
+            nonlocal done
+            done = resume_at + written
+            keyword_index.job_offsets[job_id] = done
+            heartbeat(job_id, done, written)
+            _check_lease()
+
+        if job.get("kind") == "snapshot":
+            if not resume_at and _get_db_size(vector_db_id):
+                cancel_job(job_id, f"Vector DB id `{vector_db_id}` is not empty, import the snapshot into a new vector DB")
+                return
+
+            # snapshot chunks come with their vectors, they are merged by id so the import resumes where it stopped
+            def _on_imported(written: int) -> None:
+                _on_written(written)
+                if stop_event.is_set():
+                    raise WorkerStopped()
+
+            patch = read_snapshot_manifest(snapshot_path(job_id))
+            import_snapshot(vector_db, keyword_index, snapshot_path(job_id), start=resume_at, on_written=_on_imported)
+        else:
+            # chunks replaced by this upload are resolved against the manifest under the lock, so concurrent uploads of a
+            # source do not leave orphans, deleting is idempotent so it is repeated on every attempt
+            patch = load_manifest_patch(job_id)
+            if patch:
+                patch = rebase_manifest_patch(vector_db_id, patch)
+            if patch and patch["stale_chunk_ids"]:
+                _check_lease()
+                deleted = delete_chunks(vector_db, patch["stale_chunk_ids"])
+                keyword_index.delete_documents(set(patch["stale_chunk_ids"]))
+                r.hincrby(job_key(job_id), "deleted", deleted)
+
+            def _iter_chunks() -> Iterator[Document]:
+                offset = resume_at
+                while offset < total:
+                    if stop_event.is_set():
+                        raise WorkerStopped()
+                    docs = load_chunks(job_id, offset, INGESTION_BATCH_SIZE)
+                    if not docs:
+                        raise ValueError(f"Chunks of ingestion job are missing at {offset}/{total}")
+                    offset += len(docs)
+                    yield from docs
+
+            bulk_writer = Neo4jBulkWriter(vector_db)
+            asyncio.run(aingest_documents(vector_db, keyword_index, _iter_chunks(), on_written=_on_written, bulk_writer=bulk_writer))
+
+    except WorkerStopped:
+        logger.info(f"Release ingestion job: {job_id} at {done}/{total} docs on shutdown")
+        release_job(job_id)
+    except Exception as e:
+        fail_job(job_id, str(e))
+    else:
+        if patch:
+            apply_manifest_patch(vector_db_id, patch)
+        complete_job(job_id)
+        keyword_index.job_offsets.pop(job_id, None)
+        logger.info(f"Finish ingestion job: {job_id}, vector_db_id: {vector_db_id}, {total} docs")
+    finally:
+        lease_keeper.stop()
+        if keyword_index is not None:
+            save_bm25_index(vector_db_id)
+            _update_db_size(vector_db_id, done - resume_at - deleted)
+            bump_vector_db_version(vector_db_id)
+        if r.get(lock_key(vector_db_id)) == job_id:
+            r.delete(lock_key(vector_db_id))
+        # the bundle of a snapshot job is kept until it is not retried anymore
+        if job.get("kind") == "snapshot" and r.hget(job_key(job_id), "status") in ("succeeded", "cancelled", "failed"):
+            snapshot_path(job_id).unlink(missing_ok=True)
+
+
+def _worker_loop(stop_event: threading.Event) -> None:
+    while not stop_event.is_set():
+        try:
+            job_id = claim_job()
+        except Exception as e:
+            logger.error(f"Claim ingestion job failed: {e}")
+            time.sleep(1)
+            continue
+        if job_id:
+            process_job(job_id, stop_event)
+
+
+def run_workers(concurrency: int) -> None:
+    """Run `concurrency` ingestion threads until SIGINT or SIGTERM."""
+    stop_event = threading.Event()
+
+    def _stop(signum, frame) -> None:
+        logger.info(f"Receive signal {signum}, stop ingestion workers")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    threads = [threading.Thread(target=_worker_loop, args=(stop_event,), name=f"ingestion-worker-{i}") for i in range(concurrency)]
+    threads.append(threading.Thread(target=purge_loop, args=(stop_event,), name="purge-worker"))
+    for thread in threads:
+        thread.start()
+    logger.info(f"Start {concurrency} ingestion workers and a purge worker")
+
+    while not stop_event.is_set():
+        try:
+            promote_delayed_jobs()
+            requeue_stale_jobs()
+        except Exception as e:
+            logger.error(f"Schedule ingestion jobs failed: {e}")
+        stop_event.wait(1)
+
+    for thread in threads:
+        thread.join()
+    logger.info("Stop ingestion workers")
@@ -0,0 +1,124 @@
+import threading
+import time
+from datetime import datetime
+from typing import List, Set
+
+from sqlalchemy import or_
+
+from src.config import INGESTION_JOB_LEASE, PURGE_BATCH_SIZE, PURGE_GC_INTERVAL
+from src.langchain_aris.bm25 import drop_bm25_index, list_bm25_vector_db_ids
+from src.langchain_aris.manifest import drop_manifest
+from src.langchain_aris.retriever import bump_vector_db_version, drop_search_config
+from src.langchain_aris.vector_store import iter_purge_knowledge_base, list_stored_vector_db_ids
+from src.logger import logger
+from src.middleware.mysql import session
+from src.middleware.mysql.models import VectorDbSchema
+from src.middleware.redis import r
+
+from .queue import lock_key
+
+PURGE_QUEUE_KEY = "purge:queue"
+GC_LOCK_KEY = "purge:gc:lock"
+
+BUSY_RETRY_DELAY = 30
+FINISHED_PURGE_TTL = 3600 * 24 * 7
+
+
+def purge_key(vector_db_id: int) -> str:
+    return f"purge:vector_db_id:{vector_db_id}"
+
+
+def enqueue_purge(vector_db_id: int, delay: float = 0.0) -> None:
+    """Schedule the physical removal of a deleted knowledge base, scheduling it twice is a no-op."""
+    r.hset(purge_key(vector_db_id), mapping={"status": "queued", "queued_at": time.time()})
+    r.zadd(PURGE_QUEUE_KEY, {str(vector_db_id): time.time() + delay}, nx=True)
+
+
+def _live_vector_db_ids(vector_db_ids: List[int]) -> Set[int]:
+    with session() as conn:
+        if not conn.is_active:
+            conn.rollback()
+            conn.close()
+        else:
+            conn.commit()
+
+        query = (
+            conn.query(VectorDbSchema.vector_db_id)
+            .filter(VectorDbSchema.vector_db_id.in_(vector_db_ids))
+            .filter(or_(VectorDbSchema.delete_at.is_(None), datetime.now() < VectorDbSchema.delete_at))
+        )
+        return {vector_db_id for vector_db_id, in query.all()}
+
+
+def purge_vector_db(vector_db_id: int, stop_event: threading.Event) -> bool:
+    """Delete the chunks, indexes and local state of a knowledge base, return False if it has to be retried later."""
+    if _live_vector_db_ids([vector_db_id]):
+        logger.warning(f"Skip purge of live vector_db_id: {vector_db_id}")
+        r.hset(purge_key(vector_db_id), mapping={"status": "skipped", "finished_at": time.time()})
+        return True
+
+    # the ingestion lock keeps a purge and a running job of the same knowledge base apart
+    lock_value = f"purge:{vector_db_id}"
+    if not r.set(lock_key(vector_db_id), lock_value, nx=True, ex=INGESTION_JOB_LEASE):
+        return False
+
+    logger.info(f"Start purge of vector_db_id: {vector_db_id}")
+    r.hset(purge_key(vector_db_id), mapping={"status": "purging", "started_at": time.time(), "error": ""})
+    try:
+        deleted = 0
+        for n in iter_purge_knowledge_base(vector_db_id, PURGE_BATCH_SIZE):
+            deleted += n
+            r.hset(purge_key(vector_db_id), mapping={"deleted": deleted, "heartbeat_at": time.time()})
+            r.expire(lock_key(vector_db_id), INGESTION_JOB_LEASE)
+            if stop_event.is_set():
+                r.hset(purge_key(vector_db_id), "status", "queued")
+                return False
+
+        drop_bm25_index(vector_db_id)
+        drop_manifest(vector_db_id)
+        drop_search_config(vector_db_id)
+        bump_vector_db_version(vector_db_id)
+    except Exception as e:
+        logger.error(f"Purge of vector_db_id: {vector_db_id} failed: {e}")
+        r.hset(purge_key(vector_db_id), mapping={"status": "retrying", "error": str(e)})
+        return False
+    finally:
+        if r.get(lock_key(vector_db_id)) == lock_value:
+            r.delete(lock_key(vector_db_id))
+
+    r.hset(purge_key(vector_db_id), mapping={"status": "purged", "deleted": deleted, "finished_at": time.time()})
+    r.expire(purge_key(vector_db_id), FINISHED_PURGE_TTL)
+    logger.info(f"Finish purge of vector_db_id: {vector_db_id}, {deleted} chunks")
+    return True
+
+
+def collect_orphans() -> List[int]:
+    """Schedule a purge for every knowledge base with stored chunks or a keyword index but no live row."""
+    stored = list_stored_vector_db_ids() | set(list_bm25_vector_db_ids())
+    if not stored:
+        return []
+
+    orphans = sorted(stored - _live_vector_db_ids(sorted(stored)))
+    for vector_db_id in orphans:
+        enqueue_purge(vector_db_id)
+    logger.info(f"Collect {len(orphans)} orphaned knowledge bases out of {len(stored)} stored")
+    return orphans
+
+
+def purge_loop(stop_event: threading.Event) -> None:
+    """Purge queued knowledge bases one at a time, and collect orphans every `PURGE_GC_INTERVAL` seconds."""
+    while not stop_event.is_set():
+        try:
+            # the lock both elects one collector across workers and spaces the runs
+            if r.set(GC_LOCK_KEY, 1, nx=True, ex=PURGE_GC_INTERVAL):
+                collect_orphans()
+
+            due = r.zrangebyscore(PURGE_QUEUE_KEY, 0, time.time(), start=0, num=1)
+            # removing the entry claims it, a purge that dies halfway is found again by the collector
+            if due and r.zrem(PURGE_QUEUE_KEY, due[0]):
+                if not purge_vector_db(int(due[0]), stop_event):
+                    r.zadd(PURGE_QUEUE_KEY, {due[0]: time.time() + BUSY_RETRY_DELAY})
+                continue
+        except Exception as e:
+            logger.error(f"Purge loop failed: {e}")
+        stop_event.wait(1)
@@ -0,0 +1,237 @@
+import time
+from json import dumps, loads
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+from uuid import uuid4
+
+from langchain_core.documents import Document
+
+from src.config import INGESTION_JOB_LEASE, INGESTION_MAX_RETRIES, INGESTION_RETRY_BACKOFF
+from src.langchain_aris.manifest import ManifestDiff
+from src.langchain_aris.snapshot import SNAPSHOT_ROOT
+from src.logger import logger
+from src.middleware.redis import r
+
+QUEUE_KEY = "ingestion:queue"
+PROCESSING_KEY = "ingestion:processing"
+DELAYED_KEY = "ingestion:delayed"
+
+PUSH_BATCH = 500
+FINISHED_JOB_TTL = 3600 * 24 * 7
+
+
+def job_key(job_id: str) -> str:
+    return f"ingestion:job:{job_id}"
+
+
+def chunks_key(job_id: str) -> str:
+    return f"ingestion:job:{job_id}:chunks"
+
+
+def snapshot_path(job_id: str) -> Path:
+    return SNAPSHOT_ROOT / f"{job_id}.zip"
+
+
+def manifest_patch_key(job_id: str) -> str:
+    return f"ingestion:job:{job_id}:manifest"
+
+
+def lock_key(vector_db_id: int) -> str:
+    return f"ingestion:lock:vector_db_id:{vector_db_id}"
+
+
+def enqueue_ingestion_job(
+    vector_db_id: int,
+    embedding_id: int,
+    documents: Iterable[Document],
+    diff: ManifestDiff | None = None,
+) -> Tuple[str | None, int]:
+    """Persist the chunks of an upload in redis while they are produced and queue them for the ingestion workers.
+
+    With a manifest `diff` the job also deletes the chunks of changed and removed sources and updates the manifest
+    once it succeeds. Returns the job id and the number of chunks, no job is queued if nothing changed.
+    """
+    job_id = uuid4().hex
+
+    total = 0
+    payload: List[str] = []
+    try:
+        for doc in documents:
+            payload.append(dumps({"page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False, default=str))
+            if len(payload) >= PUSH_BATCH:
+                r.rpush(chunks_key(job_id), *payload)
+                total += len(payload)
+                payload = []
+        if payload:
+            r.rpush(chunks_key(job_id), *payload)
+            total += len(payload)
+    except BaseException:
+        r.delete(chunks_key(job_id))
+        raise
+
+    # the manifest is only written by the worker holding the lock, even a patch without chunks goes through a job
+    patch = diff.patch() if diff is not None else None
+    if not total and not (patch and (patch["entries"] or patch["removed"] or patch["origins"])):
+        return None, 0
+
+    if patch:
+        r.set(manifest_patch_key(job_id), dumps(patch, ensure_ascii=False))
+
+    r.hset(
+        job_key(job_id),
+        mapping={
+            "job_id": job_id,
+            "vector_db_id": vector_db_id,
+            "embedding_id": embedding_id,
+            "status": "queued",
+            "total": total,
+            "done": 0,
+            "deleted": 0,
+            "attempts": 0,
+            "error": "",
+            "created_at": time.time(),
+        },
+    )
+    r.lpush(QUEUE_KEY, job_id)
+
+    logger.debug(f"Enqueue ingestion job: {job_id} with {total} docs for vector_db_id: {vector_db_id}")
+    return job_id, total
+
+
+def enqueue_snapshot_job(vector_db_id: int, embedding_id: int, job_id: str, total: int) -> None:
+    """Queue the import of a snapshot bundle saved at `snapshot_path(job_id)`, it is tracked like an ingestion job."""
+    r.hset(
+        job_key(job_id),
+        mapping={
+            "job_id": job_id,
+            "kind": "snapshot",
+            "vector_db_id": vector_db_id,
+            "embedding_id": embedding_id,
+            "status": "queued",
+            "total": total,
+            "done": 0,
+            "deleted": 0,
+            "attempts": 0,
+            "error": "",
+            "created_at": time.time(),
+        },
+    )
+    r.lpush(QUEUE_KEY, job_id)
+
+    logger.debug(f"Enqueue snapshot job: {job_id} with {total} docs for vector_db_id: {vector_db_id}")
+
+
+def get_ingestion_job(job_id: str) -> Dict[str, Any] | None:
+    job = r.hgetall(job_key(job_id))
+    if not job:
+        return None
+
+    total, done = int(job["total"]), int(job["done"])
+    started_at, finished_at = float(job.get("started_at") or 0), float(job.get("finished_at") or 0)
+    elapsed = (finished_at or time.time()) - started_at if started_at else 0.0
+
+    return {
+        "job_id": job_id,
+        "vector_db_id": int(job["vector_db_id"]),
+        "kind": job.get("kind", "ingestion"),
+        "status": job["status"],
+        "total": total,
+        "done": done,
+        "progress": round(done / total, 4) if total else 1.0,
+        "deleted": int(job.get("deleted") or 0),
+        "attempts": int(job["attempts"]),
+        "error": job.get("error") or None,
+        "throughput": round(int(job.get("session_done") or 0) / elapsed, 2) if elapsed else 0.0,
+        "create_at": job["created_at"],
+        "start_at": job.get("started_at"),
+        "finish_at": job.get("finished_at"),
+    }
+
+
+def claim_job(timeout: int = 5) -> str | None:
+    job_id = r.blmove(QUEUE_KEY, PROCESSING_KEY, timeout, "RIGHT", "LEFT")
+    if job_id:
+        r.hset(job_key(job_id), mapping={"status": "running", "heartbeat_at": time.time()})
+    return job_id
+
+
+def load_manifest_patch(job_id: str) -> Dict[str, Any] | None:
+    patch = r.get(manifest_patch_key(job_id))
+    return loads(patch) if patch else None
+
+
+def load_chunks(job_id: str, start: int, size: int) -> List[Document]:
+    return [Document(**loads(raw)) for raw in r.lrange(chunks_key(job_id), start, start + size - 1)]
+
+
+def heartbeat(job_id: str, done: int, session_done: int) -> None:
+    r.hset(job_key(job_id), mapping={"done": done, "session_done": session_done, "heartbeat_at": time.time()})
+
+
+def touch_job(job_id: str) -> None:
+    r.hset(job_key(job_id), "heartbeat_at", time.time())
+
+
+def refresh_lock(vector_db_id: int, owner: str, lease: int = INGESTION_JOB_LEASE) -> bool:
+    """Extend the ingestion lock of a knowledge base if `owner` still holds it."""
+    if r.get(lock_key(vector_db_id)) != owner:
+        return False
+    return bool(r.expire(lock_key(vector_db_id), lease))
+
+
+def complete_job(job_id: str) -> None:
+    r.hset(job_key(job_id), mapping={"status": "succeeded", "error": "", "finished_at": time.time()})
+    r.expire(job_key(job_id), FINISHED_JOB_TTL)
+    r.delete(chunks_key(job_id), manifest_patch_key(job_id))
+    r.lrem(PROCESSING_KEY, 0, job_id)
+
+
+def cancel_job(job_id: str, reason: str) -> None:
+    r.hset(job_key(job_id), mapping={"status": "cancelled", "error": reason, "finished_at": time.time()})
+    r.expire(job_key(job_id), FINISHED_JOB_TTL)
+    r.delete(chunks_key(job_id), manifest_patch_key(job_id))
+    r.lrem(PROCESSING_KEY, 0, job_id)
+
+
+def release_job(job_id: str, delay: float = 0.0) -> None:
+    """Put a job back without counting an attempt, e.g. on shutdown or when its knowledge base is busy."""
+    r.hset(job_key(job_id), "status", "queued")
+    if delay:
+        r.zadd(DELAYED_KEY, {job_id: time.time() + delay})
+    else:
+        r.rpush(QUEUE_KEY, job_id)
+    r.lrem(PROCESSING_KEY, 0, job_id)
+
+
+def fail_job(job_id: str, error: str) -> None:
+    """Retry with exponential backoff until the attempts are used up."""
+    attempts = r.hincrby(job_key(job_id), "attempts", 1)
+    if attempts < INGESTION_MAX_RETRIES:
+        delay = INGESTION_RETRY_BACKOFF * 2 ** (attempts - 1)
+        r.hset(job_key(job_id), mapping={"status": "retrying", "error": error})
+        r.zadd(DELAYED_KEY, {job_id: time.time() + delay})
+        logger.warning(f"Ingestion job: {job_id} failed at attempt {attempts}, retry in {delay}s, error: {error}")
+    else:
+        r.hset(job_key(job_id), mapping={"status": "failed", "error": error, "finished_at": time.time()})
+        r.expire(job_key(job_id), FINISHED_JOB_TTL)
+        r.expire(chunks_key(job_id), FINISHED_JOB_TTL)
+        r.expire(manifest_patch_key(job_id), FINISHED_JOB_TTL)
+        logger.error(f"Ingestion job: {job_id} failed after {attempts} attempts, error: {error}")
+    r.lrem(PROCESSING_KEY, 0, job_id)
+
+
+def promote_delayed_jobs() -> None:
+    for job_id in r.zrangebyscore(DELAYED_KEY, 0, time.time()):
+        if r.zrem(DELAYED_KEY, job_id):
+            r.rpush(QUEUE_KEY, job_id)
+
+
+def requeue_stale_jobs(lease: int = INGESTION_JOB_LEASE) -> None:
+    """Requeue jobs whose worker stopped sending heartbeats, e.g. after a crash or redeploy."""
+    now = time.time()
+    for job_id in r.lrange(PROCESSING_KEY, 0, -1):
+        heartbeat_at = float(r.hget(job_key(job_id), "heartbeat_at") or 0)
+        if now - heartbeat_at > lease and r.lrem(PROCESSING_KEY, 0, job_id):
+            r.hset(job_key(job_id), "status", "queued")
+            r.rpush(QUEUE_KEY, job_id)
+            logger.warning(f"Requeue stale ingestion job: {job_id}")
@@ -0,0 +1,24 @@
+from langchain.text_splitter import Language
+
+from src.langchain_aris.text_splitter import get_splitter
+
+
+def _split(language: Language, text: str, chunk_size: int = 40) -> list:
+    return [text[start:end] for start, end in get_splitter(language, chunk_size, 0).split_spans(text)]
+
+
+def test_latex_splits_at_display_math():
+    text = "".join(f"Paragraph {i} explains the next equation in a few plain words. $$ x_{i} = a + b $$ " for i in range(20))
+    chunks = _split(Language.LATEX, text)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+    assert all(chunk.startswith("$$") for chunk in chunks[1:])
+
+
+def test_markdown_headings_stay_patterns():
+    text = "".join(f"\n## Section {i}\n\nSome text of section {i} that fills the chunk with a few words.\n" for i in range(20))
+    chunks = _split(Language.MARKDOWN, text)
+
+    assert len(chunks) > 1
+    assert all(chunk.startswith("\n## ") for chunk in chunks)